@@ -63,6 +63,7 @@ OpenScanHub shared files for client, hub and worker.
 
 %package worker
 Summary: OpenScanHub worker
+Requires: csdiff
 Requires: csmock
 Requires: file
 Requires: koji
@@ -113,6 +114,8 @@ Requires(post): postgresql
 
 Requires: %{name}-common = %{version}-%{release}
 Recommends: osh-hub-conf
+# zstd-compressed siblings of task files
+Recommends: python3-zstandard
 
 Obsoletes: covscan-hub < %{version}
 
@@ -224,6 +227,7 @@ ln -s %{_sysconfdir}/osh/hub/settings_local.py %{buildroot}%{python3_sitelib}/os
 
 %files worker
 %{python3_sitelib}/osh/worker
+%exclude %{python3_sitelib}/osh/worker/tests
 %{_unitdir}/osh-worker.service
 %attr(755,root,root) %{_sbindir}/osh-worker
 %dir %{_localstatedir}/log/osh
@@ -254,12 +258,20 @@ fi
 %attr(640,root,root) %config(noreplace) %{_sysconfdir}/osh/worker.conf
 
 %files hub
+%{_sbindir}/osh-mail-sender
+%{_sbindir}/osh-refresh-analyzer-versions
 %{_sbindir}/osh-retention
 %{_sbindir}/osh-stats
+%{_sbindir}/osh-umb-publisher
 %{_sysconfdir}/osh/hub
 %{python3_sitelib}/osh/hub
+%{_unitdir}/osh-mail-sender.service
+%{_unitdir}/osh-refresh-analyzer-versions.*
 %{_unitdir}/osh-retention.*
 %{_unitdir}/osh-stats.*
+%{_unitdir}/osh-umb-publisher.service
+%exclude %{python3_sitelib}/osh/hub/scripts/osh-benchmark-rpc.py*
+%exclude %{python3_sitelib}/osh/hub/scripts/osh-simulate-scheduling.py*
 %exclude %{python3_sitelib}/osh/hub/scripts/osh-xmlrpc-client.py*
 %exclude %{python3_sitelib}/osh/hub/scripts/umb-emit.py*
 %exclude %{python3_sitelib}/osh/hub/settings_local.py*
@@ -302,13 +314,18 @@ if pg_isready -h localhost; then
     runuser -u apache -- %{python3_sitelib}/osh/hub/manage.py migrate
 fi
 
-%systemd_post osh-{retention,stats}.{service,timer}
+# osh-mail-sender and osh-umb-publisher are needed only if ENABLE_MAIL_OUTBOX
+# and ENABLE_UMB_OUTBOX respectively are set in settings_local.py
+%systemd_post osh-{mail-sender,umb-publisher}.service
+%systemd_post osh-{refresh-analyzer-versions,retention,stats}.{service,timer}
 
 %preun hub
-%systemd_preun osh-{retention,stats}.{service,timer}
+%systemd_preun osh-{mail-sender,umb-publisher}.service
+%systemd_preun osh-{refresh-analyzer-versions,retention,stats}.{service,timer}
 
 %postun hub
-%systemd_postun osh-{retention,stats}.{service,timer}
+%systemd_postun_with_restart osh-{mail-sender,umb-publisher}.service
+%systemd_postun osh-{refresh-analyzer-versions,retention,stats}.{service,timer}
 
 %files worker-manager
 %{_bindir}/osh-worker-manager
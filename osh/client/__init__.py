@@ -3,7 +3,9 @@
 
 import inspect
 
-from kobo.client import ClientCommand
+from kobo.client import ClientCommand, HubProxy
+
+from osh.client.jsonrpc import JSONRPCHubProxy
 
 
 class OshCommand(ClientCommand):
@@ -21,6 +23,11 @@ class OshCommand(ClientCommand):
 
         self.set_hub(*params)
 
+        # send calls over JSON-RPC if enabled in the configuration, results
+        # differ from XML-RPC in types (e.g. dates are ISO 8601 strings)
+        if isinstance(self.hub, HubProxy) and self.conf.get("JSONRPC", False):
+            self.hub = JSONRPCHubProxy(self.hub)
+
     def write_task_id_file(self, task_id, filename=None):
         if filename is not None:
             with open(filename, "w") as f:
@@ -22,7 +22,8 @@ from osh.client.commands.common import (add_analyzers_option,
 from osh.client.commands.shortcuts import (check_analyzers, fetch_results,
                                            handle_perm_denied, upload_file,
                                            verify_koji_build, verify_mock,
-                                           verify_scan_profile_exists)
+                                           verify_scan_profile_exists,
+                                           watch_tasks)
 from osh.client.conf import get_conf
 
 
@@ -203,8 +204,7 @@ is not even one in your user configuration file \
             print("Task info:", task_url)
 
         if not nowait:
-            from kobo.client.task_watcher import TaskWatcher
-            TaskWatcher.watch_tasks(self.hub, [task_id])
+            watch_tasks(self.hub, [task_id])
 
             # store results if user requested this
             if results_dir is not None:
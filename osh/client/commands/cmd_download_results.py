@@ -5,7 +5,7 @@ import os
 import sys
 
 import osh.client
-from osh.client.commands.shortcuts import fetch_results
+from osh.client.commands.shortcuts import fetch_results_parallel
 
 
 class Download_Results(osh.client.OshCommand):
@@ -25,6 +25,14 @@ class Download_Results(osh.client.OshCommand):
             help="path to store results",
         )
 
+        self.parser.add_option(
+            "-j",
+            "--jobs",
+            type="int",
+            default=4,
+            help="number of tasks whose results are downloaded concurrently (default: 4)",
+        )
+
     def run(self, *tasks, **kwargs):
         if not tasks:
             self.parser.error("no task ID specified")
@@ -37,17 +45,12 @@ class Download_Results(osh.client.OshCommand):
         if results_dir is not None and not os.path.isdir(os.path.expanduser(results_dir)):
             self.parser.error("provided directory does not exist")
 
+        jobs = kwargs.pop("jobs", 4)
+        if jobs < 1:
+            self.parser.error("number of jobs has to be positive")
+
         # login to the hub
         self.connect_to_hub(kwargs)
 
-        success = True
-        for task_id in tasks:
-            if not self.hub.scan.get_task_info(task_id):
-                print(f"Task {task_id} does not exist!", file=sys.stderr)
-                success = False
-                continue
-
-            success &= fetch_results(self.hub, results_dir, task_id)
-
-        if not success:
+        if not fetch_results_parallel(self.hub, results_dir, tasks, jobs):
             sys.exit(1)
@@ -7,6 +7,9 @@ from kobo.client.constants import TASK_STATES
 
 import osh.client
 
+# number of task IDs asked for at once
+PAGE_SIZE = 1000
+
 
 class Find_Tasks(osh.client.OshCommand):
     """find tasks by provided query string"""
@@ -77,6 +80,26 @@ these options: --regex, --package, --comment, --nvr"
         if invalid_states:
             self.parser.error(f"Invalid state(s) specified: {', '.join(invalid_states)}.")
 
+    def _find_tasks(self, query):
+        """ yield IDs of tasks found by the query, page by page """
+        cursor = None
+        while True:
+            page_query = dict(query, limit=PAGE_SIZE)
+            if cursor is not None:
+                page_query['cursor'] = cursor
+            page = self.hub.scan.find_tasks(page_query)
+
+            # older hubs ignore the cursor and return all the tasks at once
+            if page and cursor is not None and page[0] >= cursor:
+                return
+
+            # the hub may return fewer tasks than requested, only an empty
+            # page means that there are no more tasks
+            if not page:
+                return
+            yield from page
+            cursor = page[-1]
+
     def run(self, *args, **kwargs):
         regex = kwargs.pop("regex")
         package_name = kwargs.pop("package")
@@ -107,15 +130,14 @@ these options: --regex, --package, --comment, --nvr"
         if states:
             self._validate_states(states)
             query['states'] = [TASK_STATES[state.upper()] for state in states]
-        task_ids = self.hub.scan.find_tasks(query)
 
-        if not task_ids:
+        found = False
+        for task_id in self._find_tasks(query):
+            print(task_id)
+            found = True
+            if latest:
+                break
+
+        if not found:
             print("No tasks found for the given query.", file=sys.stderr)
             sys.exit(1)
-
-        if latest:
-            print(task_ids[0])
-            return
-
-        for task_id in task_ids:
-            print(task_id)
@@ -0,0 +1,33 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+import sys
+
+import osh.client
+from osh.client.commands.shortcuts import watch_tasks
+
+
+class Watch_Tasks(osh.client.OshCommand):
+    """track progress of particular tasks"""
+    enabled = True
+    admin = False  # admin type account required
+
+    def options(self):
+        # specify command usage
+        # normalized name contains a lower-case class name with underscores
+        # converted to dashes
+        self.parser.usage = f"%prog {self.normalized_name} task_id [task_id...]"
+
+    def run(self, *tasks, **kwargs):
+        if not tasks:
+            self.parser.error("At least one task id must be specified.")
+
+        for task_id in tasks:
+            if not task_id.isdigit():
+                self.parser.error(f"'{task_id}' is not a number")
+
+        # login to the hub
+        self.connect_to_hub(kwargs)
+
+        if watch_tasks(self.hub, tasks) is False:
+            sys.exit(1)
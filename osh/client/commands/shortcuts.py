@@ -1,15 +1,42 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import hashlib
 import os
 import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
-from urllib.error import HTTPError
-from urllib.request import urlretrieve
-from xmlrpc.client import Fault
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+from xmlrpc.client import Binary, Error, Fault
 
 import koji
+from kobo.client import HubProxy
+
+from osh.common.constants import UPLOAD_CHUNK_SIZE
+
+# number of attempts to resume an interrupted download
+DOWNLOAD_ATTEMPTS = 5
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# suffix of files with checksums of task files on the hub
+CHECKSUM_SUFFIX = '.sha256'
+
+# serializes messages of concurrent downloads
+_print_lock = threading.Lock()
+
+# files of at least this size are uploaded in parallel chunks if they are not
+# stored on the hub already
+UPLOAD_CHUNKED_MIN_SIZE = 32 * 1024 * 1024
+UPLOAD_JOBS = 4
+UPLOAD_ATTEMPTS = 3
+
+# seconds the hub waits for a change of states of watched tasks; a busy hub
+# answers right away and the client waits for the rest of the time itself
+WATCH_TIMEOUT = 5
 
 
 def check_analyzers(proxy, analyzers_list):
@@ -128,36 +155,267 @@ def _get_result_filename(task_args):
     return 'output'
 
 
-def fetch_results(hub, dest, task_id):
-    """Downloads results for the given task"""
-    task_info = hub.scan.get_task_info(task_id)
-    task_url = hub.client.task_url(task_id)
+def get_tasks_info(hub, task_ids):
+    """
+    Return {task_id: task info with 'url' of the task} for existing tasks
+    using a single call if the hub supports it.
+    """
+    try:
+        return {int(k): v for k, v in hub.scan.get_tasks_info([int(t) for t in task_ids]).items()}
+    except Fault:
+        # older hub
+        pass
+
+    result = {}
+    for task_id in task_ids:
+        task_info = hub.scan.get_task_info(task_id)
+        if task_info:
+            task_info['url'] = hub.client.task_url(task_id)
+            result[int(task_id)] = task_info
+    return result
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch_checksum(url):
+    """ return SHA-256 of the file published next to it or None """
+    try:
+        with urlopen(url) as response:
+            return response.read().decode().split()[0]
+    except HTTPError as e:
+        if e.code == HTTPStatus.NOT_FOUND:
+            return None
+        raise
+    except IndexError:
+        return None
 
+
+def download_file(url, local_path, attempts=DOWNLOAD_ATTEMPTS):
+    """
+    Download the file through local_path + '.part'.  A partial file left by an
+    interrupted download is resumed by a range request.  Return the number of
+    transferred bytes.
+    """
+    part_path = local_path + '.part'
+    transferred = 0
+    for attempt in range(attempts):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request = Request(url)
+        if offset:
+            request.add_header('Range', f'bytes={offset}-')
+
+        try:
+            with urlopen(request) as response:
+                # the server may ignore the range and send the whole file
+                mode = 'ab' if offset and response.status == HTTPStatus.PARTIAL_CONTENT else 'wb'
+                received = 0
+                with open(part_path, mode) as f:
+                    for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b''):
+                        f.write(chunk)
+                        received += len(chunk)
+                transferred += received
+
+                length = response.headers.get('Content-Length')
+                if length is not None and received < int(length):
+                    raise ConnectionError(f'connection closed after {received} of {length} bytes')
+            break
+        except HTTPError as e:
+            if attempt == attempts - 1:
+                raise
+            if e.code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                # the partial file does not match the file on the server
+                os.remove(part_path)
+            elif e.code < 500:
+                raise
+        except (OSError, URLError):
+            if attempt == attempts - 1:
+                raise
+
+        time.sleep(2 ** attempt)
+
+    os.replace(part_path, local_path)
+    return transferred
+
+
+def fetch_task_results(task_info, dest_dir):
+    """
+    Download results of the task into dest_dir and verify their checksum if
+    the hub provides it.  Return the name of the tarball and the number of
+    transferred bytes.
+    """
     # we need result_filename + '.tar.xz'
     tarball = _get_result_filename(task_info['args']) + '.tar.xz'
-
-    # get absolute path
-    dest_dir = os.path.abspath(os.path.expanduser(dest) if dest is not None else os.curdir)
     local_path = os.path.join(dest_dir, tarball)
 
     # task_url is url to task with trailing '/'
-    url = f"{task_url}log/{tarball}?format=raw"
+    url = f"{task_info['url']}log/{tarball}?format=raw"
+    checksum = fetch_checksum(f"{task_info['url']}log/{tarball}{CHECKSUM_SUFFIX}?format=raw")
+
+    if checksum is not None and os.path.exists(local_path) and _sha256_file(local_path) == checksum:
+        # downloaded already
+        return tarball, 0
+
+    transferred = download_file(url, local_path)
+    if checksum is not None and _sha256_file(local_path) != checksum:
+        os.remove(local_path)
+        raise ValueError('checksum does not match')
+
+    return tarball, transferred
+
+
+def _format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
 
-    print(f"Downloading {tarball}: ", file=sys.stderr, end="")
+def _fetch_and_report(task_id, task_info, dest):
+    """ return number of transferred bytes or None if the download failed """
+    # get absolute path
+    dest_dir = os.path.abspath(os.path.expanduser(dest) if dest is not None else os.curdir)
+
+    start = time.monotonic()
     try:
-        urlretrieve(url, local_path)
-    except HTTPError as e:
-        print(e, file=sys.stderr)
+        tarball, transferred = fetch_task_results(task_info, dest_dir)
+    except (OSError, ValueError) as e:
+        with _print_lock:
+            print(f"Downloading results of task {task_id}: {e}", file=sys.stderr)
+        return None
+
+    elapsed = max(time.monotonic() - start, 0.001)
+    with _print_lock:
+        if transferred:
+            print(f"Downloading {tarball}: OK ({_format_size(transferred)}, "
+                  f"{_format_size(transferred / elapsed)}/s)", file=sys.stderr)
+        else:
+            print(f"Downloading {tarball}: OK (already downloaded)", file=sys.stderr)
+    return transferred
+
+
+def fetch_results(hub, dest, task_id):
+    """Downloads results for the given task"""
+    task_info = get_tasks_info(hub, [task_id]).get(int(task_id))
+    if not task_info:
+        print(f"Task {task_id} does not exist!", file=sys.stderr)
         return False
+    return _fetch_and_report(task_id, task_info, dest) is not None
 
-    print("OK", file=sys.stderr)
-    return True
+
+def fetch_results_parallel(hub, dest, task_ids, jobs=4):
+    """
+    Download results of the tasks concurrently and print a summary.  Return
+    False if any of them failed.
+    """
+    tasks_info = get_tasks_info(hub, task_ids)
+    existing = []
+    for task_id in task_ids:
+        if int(task_id) in tasks_info:
+            existing.append(task_id)
+        else:
+            print(f"Task {task_id} does not exist!", file=sys.stderr)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(lambda t: _fetch_and_report(t, tasks_info[int(t)], dest),
+                                    existing))
+
+    downloaded = [r for r in results if r is not None]
+    transferred = sum(downloaded)
+    elapsed = max(time.monotonic() - start, 0.001)
+    print(f"Downloaded results of {len(downloaded)} of {len(task_ids)} tasks, "
+          f"{_format_size(transferred)} in {elapsed:.1f} s "
+          f"({_format_size(transferred / elapsed)}/s)", file=sys.stderr)
+
+    return len(downloaded) == len(task_ids)
+
+
+def _is_unsupported(fault):
+    """ was the method not found on the hub, i.e. is the hub too old? """
+    return 'is not supported' in fault.faultString
+
+
+class ChunkedFileUploader:
+    """ upload of a file into the upload store on the hub in parallel chunks """
+
+    def __init__(self, hub, jobs, chunk_size):
+        self.hub = hub
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+
+    def _thread_hub(self):
+        # XML-RPC connections cannot be shared by threads, the configuration
+        # of the hub proxy includes credentials given on the command line
+        if not hasattr(self._local, 'hub'):
+            self._local.hub = HubProxy(conf=self.hub._conf)
+        return self._local.hub
+
+    def _upload_chunk(self, path, checksum, index):
+        with open(path, 'rb') as f:
+            f.seek(index * self.chunk_size)
+            chunk = f.read(self.chunk_size)
+
+        chunk_checksum = hashlib.sha256(chunk).hexdigest()
+        return self._thread_hub().client.upload_chunk(checksum, index, chunk_checksum, Binary(chunk))
+
+    def upload(self, path, checksum):
+        """ upload the file and return ID of its upload """
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        chunk_count = max(1, -(-size // self.chunk_size))
+
+        for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+            confirmed = self.hub.client.start_upload(checksum, str(size), str(self.chunk_size))
+            missing = sorted(set(range(chunk_count)) - set(confirmed))
+
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [executor.submit(self._upload_chunk, path, checksum, index)
+                           for index in missing]
+                for future in futures:
+                    try:
+                        future.result()
+                    except (OSError, Error) as ex:
+                        print(f"Chunk upload of {name} failed: {ex}", file=sys.stderr)
+
+            try:
+                return self.hub.client.finish_upload(name, checksum)
+            except Fault as ex:
+                if attempt == UPLOAD_ATTEMPTS or _is_unsupported(ex):
+                    raise
+                print(f"Upload of {name} is not finished (attempt {attempt}): {ex.faultString}",
+                      file=sys.stderr)
+                time.sleep(attempt * 5)
 
 
 def upload_file(hub, srpm, target_dir, parser):
-    """Upload file to hub, catch PermDenied exception"""
+    """
+    Upload file to hub unless the same file was uploaded before, catch
+    PermDenied exception
+    """
+    path = os.path.expanduser(srpm)
     try:
-        upload_id, err_code, err_msg = hub.upload_file(os.path.expanduser(srpm), target_dir)
+        checksum = _sha256_file(path)
+        size = os.path.getsize(path)
+        try:
+            upload_id = hub.client.find_upload(os.path.basename(path), checksum, str(size))
+            if upload_id is None and size >= UPLOAD_CHUNKED_MIN_SIZE:
+                upload_id = ChunkedFileUploader(hub, UPLOAD_JOBS, UPLOAD_CHUNK_SIZE).upload(path, checksum)
+            if upload_id is not None:
+                return upload_id
+        except Fault as e:
+            # fall back to the plain upload on hubs without the upload store
+            if not _is_unsupported(e):
+                raise
+
+        upload_id, err_code, err_msg = hub.upload_file(path, target_dir)
         if err_code != HTTPStatus.OK:
             raise RuntimeError(f'Uploading {srpm} failed: {err_code}: {err_msg.decode()}')
 
@@ -172,3 +430,74 @@ def verify_scan_profile_exists(hub, profile_name):
     if any(p["name"] == profile_name for p in profiles):
         return None
     return f"Scan profile {profile_name} does not exist."
+
+
+def _format_task_state(info):
+    if info['worker'] is not None:
+        return f"{info['state_label']} ({info['worker']})"
+    return info['state_label']
+
+
+def _print_state_summary(tasks):
+    counts = {}
+    for info in tasks.values():
+        counts[info['state_label']] = counts.get(info['state_label'], 0) + 1
+    summary = " ".join(f"{state}: {counts[state]}" for state in sorted(counts))
+    print(f"--> {summary} [total: {len(tasks)}]")
+
+
+def watch_tasks(hub, task_ids):
+    """
+    Print changes of states of the tasks and their subtasks until all of them
+    finish.  Return True if all of them finished successfully, False if any
+    of them failed or does not exist and None if the watching was interrupted.
+
+    The hub is asked for all the tasks at once and holds the request until a
+    state changes.  Older hubs are polled for each task by kobo's TaskWatcher.
+    """
+    task_ids = sorted(int(task_id) for task_id in task_ids)
+    print("Watching tasks (this may be safely interrupted)...")
+
+    tasks = {}
+    cursor = ''
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                changes = hub.scan.watch_tasks(task_ids, cursor, WATCH_TIMEOUT)
+            except Fault as e:
+                if not _is_unsupported(e):
+                    raise
+                from kobo.client.task_watcher import TaskWatcher
+                return TaskWatcher.watch_tasks(hub, task_ids)
+
+            if not cursor:
+                for task_id in changes['missing']:
+                    print(f"No such task id: {task_id}", file=sys.stderr)
+
+            for info in changes['tasks']:
+                indent = "  " if info['id'] not in task_ids else ""
+                label = f"{indent}{info['id']} {info['method']}"
+                last = tasks.get(info['id'])
+                if last is None:
+                    print(f"{label}: {_format_task_state(info)}")
+                else:
+                    print(f"{label}: {_format_task_state(last)} -> {_format_task_state(info)}")
+                tasks[info['id']] = info
+
+            if changes['tasks']:
+                _print_state_summary(tasks)
+            cursor = changes['cursor']
+            if changes['finished']:
+                break
+
+            if not changes['tasks']:
+                time.sleep(max(0, started + WATCH_TIMEOUT - time.monotonic()))
+
+    except KeyboardInterrupt:
+        running = [task_id for task_id, info in sorted(tasks.items()) if not info['is_finished']]
+        if running:
+            print(f"Tasks still running: {running}")
+        return None
+
+    return not changes['missing'] and not any(info['is_failed'] for info in tasks.values())
@@ -58,8 +58,12 @@ _osh_cli()
             _filedir -d
             return
             ;;
+        -j|--jobs)
+            COMPREPLY=()
+            return
+            ;;
         *)
-            COMPREPLY+=( $(compgen -W '-d --dir=' -- "${cur}") )
+            COMPREPLY+=( $(compgen -W '-d --dir= -j --jobs=' -- "${cur}") )
             ;;
         esac
         ;;
@@ -1,9 +1,14 @@
+import hashlib
 import io
 import optparse
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
+from xmlrpc.client import Fault
 
 from osh.client.commands.cmd_build import Base_Build
+from osh.client.commands.shortcuts import upload_file
 
 option_patches = [
     "osh.client.commands.common.add_analyzers_option",
@@ -129,11 +134,14 @@ class TestBaseBuild(unittest.TestCase):
     def test_check_build_success(self):
         conf_name = "rhel-7-x86_64"
 
-        with patch('os.path.exists') as fake_path_exists:
+        with patch('os.path.exists') as fake_path_exists, \
+             patch('os.path.getsize', return_value=1024), \
+             patch('osh.client.commands.shortcuts._sha256_file', return_value='0' * 64):
             fake_path_exists.return_value = True
             # srpm without the '.src.rpm' suffix
             srpm = "/path/to/foo.src.srpm"
             self.command.hub.mock_config.get.return_value = {"enabled": True}
+            self.command.hub.client.find_upload.return_value = None
             self.command.hub.upload_file.return_value = (1, 200, "")
             fake_path_exists.return_value = True
             kwargs = {
@@ -207,7 +215,10 @@ class TestBaseBuild(unittest.TestCase):
         }
 
         self.command.hub.scan.list_profiles.return_value = [{"name": "default"}]
-        options = self.command.prepare_task_options(args=None, kwargs=kwargs)
+        self.command.hub.client.find_upload.return_value = None
+        with patch('os.path.getsize', return_value=1024), \
+             patch('osh.client.commands.shortcuts._sha256_file', return_value='0' * 64):
+            options = self.command.prepare_task_options(args=None, kwargs=kwargs)
         expected_retval = kwargs
 
         # keys below are not included in the return value
@@ -268,3 +279,46 @@ class TestBaseBuild(unittest.TestCase):
     def test_submit_task(self):
         with self.assertRaises(NotImplementedError):
             self.command.submit_task(options={})
+
+
+class TestUploadFile(unittest.TestCase):
+    def setUp(self):
+        self.hub = MagicMock()
+        self.parser = MagicMock()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'foo-1.0-1.src.rpm')
+        self.content = b'0123456789' * 10
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+
+    def test_reuse_stored_file(self):
+        self.hub.client.find_upload.return_value = 7
+        self.assertEqual(upload_file(self.hub, self.path, 'target', self.parser), 7)
+        self.hub.client.find_upload.assert_called_once_with('foo-1.0-1.src.rpm', self.checksum, '100')
+        self.hub.upload_file.assert_not_called()
+
+    def test_upload_in_chunks(self):
+        self.hub.client.find_upload.return_value = None
+        self.hub.client.start_upload.return_value = [1]
+        self.hub.client.finish_upload.return_value = 8
+        with patch('osh.client.commands.shortcuts.UPLOAD_CHUNKED_MIN_SIZE', 50), \
+             patch('osh.client.commands.shortcuts.UPLOAD_CHUNK_SIZE', 30), \
+             patch('osh.client.commands.shortcuts.ChunkedFileUploader._thread_hub', return_value=self.hub):
+            self.assertEqual(upload_file(self.hub, self.path, 'target', self.parser), 8)
+
+        self.hub.client.start_upload.assert_called_once_with(self.checksum, '100', '30')
+        # the chunk confirmed by the hub is not uploaded again
+        calls = sorted(c.args[1] for c in self.hub.client.upload_chunk.call_args_list)
+        self.assertEqual(calls, [0, 2, 3])
+        last = [c.args for c in self.hub.client.upload_chunk.call_args_list if c.args[1] == 3][0]
+        self.assertEqual(last[3].data, self.content[90:])
+        self.hub.client.finish_upload.assert_called_once_with('foo-1.0-1.src.rpm', self.checksum)
+        self.hub.upload_file.assert_not_called()
+
+    def test_hub_without_upload_store(self):
+        self.hub.client.find_upload.side_effect = Fault(1, 'method "client.find_upload" is not supported')
+        self.hub.upload_file.return_value = (9, 200, b'')
+        self.assertEqual(upload_file(self.hub, self.path, 'target', self.parser), 9)
+        self.hub.upload_file.assert_called_once_with(self.path, 'target')
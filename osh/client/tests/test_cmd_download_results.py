@@ -1,8 +1,10 @@
 import io
 import unittest
 from unittest.mock import MagicMock, patch
+from xmlrpc.client import Fault
 
 from osh.client.commands.cmd_download_results import Download_Results
+from osh.client.commands.shortcuts import get_tasks_info
 from osh.client.tests import OSHCLITestBase
 
 
@@ -51,3 +53,27 @@ class TestDownloadResults(OSHCLITestBase, unittest.TestCase):
             for task_id in tasks:
                 error_message = f"Task {task_id} does not exist!"
                 self.assertIn(error_message, output)
+
+    @patch("osh.client.commands.cmd_download_results.fetch_results_parallel")
+    def test_run_parallel(self, fake_fetch):
+        self.command.connect_to_hub = MagicMock()
+        fake_fetch.return_value = True
+
+        self.command.run('1', '2', jobs=8)
+        fake_fetch.assert_called_once_with(self.command.hub, None, ('1', '2'), 8)
+
+    def test_run_invalid_jobs(self):
+        with patch('sys.stderr', new=io.StringIO()) as fake_err:
+            with self.assertRaises(SystemExit) as cm:
+                self.command.run('1', jobs=0)
+            self.assertEqual(cm.exception.code, 2)
+            self.assertIn("number of jobs has to be positive", fake_err.getvalue())
+
+    def test_tasks_info_of_older_hub(self):
+        hub = self.command.hub
+        hub.scan.get_tasks_info.side_effect = Fault(1, "method not supported")
+        hub.scan.get_task_info.side_effect = lambda task_id: {} if task_id == '2' else {'id': int(task_id)}
+        hub.client.task_url.side_effect = lambda task_id: f"https://hub/task/{task_id}/"
+
+        self.assertEqual(get_tasks_info(hub, ['1', '2']),
+                         {1: {'id': 1, 'url': "https://hub/task/1/"}})
@@ -52,6 +52,25 @@ class TestFindTasksCommand(OSHCLITestBase, unittest.TestCase):
                 retval = list(filter(None, fake_out.getvalue().split("\n")))
                 self.assertEqual(expected, retval)
 
+    @patch('osh.client.commands.cmd_find_tasks.PAGE_SIZE', 3)
+    def test_query_pages(self):
+        # the hub limits the number of tasks to 2 no matter the page size
+        self.command.hub.scan.find_tasks.side_effect = [[5, 4], [3, 2], [1], []]
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            self.command.run("query_string", **self.get_updated_kwargs(regex=True))
+            self.assertEqual(["5", "4", "3", "2", "1"], fake_out.getvalue().split())
+
+        cursors = [c.args[0].get('cursor') for c in self.command.hub.scan.find_tasks.call_args_list]
+        self.assertEqual([None, 4, 2, 1], cursors)
+
+    @patch('osh.client.commands.cmd_find_tasks.PAGE_SIZE', 2)
+    def test_query_hub_without_pages(self):
+        # older hubs return all the tasks regardless of the cursor
+        self.command.hub.scan.find_tasks.return_value = [2, 1]
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            self.command.run("query_string", **self.get_updated_kwargs(regex=True))
+            self.assertEqual(["2", "1"], fake_out.getvalue().split())
+
     def test_query_invalid_states_or_no_tasks_found(self):
         with patch.object(self.command.parser, 'error') as mock_error, \
              patch('sys.stderr', new=io.StringIO()) as fake_err:
@@ -0,0 +1,90 @@
+import io
+import unittest
+from unittest.mock import MagicMock, patch
+from xmlrpc.client import Fault
+
+from osh.client.commands.cmd_watch_tasks import Watch_Tasks
+from osh.client.tests import OSHCLITestBase
+
+
+def task_state(task_id, state_label, parent_id=None, worker=None):
+    return {
+        'id': task_id,
+        'parent_id': parent_id,
+        'method': 'MockBuild',
+        'state_label': state_label,
+        'is_finished': state_label in ('CLOSED', 'FAILED'),
+        'is_failed': state_label == 'FAILED',
+        'worker': worker,
+    }
+
+
+class TestWatchTasks(OSHCLITestBase, unittest.TestCase):
+    def setUp(self):
+        self.setup_cmd(Watch_Tasks)
+        self.command.connect_to_hub = MagicMock()
+
+    def test_options(self):
+        self.command.options()
+        assert self.command.parser.usage == f"%prog {self.command.normalized_name} task_id [task_id...]"
+
+    def test_run_with_invalid_task_id(self):
+        with patch('sys.stderr', new=io.StringIO()) as fake_err:
+            with self.assertRaises(SystemExit) as cm:
+                self.command.run('1', 'n')
+            self.assertEqual(cm.exception.code, 2)
+            self.assertIn("'n' is not a number", fake_err.getvalue())
+
+    def test_watch_changes(self):
+        self.command.hub.scan.watch_tasks.side_effect = [
+            {'tasks': [task_state(1, 'OPEN', worker='worker1'), task_state(2, 'FREE')],
+             'cursor': '1:1,2:0', 'missing': [], 'finished': False},
+            {'tasks': [task_state(1, 'CLOSED', worker='worker1'), task_state(2, 'CLOSED')],
+             'cursor': '1:2,2:2', 'missing': [], 'finished': True},
+        ]
+
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            self.command.run('2', '1')
+
+        output = fake_out.getvalue()
+        self.assertIn("1 MockBuild: OPEN (worker1)\n", output)
+        self.assertIn("1 MockBuild: OPEN (worker1) -> CLOSED (worker1)\n", output)
+        self.assertIn("--> CLOSED: 2 [total: 2]", output)
+
+        # all the tasks are watched by a single call with the last cursor
+        calls = self.command.hub.scan.watch_tasks.call_args_list
+        self.assertEqual([c.args[:2] for c in calls], [([1, 2], ''), ([1, 2], '1:1,2:0')])
+
+    @patch('osh.client.commands.shortcuts.time.sleep')
+    def test_busy_hub(self, fake_sleep):
+        # a busy hub answers right away and the client waits instead
+        self.command.hub.scan.watch_tasks.side_effect = [
+            {'tasks': [task_state(1, 'OPEN')], 'cursor': '1:1', 'missing': [], 'finished': False},
+            {'tasks': [], 'cursor': '1:1', 'missing': [], 'finished': False},
+            {'tasks': [task_state(1, 'CLOSED')], 'cursor': '1:2', 'missing': [], 'finished': True},
+        ]
+
+        with patch('sys.stdout', new=io.StringIO()):
+            self.command.run('1')
+        fake_sleep.assert_called_once()
+        self.assertGreater(fake_sleep.call_args.args[0], 0)
+
+    def test_failed_task(self):
+        self.command.hub.scan.watch_tasks.return_value = {
+            'tasks': [task_state(1, 'CLOSED'), task_state(3, 'FAILED', parent_id=1)],
+            'cursor': '1:2,3:5', 'missing': [], 'finished': True,
+        }
+
+        with patch('sys.stdout', new=io.StringIO()) as fake_out:
+            with self.assertRaises(SystemExit) as cm:
+                self.command.run('1')
+            self.assertEqual(cm.exception.code, 1)
+            # subtasks are indented
+            self.assertIn("  3 MockBuild: FAILED\n", fake_out.getvalue())
+
+    @patch('kobo.client.task_watcher.TaskWatcher.watch_tasks')
+    def test_hub_without_batched_watching(self, fake_watch):
+        self.command.hub.scan.watch_tasks.side_effect = Fault(1, 'method "scan.watch_tasks" is not supported')
+        with patch('sys.stdout', new=io.StringIO()):
+            self.command.run('1')
+        fake_watch.assert_called_once_with(self.command.hub, [1])
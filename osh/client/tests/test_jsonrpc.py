@@ -0,0 +1,97 @@
+import gzip
+import io
+import json
+import unittest
+from http.cookiejar import CookieJar
+from unittest.mock import MagicMock
+from urllib.error import HTTPError
+from xmlrpc.client import Fault
+
+from kobo.client import HubProxy
+
+from osh.client import OshCommand
+from osh.client.jsonrpc import JSONRPCHubProxy
+
+
+class FakeTransport:
+    def __init__(self):
+        self.cookiejar = CookieJar()
+
+
+class FakeHub:
+    def __init__(self):
+        self._hub_url = 'https://hub/osh/xmlrpc'
+        self._client_type = 'client'
+        self._transport = FakeTransport()
+        self._hub = MagicMock()
+
+    def __getattr__(self, name):
+        # methods of the XML-RPC server proxy
+        return getattr(self._hub, name)
+
+    def upload_file(self, *args):
+        pass
+
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, reply, encoding=None):
+        content = json.dumps(reply).encode()
+        if encoding == 'gzip':
+            content = gzip.compress(content)
+        super().__init__(content)
+        self.headers = {'Content-Encoding': encoding} if encoding else {}
+
+
+class TestJSONRPCHubProxy(unittest.TestCase):
+    def setUp(self):
+        self.hub = FakeHub()
+        self.proxy = JSONRPCHubProxy(self.hub)
+        self.proxy._opener = MagicMock()
+
+    def test_hub_attributes(self):
+        self.assertEqual(self.proxy.upload_file, self.hub.upload_file)
+        self.assertEqual(self.proxy._hub_url, self.hub._hub_url)
+
+    def test_call(self):
+        self.proxy._opener.open.return_value = FakeResponse({'id': 1, 'result': [3, 2, 1]}, 'gzip')
+        self.assertEqual(self.proxy.scan.find_tasks({'regex': '.'}), [3, 2, 1])
+
+        request = self.proxy._opener.open.call_args[0][0]
+        self.assertEqual(request.full_url, 'https://hub/osh/xmlrpc/json/client/')
+        self.assertEqual(json.loads(request.data)['method'], 'scan.find_tasks')
+        self.hub.scan.find_tasks.assert_not_called()
+
+    def test_fault(self):
+        error = {'code': 1, 'message': 'Exception: method "foo" is not supported'}
+        self.proxy._opener.open.return_value = FakeResponse({'id': 1, 'error': error})
+        with self.assertRaises(Fault) as cm:
+            self.proxy.scan.foo()
+        self.assertEqual(cm.exception.faultString, error['message'])
+
+    def test_fallback_to_xmlrpc(self):
+        self.proxy._opener.open.side_effect = HTTPError('', 404, 'Not Found', {}, None)
+        self.hub.scan.find_tasks.return_value = [1]
+
+        self.assertEqual(self.proxy.scan.find_tasks({'regex': '.'}), [1])
+        self.assertEqual(self.proxy.scan.find_tasks({'regex': '.'}), [1])
+        self.assertEqual(self.proxy._opener.open.call_count, 1)
+
+
+class TestConnectToHub(unittest.TestCase):
+    def connect(self, conf):
+        command = OshCommand(parser=None)
+        command.conf = conf
+
+        def set_hub(*args):
+            command.hub = MagicMock(spec=HubProxy, _hub_url='https://hub/osh/xmlrpc',
+                                    _client_type='client', _transport=FakeTransport())
+
+        command.set_hub = set_hub
+        command.connect_to_hub({})
+        return command.hub
+
+    def test_xmlrpc_by_default(self):
+        self.assertNotIsInstance(self.connect({}), JSONRPCHubProxy)
+
+    def test_jsonrpc_enabled(self):
+        self.assertIsInstance(self.connect({'JSONRPC': 1}), JSONRPCHubProxy)
@@ -15,6 +15,15 @@ FIXED_HTML_FILE = 'fixed.html'
 ERROR_TXT_FILE = 'added.err'
 FIXED_TXT_FILE = 'fixed.err'
 
+# checksums of diffed results and numbers of added and fixed defects
+DIFF_STATS_FILE = 'diff-stats.json'
+
+# directory with diff files computed by the worker
+WORKER_DIFF_DIR = 'worker-diff'
+
+# locations of unpacked results within the task directory
+RESULTS_MANIFEST_FILE = 'results-manifest.json'
+
 DEFAULT_CHECKER_GROUP = "Unsorted"
 
 SCAN_RESULTS_FILENAME = 'scan-results.js'
@@ -25,3 +34,16 @@ CSDIFF_ARGS = '-jz'
 DEFECTS_IN_PATCHES_FILE = "defects-in-patches.js"
 
 DEFAULT_SCAN_LIMIT = 1000
+
+# modes of scanning the base of differential scans
+# the base is scanned first, then the target on the same worker
+BASE_SCAN_SEQUENTIAL = 'sequential'
+# base and target are scanned concurrently on the same worker
+BASE_SCAN_SAME_WORKER = 'same-worker'
+# the base scan may be taken by another worker while the target is scanned
+BASE_SCAN_SEPARATE_WORKERS = 'separate-workers'
+
+# size of chunks of uploads to the hub; a chunk is sent base64-encoded in an
+# XML-RPC request, which has to fit in Django's DATA_UPLOAD_MAX_MEMORY_SIZE
+# (2.5 MiB by default), the same size is used by kobo for its uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024
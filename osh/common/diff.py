@@ -0,0 +1,157 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Diffing of scan results shared by the hub and workers
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shlex
+
+from kobo.shortcuts import run
+
+from osh.common.constants import (CSDIFF_ARGS, DIFF_STATS_FILE,
+                                  ERROR_DIFF_FILE, ERROR_HTML_FILE,
+                                  ERROR_TXT_FILE, FIXED_DIFF_FILE,
+                                  FIXED_HTML_FILE, FIXED_TXT_FILE)
+
+logger = logging.getLogger(__name__)
+
+# files produced by generate_diff_files() and write_diff_stats()
+DIFF_FILES = (
+    ERROR_DIFF_FILE,
+    FIXED_DIFF_FILE,
+    ERROR_HTML_FILE,
+    FIXED_HTML_FILE,
+    ERROR_TXT_FILE,
+    FIXED_TXT_FILE,
+    DIFF_STATS_FILE,
+)
+
+
+def _run(command, workdir):
+    """ kobo.shortcuts.run wrapper with predefined setup and logging """
+    retcode, output = run(command,
+                          workdir=workdir,
+                          stdout=False,
+                          can_fail=True,
+                          return_stdout=False,
+                          show_cmd=False)
+    if retcode != 0:
+        logger.critical("'%s' wasn't successfull; path: %s, code: %s",
+                        command, workdir, retcode)
+    return retcode == 0
+
+
+def csdiff(old, new, result, workdir):
+    """
+    use csdiff with constants.CSDIFF_ARGS arguments
+    compare `old` and `new` files and store the diff in `result`
+    all three files have '.err' type
+    """
+    # whole csdiff call must be in one string, because character '>' cannot be
+    # enclosed into quotes -- command '"csdiff" "-j" "old.err" "new.err" ">"
+    # "csdiff.out"' does not work
+    diff_cmd = ' '.join(['csdiff', CSDIFF_ARGS, shlex.quote(old),
+                         shlex.quote(new), '>', result])
+    return _run(diff_cmd, workdir)
+
+
+def csdiff_new_defects(old, new, result, task_dir):
+    """ create file with newly introduced findings"""
+    return csdiff(old, new, result, task_dir)
+
+
+def csdiff_fixed_defects(old, new, result, task_dir):
+    """ create file with fixed findings"""
+    return csdiff(new, old, result, task_dir)
+
+
+def cshtml(input_file, output_file, workdir):
+    """ generate HTML report """
+    cmd = 'csgrep --prune-events 1 --mode json %s | cshtml - > %s' % \
+        (input_file, output_file)
+    return _run(cmd, workdir)
+
+
+def csgrep_err(input_file, output_file, workdir):
+    """ generate ERR text files """
+    cmd = 'csgrep --prune-events 1 %s > %s' % (input_file, output_file)
+    return _run(cmd, workdir)
+
+
+def add_title_to_json(path, title):
+    # encoding="utf-8" is needed to load JSON with utf-8 chars on RHEL-8 when running in POSIX locale
+    with open(path, "r+", encoding="utf-8") as fd:
+        loaded_json = json.load(fd)
+        loaded_json['scan']['title'] = title
+        fd.seek(0)
+        fd.truncate()
+        json.dump(loaded_json, fd, indent=4)
+
+
+def generate_diff_files(base_json, target_json, output_dir):
+    """
+    create diffs, html reports and .err files of results in output_dir
+    """
+    def path(name):
+        return os.path.join(output_dir, name)
+
+    if not csdiff_new_defects(base_json, target_json, path(ERROR_DIFF_FILE), output_dir):
+        return False
+    if not csdiff_new_defects(target_json, base_json, path(FIXED_DIFF_FILE), output_dir):
+        return False
+
+    # these are basicly optional, don't fail if one of them
+    # was not successfull
+    add_title_to_json(path(ERROR_DIFF_FILE), 'Newly introduced findings')
+    add_title_to_json(path(FIXED_DIFF_FILE), 'Fixed findings')
+
+    cshtml(path(ERROR_DIFF_FILE), path(ERROR_HTML_FILE), output_dir)
+    cshtml(path(FIXED_DIFF_FILE), path(FIXED_HTML_FILE), output_dir)
+    csgrep_err(path(ERROR_DIFF_FILE), path(ERROR_TXT_FILE), output_dir)
+    csgrep_err(path(FIXED_DIFF_FILE), path(FIXED_TXT_FILE), output_dir)
+    return True
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def count_defects_per_checker(json_path):
+    """ return {'checker': count} for defects in the file """
+    with open(json_path, encoding='utf-8') as f:
+        defects = json.load(f)['defects']
+
+    result = {}
+    for defect in defects:
+        result.setdefault(defect['checker'], 0)
+        result[defect['checker']] += 1
+    return result
+
+
+def compute_diff_stats(base_json, target_json, output_dir):
+    """
+    summary of the diff in output_dir: checksums of the diffed results and
+    numbers of added and fixed defects per checker
+    """
+    return {
+        'base_checksum': sha256_file(base_json),
+        'target_checksum': sha256_file(target_json),
+        'added': count_defects_per_checker(os.path.join(output_dir, ERROR_DIFF_FILE)),
+        'fixed': count_defects_per_checker(os.path.join(output_dir, FIXED_DIFF_FILE)),
+    }
+
+
+def write_diff_stats(base_json, target_json, output_dir):
+    stats = compute_diff_stats(base_json, target_json, output_dir)
+    with open(os.path.join(output_dir, DIFF_STATS_FILE), 'w') as f:
+        json.dump(stats, f, indent=4)
+    return stats
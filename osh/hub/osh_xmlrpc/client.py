@@ -1,16 +1,26 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import os
+
 import kobo.hub.xmlrpc.client as kobo_xmlrpc_client
 from kobo.django.xmlrpc.decorators import login_required
+from kobo.hub.models import Task
 
-from osh.hub.scan.models import ScanBinding
+from osh.hub.scan.coalesce import resolve_coalesced_tasks
+from osh.hub.scan.models import ScanBinding, TaskPackage
 from osh.hub.scan.xmlrpc_helper import cancel_scan
+from osh.hub.service.upload import StoredUpload, reuse_stored_file
 
 # DO NOT REMOVE!  The __all__ list contains all publicly exported XML-RPC
 # methods from this module.
 __all__ = [
     'cancel_task',
+    'find_upload',
+    'finish_upload',
+    'resubmit_task',
+    'start_upload',
+    'upload_chunk',
 ]
 
 
@@ -23,4 +33,48 @@ def cancel_task(request, task_id):
     if sb is not None:
         cancel_scan(sb)
 
+    # schedule one of the tasks waiting for results of the canceled one
+    resolve_coalesced_tasks(request, Task.objects.get(id=task_id))
     return response
+
+
+@login_required
+def resubmit_task(request, task_id, force=False, priority=None):
+    new_task_id = kobo_xmlrpc_client.resubmit_task(request, task_id, force, priority)
+    TaskPackage.objects.index_task(Task.objects.get(id=new_task_id))
+    return new_task_id
+
+
+@login_required
+def find_upload(request, name, checksum, size):
+    """
+    Return ID of a new upload of the file if the user has already uploaded a
+    file with the same checksum, None otherwise.  Sizes are passed as strings
+    because they may not fit into XML-RPC integers.
+    """
+    upload = reuse_stored_file(request.user, name, checksum, int(size))
+    return None if upload is None else upload.id
+
+
+@login_required
+def start_upload(request, checksum, size, chunk_size):
+    """
+    Start or resume chunked upload of a file, return indexes of chunks which
+    were already received.
+    """
+    checksum = checksum.lower()
+    return StoredUpload(request.user, checksum).start(int(size), checksum, int(chunk_size))
+
+
+@login_required
+def upload_chunk(request, checksum, index, chunk_checksum, encoded_chunk):
+    """ store a chunk of the file and return the uploaded percentage """
+    upload = StoredUpload(request.user, checksum.lower())
+    return upload.write_chunk(index, chunk_checksum, encoded_chunk)
+
+
+@login_required
+def finish_upload(request, name, checksum):
+    """ verify the uploaded file and return ID of its upload """
+    path = StoredUpload(request.user, checksum.lower()).finish()
+    return reuse_stored_file(request.user, name, checksum, os.path.getsize(path)).id
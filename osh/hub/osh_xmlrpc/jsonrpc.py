@@ -0,0 +1,143 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+JSON-RPC interface of the hub
+
+The methods registered for an XML-RPC handler in settings.XMLRPC_METHODS are
+also served as JSON-RPC 2.0 at xmlrpc/json/<handler>/.  Requests may be sent
+compressed by gzip and large responses are compressed for clients accepting
+it, which makes the interface much cheaper for bulk payloads.  Errors carry
+the same codes and messages as faults of the XML-RPC interface.
+"""
+
+import base64
+import datetime
+import gzip
+import json
+import xmlrpc.client
+import zlib
+
+import django.db
+import kobo.django.xmlrpc.views
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from django.views.decorators.csrf import csrf_exempt
+
+from osh.hub.service.artifacts import parse_accept_encoding
+
+# responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+# error codes defined by the JSON-RPC 2.0 specification
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+
+
+class JSONRPCEncoder(json.JSONEncoder):
+    """ encode values which may be returned over XML-RPC """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.date)):
+            return o.isoformat()
+        if isinstance(o, xmlrpc.client.DateTime):
+            return o.value
+        if isinstance(o, xmlrpc.client.Binary):
+            o = o.data
+        if isinstance(o, bytes):
+            return base64.b64encode(o).decode()
+        return super().default(o)
+
+
+def _get_dispatcher(handler):
+    if handler not in settings.XMLRPC_METHODS:
+        raise Http404(f'Unknown handler: {handler}')
+    return getattr(kobo.django.xmlrpc.views, f'{handler}_handler').xmlrpc_dispatcher
+
+
+def _error(code, message):
+    return {'error': {'code': code, 'message': message}}
+
+
+def _gunzip(data, max_size):
+    """ decompress gzipped data, which must not exceed max_size bytes """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # let a byte over the limit through to find out the limit was exceeded
+    data = decompressor.decompress(data, 0 if max_size is None else max_size + 1)
+    if max_size is not None and len(data) > max_size:
+        raise ValueError(f'Decompressed request exceeds {max_size} bytes')
+    if not decompressor.eof:
+        raise EOFError('Compressed request ended before the end-of-stream marker')
+    return data
+
+
+def _parse_call(request):
+    """ return (id, method, params) of the call or a reply with an error """
+    try:
+        body = request.body
+        if request.headers.get('Content-Encoding') == 'gzip':
+            # the request is limited by DATA_UPLOAD_MAX_MEMORY_SIZE before
+            # decompression, so is its decompressed content
+            body = _gunzip(body, settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+        call = json.loads(body)
+    except (OSError, EOFError, ValueError, zlib.error) as ex:
+        return None, _error(PARSE_ERROR, f'Parse error: {ex}')
+
+    if not isinstance(call, dict):
+        return None, _error(INVALID_REQUEST, 'Invalid request')
+
+    method = call.get('method')
+    params = call.get('params', [])
+    if not isinstance(method, str) or not isinstance(params, list):
+        return call.get('id'), _error(INVALID_REQUEST, 'Invalid request')
+
+    return call.get('id'), (method, params)
+
+
+def _dispatch(dispatcher, request, method, params):
+    try:
+        return {'result': dispatcher._dispatch(method, [request] + params)}
+    except xmlrpc.client.Fault as fault:
+        return _error(fault.faultCode, fault.faultString)
+    except Exception as ex:
+        # report the exception the same way as kobo does over XML-RPC
+        if settings.DEBUG:
+            from kobo.tback import Traceback
+            return _error(1, Traceback().get_traceback())
+        return _error(1, f'{type(ex).__name__}: {ex}')
+
+
+def _encode_reply(call_id, reply):
+    reply = {'jsonrpc': '2.0', 'id': call_id, **reply}
+    try:
+        return json.dumps(reply, cls=JSONRPCEncoder).encode()
+    except (TypeError, ValueError) as ex:
+        reply = {'jsonrpc': '2.0', 'id': call_id, **_error(1, f'{type(ex).__name__}: {ex}')}
+        return json.dumps(reply).encode()
+
+
+@csrf_exempt
+def jsonrpc_handler(request, handler):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    dispatcher = _get_dispatcher(handler)
+
+    if settings.DEBUG:
+        # clear queries to stop django allocating more and more memory
+        django.db.reset_queries()
+
+    call_id, call = _parse_call(request)
+    if isinstance(call, tuple):
+        reply = _dispatch(dispatcher, request, *call)
+    else:
+        reply = call
+
+    content = _encode_reply(call_id, reply)
+    response = HttpResponse(content_type='application/json')
+    response['Vary'] = 'Accept-Encoding'
+    accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+    if len(content) >= GZIP_MIN_SIZE and 'gzip' in accepted:
+        content = gzip.compress(content, compresslevel=6)
+        response['Content-Encoding'] = 'gzip'
+    response.content = content
+    return response
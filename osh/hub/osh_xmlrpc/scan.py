@@ -1,18 +1,25 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import datetime
 import logging
 import re
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import F, Q
 from kobo.django.auth.models import User
 from kobo.django.xmlrpc.decorators import login_required
 from kobo.hub.models import Task
+from kobo.hub.xmlrpc.client import task_url
 
 from osh.common.constants import DEFAULT_SCAN_LIMIT
-from osh.hub.scan.models import SCAN_STATES, ClientAnalyzer, Profile, Scan
+from osh.hub.scan.coalesce import resolve_submitted_task
+from osh.hub.scan.models import (DISK_USAGE_GROUPS, SCAN_STATES,
+                                 ClientAnalyzer, Profile, Scan, TaskDiskUsage)
 from osh.hub.scan.scanner import (ClientDiffPatchesScanScheduler,
                                   ClientDiffScanScheduler, ClientScanScheduler)
+from osh.hub.service.task_watch import WATCHERS, get_task_changes
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +30,15 @@ __all__ = [
     "create_user_diff_task",
     "diff_build",
     "find_tasks",
+    "get_disk_usage",
     "get_filtered_scan_list",
+    "get_scan_list_page",
     "get_task_info",
+    "get_tasks_info",
     "list_analyzers",
     "list_profiles",
     "mock_build",
+    "watch_tasks",
 ]
 
 
@@ -39,7 +50,9 @@ def __client_build(request, options, Scheduler):
     options['user'] = request.user
     sched = Scheduler(options)
     sched.prepare_args()
-    return sched.spawn()
+    task_id = sched.spawn()
+    resolve_submitted_task(request, task_id)
+    return task_id
 
 
 @login_required
@@ -110,6 +123,7 @@ def get_filtered_scan_list(request, kwargs, filter_scan_limit=DEFAULT_SCAN_LIMIT
      - maximum number of scans which can be returned
      - if the query exceeds the limit, error message is returned
      - parameter is optional, if not set DEFAULT_SCAN_LIMIT is used
+     - use get_scan_list_page to get all the scans page by page
     @return:
      - status: status message: { 'OK', 'ERROR' }
      - message: in case of error, here is detailed message
@@ -129,30 +143,111 @@ def get_filtered_scan_list(request, kwargs, filter_scan_limit=DEFAULT_SCAN_LIMIT
     if ret_value:
         return ret_value
 
-    query_set = Scan.objects.filter(**kwargs).select_related() \
-        .order_by('-date_submitted') \
-        .values('username__username',
-                'username__email',
-                'package__name',
-                'package__blocked',
-                'date_submitted',
-                'enabled',
-                'scanbinding__id',
-                'nvr',
-                'base_id',
-                'base__nvr',
-                'last_access',
-                'scan_type',
-                'state',
-                'tag__release__tag',
-                'tag__name',
-                )
+    query_set = _get_scan_list(kwargs)
     results_count = query_set.count()
     if results_count > filter_scan_limit:
         return {'status': 'ERROR', 'message': 'Limit exceeded, returning first ' + str(filter_scan_limit) + ' scans.',
-                'count': filter_scan_limit, 'scans': __rename_keys(list(query_set[:filter_scan_limit]))}
+                'count': filter_scan_limit, 'scans': _export_scan_list(query_set[:filter_scan_limit])}
 
-    return {'status': 'OK', 'count': results_count, 'scans': __rename_keys(list(query_set))}
+    return {'status': 'OK', 'count': results_count, 'scans': _export_scan_list(query_set)}
+
+
+def get_scan_list_page(request, kwargs, cursor=None, limit=DEFAULT_SCAN_LIMIT, count=False):
+    """
+    get_scan_list_page(kwargs, cursor=None, limit=DEFAULT_SCAN_LIMIT, count=False)
+
+        Returns a page of scans which fit kwargs filters, see
+        get_filtered_scan_list for the available filters.  Scans are sorted by
+        submission date, the latest one is first.
+
+    @param cursor: continuation token returned with the previous page, the
+        first page is returned if not set
+    @param limit: maximum number of scans on the page (at most DEFAULT_SCAN_LIMIT)
+    @param count: whether to count all the scans which fit the filters
+    @return:
+     - status: status message: { 'OK', 'ERROR' }
+     - message: in case of error, here is detailed message
+     - scans: info about scans on the page, the same as of get_filtered_scan_list
+     - cursor: continuation token for the next page, None on the last page
+     - count: number of all the scans which fit the filters if requested
+
+     Basic usage:
+
+        cursor = None
+        while True:
+            page = hub.scan.get_scan_list_page(filters, cursor)
+            for scan in page['scans']:
+                print(scan['target'])
+            cursor = page['cursor']
+            if cursor is None:
+                break
+    """
+    kwargs = __setup_kwargs(kwargs)
+    ret_value = __convert_names_to_numbers(kwargs)
+    if ret_value:
+        return ret_value
+
+    query_set = _get_scan_list(kwargs)
+    result = {'status': 'OK'}
+    if count:
+        result['count'] = query_set.count()
+
+    if cursor:
+        try:
+            date_submitted, scan_id = _parse_scan_list_cursor(cursor)
+        except ValueError:
+            return {'status': 'ERROR', 'message': 'Invalid cursor: ' + cursor}
+        earlier = Q(date_submitted__lt=date_submitted)
+        query_set = query_set.filter(earlier | Q(date_submitted=date_submitted, id__lt=scan_id))
+
+    limit = max(1, min(limit, DEFAULT_SCAN_LIMIT))
+    # one more scan tells whether there is a next page
+    scans = _export_scan_list(query_set[:limit + 1])
+    result['cursor'] = None
+    if len(scans) > limit:
+        scans = scans[:limit]
+        last = scans[-1]
+        result['cursor'] = f"{last['date_submitted'].isoformat()},{last['scan_id']}"
+
+    result['scans'] = scans
+    return result
+
+
+# {key of scans returned by get_filtered_scan_list: field of Scan}
+SCAN_LIST_FIELDS = {
+    'owner_name': 'username__username',
+    'owner_email': 'username__email',
+    'package_name': 'package__name',
+    'package_is_blocked': 'package__blocked',
+    'date_last_accessed': 'last_access',
+    'target': 'nvr',
+    'is_enabled': 'enabled',
+    'base_target': 'base__nvr',
+    'release': 'tag__release__tag',
+    'tag_name': 'tag__name',
+    'scan_id': 'id',
+}
+
+
+def _get_scan_list(kwargs):
+    """ scans which fit the filters, keys are renamed by the database """
+    fields = {key: F(field) for key, field in SCAN_LIST_FIELDS.items()}
+    # 'id' is a field of Scan, so it cannot be renamed by the query
+    return Scan.objects.filter(**kwargs) \
+        .order_by('-date_submitted', '-id') \
+        .values('date_submitted', 'scanbinding__id', 'base_id', 'scan_type', 'state', **fields)
+
+
+def _export_scan_list(query_set):
+    scans = list(query_set)
+    for scan in scans:
+        scan['id'] = scan.pop('scanbinding__id')
+    return scans
+
+
+def _parse_scan_list_cursor(cursor):
+    date_submitted, _, scan_id = cursor.partition(',')
+    return datetime.datetime.fromisoformat(date_submitted), int(scan_id)
 
 
 def __setup_kwargs(kwargs):
@@ -191,26 +286,6 @@ def __convert_names_to_numbers(kwargs):
         kwargs['state'] = state_number
 
 
-def __rename_keys(scans_list):
-    # The best way would be to use SQL query with renamed values, but django doesn't support it very cleverly
-    translation_table = {'username__username': 'owner_name',
-                         'username__email': 'owner_email',
-                         'package__name': 'package_name',
-                         'package__blocked': 'package_is_blocked',
-                         'last_access': 'date_last_accessed',
-                         'nvr': 'target',
-                         'enabled': 'is_enabled',
-                         'base__nvr': 'base_target',
-                         'tag__release__tag': 'release',
-                         'tag__name': 'tag_name',
-                         'scanbinding__id': 'id',
-                         }
-    for scan in scans_list:
-        for old_name, new_name in translation_table.items():
-            scan[new_name] = scan.pop(old_name)
-    return scans_list
-
-
 def get_task_info(request, task_id):
     """
     get_task_info(task_id) -> {...}
@@ -227,6 +302,44 @@ def get_task_info(request, task_id):
     return result
 
 
+def get_tasks_info(request, task_ids):
+    """
+    get_tasks_info(task_ids) -> {'<task_id>': {...}, ...}
+
+    provide info about specified tasks including their 'url', tasks which do
+    not exist are omitted
+    """
+    result = {}
+    tasks = Task.objects.filter(pk__in=task_ids) \
+        .select_related('owner', 'resubmitted_by', 'resubmitted_from')
+    for task in tasks:
+        info = task.export()
+        info['url'] = task_url(request, task.id)
+        result[str(task.id)] = info
+    return result
+
+
+def watch_tasks(request, task_ids, cursor='', timeout=0):
+    """
+    watch_tasks(task_ids, cursor='', timeout=0) -> {
+        'tasks': [{'id': ..., 'parent_id': ..., 'state_label': ..., ...}, ...],
+        'cursor': '...',
+        'missing': [<id>, ...],
+        'finished': True/False,
+    }
+
+    provide states of specified tasks and their subtasks which changed since
+    the cursor returned by the previous call (all of them for an empty cursor)
+
+    If nothing changed, wait up to timeout seconds (at most TASK_WATCH_MAX_WAIT)
+    for a change.  If TASK_WATCH_MAX_WAITERS requests wait already, return
+    right away.  'finished' is True when all the tasks are finished.
+    """
+    timeout = max(0, min(timeout, settings.TASK_WATCH_MAX_WAIT))
+    with WATCHERS.acquire(settings.TASK_WATCH_MAX_WAITERS) as may_wait:
+        return get_task_changes(task_ids, cursor, timeout if may_wait else 0)
+
+
 def find_tasks(request, query):
     """
     find_tasks(request, query) -> [ <id>, <id>, ... ]
@@ -241,10 +354,15 @@ def find_tasks(request, query):
 
     Query also supports following optional keys:
      * 'states': list, search by task states
-
-    Returned list is ordered by date, when task finished -- latest task is
-    first. Unfinished tasks are at the tail. If there is any problem with
-    querying, empty list is returned.
+     * 'latest': bool, return only the latest task
+     * 'limit': int, return at most this number of tasks
+     * 'cursor': int, return only tasks with lower ID, i.e. the last ID of
+                 the previous page
+
+    Returned list is ordered by task ID, the latest task is first.  Queries
+    by regex and comment return at most FIND_TASKS_MAX_RESULTS tasks at once,
+    the following ones are to be fetched using 'cursor'.  If there is any
+    problem with querying, empty list is returned.
     """
     if not isinstance(query, dict):
         return []
@@ -254,13 +372,15 @@ def find_tasks(request, query):
     comment = query.get('comment')
     states = query.get('states')
     latest = query.get('latest')
+    limit = query.get('limit')
+    cursor = query.get('cursor')
 
-    result = []
     tasks = Task.objects.none()
     if nvr:
         tasks = Task.objects.filter(label=nvr)
     elif package_name:
-        tasks = Task.objects.filter(label__regex=package_name + r"-\d")
+        # tasks are indexed by name of the scanned package when created
+        tasks = Task.objects.filter(taskpackage__name=package_name)
     elif regex:
         tasks = Task.objects.filter(label__regex=regex)
     elif comment:
@@ -269,15 +389,39 @@ def find_tasks(request, query):
     if states:
         tasks = tasks.filter(state__in=states)
 
-    result = tasks.order_by("-id").values_list("id", flat=True)
+    if cursor is not None:
+        tasks = tasks.filter(id__lt=cursor)
+
     # truncate the result in case `latest` is specified, this reduces the amount of
     # data transferred over the network
     if latest:
-        first_elem = result.first()
-        result = [first_elem] if first_elem is not None else []
-    else:
-        result = list(result)
+        limit = 1
+    elif regex or comment:
+        # these are not indexed, do not scan the whole table at once
+        limit = min(limit or settings.FIND_TASKS_MAX_RESULTS, settings.FIND_TASKS_MAX_RESULTS)
+
+    result = tasks.order_by("-id").values_list("id", flat=True)
+    if limit:
+        result = result[:limit]
+    return list(result)
+
+
+def get_disk_usage(request, group_by='package', limit=20):
+    """
+    get_disk_usage(group_by='package', limit=20) -> [ {...}, ... ]
+
+    Return groups of tasks with the largest results, the largest group is
+    first.  Tasks are grouped by 'package', 'release' or 'owner'.  Sizes are
+    in bytes and they are sent as strings because they may not fit into
+    XML-RPC integers.
+    """
+    if group_by not in DISK_USAGE_GROUPS:
+        raise ValueError(f"Unknown group {group_by}, use one of: {', '.join(DISK_USAGE_GROUPS)}")
 
+    result = TaskDiskUsage.objects.top_consumers(group_by, limit)
+    for group in result:
+        group['size'] = str(group['size'])
+        group['tarball_size'] = str(group['tarball_size'])
     return result
 
 
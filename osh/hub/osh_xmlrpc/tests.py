@@ -0,0 +1,335 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""`osh.hub.osh_xmlrpc` tests."""
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import xmlrpc.client
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from kobo.hub.models import TASK_STATES, Arch, Channel, Task, Worker
+
+from osh.common.constants import UPLOAD_CHUNK_SIZE
+from osh.hub.osh_xmlrpc.scan import (find_tasks, get_filtered_scan_list,
+                                     get_scan_list_page, watch_tasks)
+from osh.hub.osh_xmlrpc.worker import (cancel_subtasks, close_task, fail_task,
+                                       interrupt_tasks, timeout_tasks)
+from osh.hub.scan.models import CoalescedTask, Scan, TaskPackage
+from osh.hub.scan.scheduling import get_package_name
+
+
+class FindTasksTestSuite(TestCase):
+    def setUp(self):
+        get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+
+    def _create_task(self, label, **args):
+        task_id = Task.create_task('user', label, 'MockBuild', args=args)
+        TaskPackage.objects.index_task(Task.objects.get(id=task_id))
+        return task_id
+
+    def test_package_name(self):
+        self.assertEqual(get_package_name('units-2.22-5.el9.src.rpm'), 'units')
+        self.assertEqual(get_package_name('units-2.22.tar.xz'), 'units')
+        self.assertEqual(get_package_name('units'), 'units')
+
+    def test_find_by_package(self):
+        first = self._create_task('units-2.22-5.el9.src.rpm')
+        self._create_task('unitsx-1.0-1.el9')
+        second = self._create_task('upload', result_filename='units-2.23-1.el9')
+        self.assertEqual(find_tasks(None, {'package_name': 'units'}), [second, first])
+        self.assertEqual(find_tasks(None, {'package_name': 'units', 'latest': True}), [second])
+
+    def test_pages(self):
+        task_ids = [self._create_task(f'units-2.{i}-1.el9') for i in range(5)]
+        query = {'regex': '^units-', 'limit': 2}
+        self.assertEqual(find_tasks(None, query), task_ids[:2:-1])
+        query['cursor'] = task_ids[3]
+        self.assertEqual(find_tasks(None, query), task_ids[2:0:-1])
+
+    @override_settings(FIND_TASKS_MAX_RESULTS=3)
+    def test_regex_limit(self):
+        task_ids = [self._create_task(f'units-2.{i}-1.el9') for i in range(5)]
+        self.assertEqual(find_tasks(None, {'regex': 'units'}), task_ids[:1:-1])
+
+
+class SubtaskCancellationTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(TASK_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+        worker = Worker.objects.create(name='worker')
+        self.request = MagicMock(worker=worker)
+
+        self.task = self.create_task('VersionDiffBuild', worker_name='worker')
+        Task.objects.filter(id=self.task.id).update(state=TASK_STATES['OPEN'])
+        # the base is scanned concurrently on another worker
+        self.base_task = self.create_task('VersionDiffBuild', parent_id=self.task.id)
+
+    def create_task(self, method, **kwargs):
+        return Task.objects.get(id=Task.create_task('user', 'units-2.22-5.el9', method, **kwargs))
+
+    def state(self, task):
+        return Task.objects.get(id=task.id).state
+
+    def test_failed_task(self):
+        finished = self.create_task('VersionDiffBuild', parent_id=self.task.id,
+                                    state=TASK_STATES['CLOSED'])
+        fail_task(self.request, self.task.id, '')
+        self.assertEqual(self.state(self.task), TASK_STATES['FAILED'])
+        self.assertEqual(self.state(self.base_task), TASK_STATES['CANCELED'])
+        self.assertEqual(self.state(finished), TASK_STATES['CLOSED'])
+
+    def test_cancel_subtasks(self):
+        cancel_subtasks(self.request, self.task.id)
+        self.assertEqual(self.state(self.task), TASK_STATES['OPEN'])
+        self.assertEqual(self.state(self.base_task), TASK_STATES['CANCELED'])
+
+    def test_task_of_another_worker(self):
+        self.request.worker = Worker.objects.create(name='other')
+        with self.assertRaises(Task.DoesNotExist):
+            cancel_subtasks(self.request, self.task.id)
+        self.assertEqual(self.state(self.base_task), TASK_STATES['FREE'])
+
+
+class CoalescedTaskTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(TASK_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+        worker = Worker.objects.create(name='worker')
+        self.request = MagicMock(worker=worker)
+
+        self.primary = self.create_task(worker_name='worker')
+        Task.objects.filter(id=self.primary.id).update(state=TASK_STATES['OPEN'])
+        CoalescedTask.objects.create(task=self.primary, digest='0' * 64)
+        self.followers = [self.create_task(state=TASK_STATES['CREATED']) for _ in range(2)]
+        for task in self.followers:
+            CoalescedTask.objects.create(task=task, digest='0' * 64, primary=self.primary)
+
+    def create_task(self, **kwargs):
+        return Task.objects.get(id=Task.create_task('user', 'units-2.22-5.el9', 'MockBuild', **kwargs))
+
+    def assertRescheduled(self):
+        first, second = (Task.objects.get(id=task.id) for task in self.followers)
+        self.assertEqual(first.state, TASK_STATES['FREE'])
+        self.assertIsNone(CoalescedTask.objects.get(task=first).primary)
+        self.assertEqual(second.state, TASK_STATES['CREATED'])
+        self.assertEqual(CoalescedTask.objects.get(task=second).primary, first)
+
+    @patch('osh.hub.scan.coalesce.send_task_notification')
+    def test_closed(self, send_task_notification):
+        # the worker uploads a log which is compressed once the task finishes
+        pathlib.Path(Task.get_task_dir(self.primary.id, create=True), 'stdout.log').write_text('log')
+        close_task(self.request, self.primary.id, 'result')
+
+        for task in self.followers:
+            task = Task.objects.get(id=task.id)
+            self.assertEqual(task.state, TASK_STATES['CLOSED'])
+            self.assertEqual(task.result, 'result')
+            self.assertIsNotNone(task.dt_finished)
+            self.assertEqual(os.listdir(Task.get_task_dir(task.id)), ['stdout.log.gz'])
+        self.assertEqual(send_task_notification.call_count, len(self.followers))
+
+    def test_interrupted(self):
+        interrupt_tasks(self.request, [self.primary.id])
+        self.assertEqual(Task.objects.get(id=self.primary.id).state, TASK_STATES['INTERRUPTED'])
+        self.assertRescheduled()
+
+    def test_timed_out(self):
+        timeout_tasks(self.request, [self.primary.id])
+        self.assertEqual(Task.objects.get(id=self.primary.id).state, TASK_STATES['TIMEOUT'])
+        self.assertRescheduled()
+
+
+class ResultsUploadTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(UPLOAD_DIR=os.path.join(tmp_dir.name, 'upload'),
+                                       TASK_DIR=os.path.join(tmp_dir.name, 'tasks'))
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+        Worker.objects.create(name='worker')
+        self.client.force_login(get_user_model().objects.create(username='worker/worker'))
+
+        self.task_id = Task.create_task('user', 'units-2.22-5.el9', 'MockBuild', args={},
+                                        worker_name='worker')
+        Task.objects.filter(id=self.task_id).update(state=TASK_STATES['OPEN'])
+
+    def call(self, method, *params):
+        response = self.client.post('/xmlrpc/worker/', xmlrpc.client.dumps(params, method),
+                                    content_type='text/xml')
+        self.assertEqual(response.status_code, 200)
+        return xmlrpc.client.loads(response.content)[0][0]
+
+    def test_full_size_chunk(self):
+        # random data are not compressed by base64 nor by the XML encoding
+        content = os.urandom(UPLOAD_CHUNK_SIZE + 1)
+        checksum = hashlib.sha256(content).hexdigest()
+        filename = 'units-2.22-5.el9.tar.xz'
+        self.assertEqual(self.call('worker.start_results_upload', self.task_id, filename,
+                                   str(len(content)), checksum, str(UPLOAD_CHUNK_SIZE)), [])
+
+        for index in range(2):
+            chunk = content[index * UPLOAD_CHUNK_SIZE:(index + 1) * UPLOAD_CHUNK_SIZE]
+            self.call('worker.upload_results_chunk', self.task_id, filename, index,
+                      hashlib.sha256(chunk).hexdigest(), xmlrpc.client.Binary(chunk))
+
+        self.call('worker.finish_results_upload', self.task_id, filename)
+        path = os.path.join(Task.get_task_dir(self.task_id), filename)
+        self.assertEqual(pathlib.Path(path).read_bytes(), content)
+
+
+class StoredUploadTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(UPLOAD_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        self.client.force_login(get_user_model().objects.create(username='user'))
+
+    def call(self, method, *params):
+        response = self.client.post('/xmlrpc/client/', xmlrpc.client.dumps(params, method),
+                                    content_type='text/xml')
+        self.assertEqual(response.status_code, 200)
+        return xmlrpc.client.loads(response.content)[0][0]
+
+    def test_full_size_chunk(self):
+        content = os.urandom(UPLOAD_CHUNK_SIZE + 1)
+        checksum = hashlib.sha256(content).hexdigest()
+        self.assertEqual(self.call('client.start_upload', checksum, str(len(content)),
+                                   str(UPLOAD_CHUNK_SIZE)), [])
+
+        for index in range(2):
+            chunk = content[index * UPLOAD_CHUNK_SIZE:(index + 1) * UPLOAD_CHUNK_SIZE]
+            self.call('client.upload_chunk', checksum, index,
+                      hashlib.sha256(chunk).hexdigest(), xmlrpc.client.Binary(chunk))
+
+        self.assertIsNotNone(self.call('client.finish_upload', 'units-2.22-5.el9.src.rpm', checksum))
+        # the stored file is reused without uploading it again
+        self.assertIsNotNone(self.call('client.find_upload', 'units-2.22-5.el9.src.rpm', checksum,
+                                       str(len(content))))
+
+
+class ScanListTestSuite(TestCase):
+    def setUp(self):
+        fixture_path = pathlib.Path(__file__).parents[1] / 'waiving/fixtures/initial_test_data.json'
+        call_command('loaddata', fixture_path, verbosity=0)
+
+        # scans submitted at the same time are ordered by ID
+        scan = Scan.objects.get(id=1)
+        for nvr in ('units-2.22-1.el9', 'units-2.22-2.el9', 'units-2.22-3.el9'):
+            scan.pk = None
+            scan.nvr = nvr
+            scan.save()
+        Scan.objects.exclude(id=1).update(date_submitted=datetime.datetime(2030, 1, 1))
+
+    def test_filtered_scan_list(self):
+        result = get_filtered_scan_list(None, {})
+        self.assertEqual(result['count'], 4)
+        scan = result['scans'][0]
+        self.assertEqual(scan['target'], 'units-2.22-3.el9')
+        self.assertIn('owner_name', scan)
+        self.assertIn('release', scan)
+        self.assertNotIn('nvr', scan)
+
+    def test_pages(self):
+        page = get_scan_list_page(None, {}, limit=3, count=True)
+        self.assertEqual(page['count'], 4)
+        self.assertEqual([s['target'] for s in page['scans']],
+                         ['units-2.22-3.el9', 'units-2.22-2.el9', 'units-2.22-1.el9'])
+        self.assertIsNotNone(page['cursor'])
+
+        last = get_scan_list_page(None, {}, page['cursor'], limit=3)
+        self.assertNotIn('count', last)
+        self.assertEqual([s['scan_id'] for s in last['scans']], [1])
+        self.assertIsNone(last['cursor'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(get_scan_list_page(None, {}, 'foo')['status'], 'ERROR')
+
+
+class WatchTasksTestSuite(TestCase):
+    @override_settings(TASK_WATCH_MAX_WAITERS=0)
+    @patch('osh.hub.service.task_watch.time.sleep', side_effect=AssertionError('waiting'))
+    def test_busy_hub(self, _):
+        # nothing changed, but the hub does not wait as others wait already
+        changes = watch_tasks(None, [1], '', 5)
+        self.assertEqual(changes['tasks'], [])
+
+
+class JSONRPCTestSuite(TestCase):
+    def call(self, method, params, **headers):
+        body = json.dumps({'jsonrpc': '2.0', 'id': 7, 'method': method, 'params': params}).encode()
+        if headers.get('HTTP_CONTENT_ENCODING') == 'gzip':
+            body = gzip.compress(body)
+        return self.client.post(reverse('jsonrpc', args=['client']), body,
+                                content_type='application/json', **headers)
+
+    def test_call(self):
+        response = self.call('scan.find_tasks', [{'regex': '.'}])
+        self.assertEqual(response.json(), {'jsonrpc': '2.0', 'id': 7, 'result': []})
+
+    @patch('osh.hub.osh_xmlrpc.jsonrpc.GZIP_MIN_SIZE', 0)
+    def test_compression(self):
+        response = self.call('scan.find_tasks', [{'regex': '.'}],
+                             HTTP_CONTENT_ENCODING='gzip', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['result'], [])
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_decompression_limit(self):
+        # the request itself is small, but its content is not
+        response = self.call('scan.find_tasks', [{'regex': 'a' * 2048}],
+                             HTTP_CONTENT_ENCODING='gzip')
+        error = response.json()['error']
+        self.assertEqual(error['code'], -32700)
+        self.assertIn('exceeds 1024 bytes', error['message'])
+
+        body = gzip.compress(b'{"jsonrpc": "2.0", "id": 7, "method": "scan.find_tasks"}')
+        response = self.client.post(reverse('jsonrpc', args=['client']), body[:-10],
+                                    content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.json()['error']['code'], -32700)
+
+    def test_errors(self):
+        error = self.call('scan.no_such_method', []).json()['error']
+        self.assertEqual(error['code'], 1)
+        self.assertIn('is not supported', error['message'])
+
+        response = self.client.post(reverse('jsonrpc', args=['client']), b'{',
+                                    content_type='application/json')
+        self.assertEqual(response.json()['error']['code'], -32700)
+
+    def test_not_served(self):
+        self.assertEqual(self.client.get(reverse('jsonrpc', args=['client'])).status_code, 405)
+        self.assertEqual(self.client.post(reverse('jsonrpc', args=['foo'])).status_code, 404)
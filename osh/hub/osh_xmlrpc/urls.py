@@ -3,8 +3,16 @@
 
 import kobo.django.upload.views
 import kobo.django.xmlrpc.views
+from django.conf import settings
 from django.urls import path
 
+from osh.hub.osh_xmlrpc.jsonrpc import jsonrpc_handler
+from osh.hub.other.instrumentation import instrument_dispatcher
+
+# record latency and DB queries of each XML-RPC method
+for handler in settings.XMLRPC_METHODS:
+    instrument_dispatcher(getattr(kobo.django.xmlrpc.views, f'{handler}_handler').xmlrpc_dispatcher)
+
 urlpatterns = [
     # customize the index XML-RPC page if needed:
     # path("/", "django.views.generic.simple.direct_to_template", kwargs={"template": "xmlrpc_help.html"}, name="help/xmlrpc"),
@@ -15,4 +23,6 @@ urlpatterns = [
          name="help/xmlrpc/worker"),
     path("kerbauth/", kobo.django.xmlrpc.views.kerbauth_handler,
          name="help/xmlrpc/kerbauth"),
+    # the same methods over JSON-RPC
+    path("json/<str:handler>/", jsonrpc_handler, name="jsonrpc"),
 ]
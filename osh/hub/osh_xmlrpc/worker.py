@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import datetime
 import logging
 import os
 import shutil
@@ -13,18 +14,26 @@ from kobo.hub.decorators import validate_worker
 from kobo.hub.models import Task
 from kobo.hub.xmlrpc.worker import open_task as kobo_open_task
 
+from osh.common.constants import BASE_SCAN_SEPARATE_WORKERS
+from osh.hub.scan.coalesce import resolve_coalesced_tasks
 from osh.hub.scan.mock import generate_mock_configs
 from osh.hub.scan.models import (SCAN_STATES, AnalyzerVersion, AppSettings,
-                                 Profile, Scan, ScanBinding)
+                                 Profile, Scan, ScanBinding, TaskPackage)
 from osh.hub.scan.notify import send_task_notification
 from osh.hub.scan.scanner import (move_mock_configs, obtain_base,
                                   prepare_base_scan)
+from osh.hub.scan.scheduling import (PoolState, PriorityPolicy, QueuedTask,
+                                     get_scheduling_policy)
 from osh.hub.scan.xmlrpc_helper import cancel_scan
 from osh.hub.scan.xmlrpc_helper import fail_scan as h_fail_scan
 from osh.hub.scan.xmlrpc_helper import finish_scan as h_finish_scan
 from osh.hub.scan.xmlrpc_helper import (prepare_version_retriever,
                                         scan_notification_email)
+from osh.hub.service.artifacts import precompress_task_artifacts
 from osh.hub.service.csmock_parser import unpack_and_return_api
+from osh.hub.service.disk_usage import update_disk_usage
+from osh.hub.service.path import TaskResultPaths
+from osh.hub.service.upload import ChunkedUpload, keep_upload
 from osh.hub.waiving.results_loader import TaskResultsProcessor
 
 logger = logging.getLogger(__name__)
@@ -33,24 +42,34 @@ logger = logging.getLogger(__name__)
 # methods from this module.
 __all__ = [
     'create_mock_configs',
+    'cancel_subtasks',
     'cancel_task',
+    'close_task',
     'create_sb',
+    'create_subtask',
     'email_scan_notification',
     'email_task_notification',
     'ensure_base_is_scanned_properly',
     'ensure_cache',
     'fail_scan',
     'fail_task',
+    'finish_results_upload',
     'finish_analyzers_version_retrieval',
     'finish_scan',
     'finish_task',
+    'get_base_scan_mode',
+    'get_json_results_path',
     'get_scanning_args',
     'get_su_user',
+    'get_tasks_to_assign',
     'interrupt_tasks',
     'move_upload',
     'open_task',
     'set_scan_to_basescanning',
     'set_scan_to_scanning',
+    'start_results_upload',
+    'timeout_tasks',
+    'upload_results_chunk',
 ]
 
 
@@ -101,13 +120,17 @@ def finish_task(request, task_id):
     exclude_dirs = AppSettings.settings_get_results_tb_exclude_dirs()
     td = TaskResultsProcessor(task, base_task, exclude_dirs)
     td.unpack_results()
+    diffed = None
     if base_task:
         try:
-            return td.generate_diffs()
+            diffed = td.generate_diffs()
         except RuntimeError as ex:
             logger.error("Can't diff tasks %s %s: %s", base_task, task, ex)
             if not task.is_failed():
                 task.fail_task()
+    precompress_task_artifacts(task.id)
+    update_disk_usage(task.id)
+    return diffed
 
 
 @validate_worker
@@ -128,7 +151,9 @@ def open_task(request, task_id):
         # If `max_load` is set to 0, when `VersionDiffBuild` moves to open state,
         # base scan would get assigned but never start as `max_load` has been set to 0.
         # Only set `max_load` to 0 when subtask has moved to open state.
-        if task.method != "VersionDiffBuild" or task.parent is not None:
+        # With BASE_SCAN_SEPARATE_WORKERS, the base scan does not run on this worker.
+        if task.method != "VersionDiffBuild" or task.parent is not None or \
+                settings.BASE_SCAN_MODE == BASE_SCAN_SEPARATE_WORKERS:
             # TODO: This condition would not execute if the subtask fails to reach `open` state.
             # That would cause the main task to fail.
             # And the worker would pick up another task, so it would not be a single use worker.
@@ -179,6 +204,20 @@ def finish_analyzers_version_retrieval(request, task_id, filename):
             task.fail_task()
 
 
+@validate_worker
+def get_base_scan_mode(request):
+    """ how bases of differential scans are scanned, see BASE_SCAN_* constants """
+    return settings.BASE_SCAN_MODE
+
+
+@validate_worker
+def get_json_results_path(request, task_id):
+    """ path of JSON results of a finished task relative to its directory """
+    task = Task.objects.get(id=task_id)
+    paths = TaskResultPaths(task)
+    return os.path.relpath(paths.get_json_results(), paths.task_dir)
+
+
 @validate_worker
 def get_su_user(request):
     return AppSettings.setting_get_su_user()
@@ -211,10 +250,44 @@ def move_upload(request, task_id, upload_id):
     """ child task's srpm is uploaded, move it to task's dir """
     task_dir = Task.get_task_dir(task_id, create=True)
     upload = FileUpload.objects.get(id=upload_id)
+    keep_upload(upload)
     shutil.move(os.path.join(upload.target_dir, upload.name), os.path.join(task_dir, upload.name))
     upload.delete()
 
 
+def _get_open_task(request, task_id):
+    task = Task.objects.get_and_verify(task_id=task_id, worker=request.worker)
+    if task.state != TASK_STATES['OPEN']:
+        raise ValueError(f"Can't upload file for a task which is not OPEN: {task_id}")
+    return task
+
+
+@validate_worker
+def start_results_upload(request, task_id, filename, size, checksum, chunk_size):
+    """
+    Start or resume chunked upload of task results, return indexes of chunks
+    which were already received.  Sizes are passed as strings because they
+    may not fit into XML-RPC integers.
+    """
+    _get_open_task(request, task_id)
+    return ChunkedUpload(task_id, filename).start(int(size), checksum, int(chunk_size))
+
+
+@validate_worker
+def upload_results_chunk(request, task_id, filename, index, checksum, encoded_chunk):
+    """ store a chunk of task results and return the uploaded percentage """
+    _get_open_task(request, task_id)
+    return ChunkedUpload(task_id, filename).write_chunk(index, checksum, encoded_chunk)
+
+
+@validate_worker
+def finish_results_upload(request, task_id, filename):
+    """ verify uploaded task results and move them to the task directory """
+    _get_open_task(request, task_id)
+    ChunkedUpload(task_id, filename).finish()
+    return True
+
+
 @validate_worker
 def create_sb(request, task_id):
     task = Task.objects.get(id=task_id)
@@ -225,12 +298,16 @@ def create_sb(request, task_id):
 @validate_worker
 def ensure_cache(request, mock_config, profile):
     """
-    make sure that cache with version of analyzers is not stale
+    make sure that cache with version of analyzers is populated
+
+    The cache is refreshed from results of finished scans and stale entries
+    are refreshed by osh-refresh-analyzer-versions, so a scan only waits for
+    a version retriever if there are no data for the mock profile at all.
     """
     if mock_config == 'rhel-9-beta-x86_64':
         # FIXME: hard-coded at two places for now
         mock_config = 'rhel-9-alpha-x86_64'
-    if not AnalyzerVersion.objects.is_cache_uptodate(mock_config):
+    if not AnalyzerVersion.objects.has_cached_versions(mock_config):
         profile = Profile.objects.get(name=profile)
         analyzers = profile.analyzers
         csmock_args = profile.csmock_args
@@ -284,6 +361,17 @@ def ensure_base_is_scanned_properly(request, scan_id, task_id):
     scan.set_base(base_scan)
 
 
+@validate_worker
+def create_subtask(request, label, method, args, parent_id, subtask_priority=None,
+                   inherit_worker=False):
+    task_id = kobo_xmlrpc_worker.create_subtask(request, label, method, args, parent_id,
+                                                subtask_priority, inherit_worker)
+
+    # subtasks scan packages too, e.g. the base of a diff build
+    TaskPackage.objects.index_task(Task.objects.get(id=task_id))
+    return task_id
+
+
 @validate_worker
 def cancel_task(request, task_id):
     response = kobo_xmlrpc_worker.cancel_task(request, task_id)
@@ -293,6 +381,16 @@ def cancel_task(request, task_id):
     if sb is not None:
         cancel_scan(sb)
 
+    resolve_coalesced_tasks(request, Task.objects.get(id=task_id))
+    return response
+
+
+@validate_worker
+def close_task(request, task_id, task_result):
+    response = kobo_xmlrpc_worker.close_task(request, task_id, task_result)
+
+    # hand the results over to tasks coalesced with this one
+    resolve_coalesced_tasks(request, Task.objects.get(id=task_id))
     return response
 
 
@@ -305,9 +403,65 @@ def fail_task(request, task_id, task_result):
     if sb is not None and sb.scan.state != SCAN_STATES['FAILED']:
         fail_scan(request, sb.scan.id, 'Unspecified failure')
 
+    # a base scan running concurrently is of no use anymore
+    task = Task.objects.get(id=task_id)
+    _cancel_unfinished_subtasks(task)
+
+    resolve_coalesced_tasks(request, task)
     return response
 
 
+def _cancel_unfinished_subtasks(task):
+    """ cancel subtasks of the task together with their scans """
+    for subtask in task.subtasks():
+        if subtask.is_finished():
+            continue
+        try:
+            sb = ScanBinding.objects.filter(task=subtask).first()
+            if sb is not None:
+                cancel_scan(sb)
+            else:
+                subtask.cancel_task()
+        except Exception as ex:
+            logger.error('Cannot cancel subtask %d: %s', subtask.id, ex)
+
+
+@validate_worker
+def cancel_subtasks(request, task_id):
+    """ cancel unfinished subtasks, e.g. a base scan the task no longer needs """
+    task = Task.objects.get_and_verify(task_id=task_id, worker=request.worker)
+    _cancel_unfinished_subtasks(task)
+
+
+@validate_worker
+def get_tasks_to_assign(request):
+    task_list = kobo_xmlrpc_worker.get_tasks_to_assign(request)
+
+    policy = get_scheduling_policy()
+    if type(policy) is PriorityPolicy:
+        return task_list
+
+    # exclusive, awaited and already assigned tasks go first as in kobo
+    task_list = [t for t in task_list if t['exclusive'] or t['awaited'] or t['worker'] is not None]
+
+    # kobo returns only the top priority free tasks, aging needs the oldest ones too
+    worker = request.worker
+    max_tasks = max(worker.max_tasks, 10)
+    free = Task.objects.free().filter(awaited=False,
+                                      channel__in=worker.channels.all(),
+                                      arch__in=worker.arches.all(),
+                                      priority__gte=worker.min_priority) \
+        .select_related('owner', 'arch', 'channel')
+    candidates = {t.id: t for t in free.order_by('-priority', 'id')[:max_tasks]}
+    candidates.update((t.id, t) for t in free.order_by('id')[:max_tasks])
+
+    queued = [QueuedTask.from_task(t) for t in candidates.values()]
+    for task in policy.order(queued, PoolState.from_db(), datetime.datetime.now())[:max_tasks]:
+        task_list.append(candidates[task.id].export(flat=False))
+
+    return task_list
+
+
 @validate_worker
 def interrupt_tasks(request, task_list):
     response = kobo_xmlrpc_worker.interrupt_tasks(request, task_list)
@@ -318,9 +472,21 @@ def interrupt_tasks(request, task_list):
             continue
 
         sb = ScanBinding.objects.filter(task=task).first()
-        if sb is None:
-            continue
+        if sb is not None:
+            fail_scan(request, sb.scan.id, 'Task was interrupted')
+
+        # schedule one of the tasks coalesced with this one instead
+        resolve_coalesced_tasks(request, task)
 
-        fail_scan(request, sb.scan.id, 'Task was interrupted')
+    return response
+
+
+@validate_worker
+def timeout_tasks(request, task_list):
+    response = kobo_xmlrpc_worker.timeout_tasks(request, task_list)
+
+    for task_id in task_list:
+        # schedule one of the tasks coalesced with this one instead
+        resolve_coalesced_tasks(request, Task.objects.get(id=task_id))
 
     return response
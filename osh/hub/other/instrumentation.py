@@ -0,0 +1,241 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Instrumentation of XML-RPC calls and views
+
+Wall time, number of DB queries and time spent in the DB are recorded for
+each XML-RPC method and view into histograms kept by the hub process.  They
+are exposed in the Prometheus text format by metrics_view, rolling windows
+are computed by Prometheus from the cumulative counts.  Calls taking at least
+SLOW_CALL_SECONDS or SLOW_CALL_QUERIES queries are logged together with their
+most repeated SQL statements, which usually reveals N+1 query patterns.
+Long-polling calls wait on purpose, so only their queries are checked.
+"""
+
+import bisect
+import collections
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of histogram buckets
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+QUERY_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# number of the most repeated SQL statements logged for slow calls
+TOP_STATEMENTS = 5
+
+# placeholders of a variable number of values, e.g. in `id IN (%s, %s)`
+PLACEHOLDERS_RE = re.compile(r'\((?:%s, )+%s\)')
+
+# (kind, name) of calls which wait for changes, the calls which contain them
+# (e.g. the view of an XML-RPC handler) are not slow because of them either
+LONG_POLL_CALLS = {
+    ('xmlrpc', 'scan.watch_tasks'),
+    ('view', 'task/log-tail'),
+}
+
+# calls of this thread which are being executed, the innermost last
+_local = threading.local()
+
+
+def normalize_sql(sql):
+    """ make statements differing only in the number of parameters equal """
+    return PLACEHOLDERS_RE.sub('(%s, ...)', sql)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last one counts values above all the buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        """ return [(upper bound, number of values <= bound), ...] """
+        bounds = [str(b) for b in self.buckets] + ['+Inf']
+        total = 0
+        result = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class CallStats:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.errors = 0
+        self.slow = 0
+
+
+class Registry:
+    """ statistics of calls of this process by (kind, name) """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = collections.defaultdict(CallStats)
+
+    def record(self, kind, name, duration, queries, db_seconds, failed, slow):
+        with self._lock:
+            stats = self._stats[kind, name]
+            stats.duration.observe(duration)
+            stats.queries.observe(queries)
+            stats.db_seconds += db_seconds
+            stats.errors += failed
+            stats.slow += slow
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+    def render(self):
+        """ return the statistics in the Prometheus text exposition format """
+        with self._lock:
+            items = sorted(self._stats.items())
+            lines = []
+
+            for metric, attr, help_text in (
+                    ('osh_call_duration_seconds', 'duration', 'Wall time of calls'),
+                    ('osh_call_db_queries', 'queries', 'Number of DB queries per call')):
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+                for (kind, name), stats in items:
+                    labels = _format_labels(kind=kind, name=name)
+                    histogram = getattr(stats, attr)
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{{labels}}} {sum(histogram.counts)}')
+
+            for metric, attr, help_text in (
+                    ('osh_call_db_seconds_total', 'db_seconds', 'Time spent in the DB by calls'),
+                    ('osh_call_errors_total', 'errors', 'Number of failed calls'),
+                    ('osh_call_slow_total', 'slow', 'Number of calls over the thresholds')):
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+                for (kind, name), stats in items:
+                    labels = _format_labels(kind=kind, name=name)
+                    lines.append(f'{metric}{{{labels}}} {getattr(stats, attr)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _format_labels(**labels):
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in labels.items())
+
+
+class QueryCollector:
+    """ DB execute wrapper counting queries of a call and time they take """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = collections.Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.statements[normalize_sql(sql)] += 1
+
+
+class Call:
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.failed = False
+        self.long_poll = False
+
+
+@contextmanager
+def instrumented(kind, name):
+    """ record the call of the XML-RPC method or view executed in the block """
+    call = Call(kind, name)
+    calls = _local.__dict__.setdefault('calls', [])
+    calls.append(call)
+    collector = QueryCollector()
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(collector):
+            yield call
+    except Exception:
+        call.failed = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        calls.pop()
+        if (call.kind, call.name) in LONG_POLL_CALLS:
+            call.long_poll = True
+        if call.long_poll:
+            for outer in calls:
+                outer.long_poll = True
+
+        slow = (duration >= settings.SLOW_CALL_SECONDS and not call.long_poll) \
+            or collector.count >= settings.SLOW_CALL_QUERIES
+        registry.record(call.kind, call.name, duration, collector.count,
+                        collector.seconds, call.failed, slow)
+        if slow:
+            top = ''.join(f'\n  {count}x {sql}'
+                          for sql, count in collector.statements.most_common(TOP_STATEMENTS))
+            logger.warning('Slow %s %s: %.3f s, %d queries (%.3f s in DB), most repeated:%s',
+                           call.kind, call.name, duration, collector.count,
+                           collector.seconds, top)
+
+
+def instrument_dispatcher(dispatcher):
+    """ record calls of methods dispatched by the XML-RPC dispatcher of kobo """
+    dispatch = dispatcher._dispatch
+    if getattr(dispatch, 'instrumented', False):
+        return
+
+    @functools.wraps(dispatch)
+    def _dispatch(method, params):
+        # do not let unknown methods bloat the metrics
+        name = method if method in dispatcher.funcs else 'unknown'
+        with instrumented('xmlrpc', name):
+            return dispatch(method, params)
+
+    _dispatch.instrumented = True
+    dispatcher._dispatch = _dispatch
+
+
+class InstrumentationMiddleware:
+    """ record calls of views """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with instrumented('view', 'unresolved') as call:
+            response = self.get_response(request)
+            match = request.resolver_match
+            if match is not None:
+                call.name = match.view_name
+            call.failed = response.status_code >= 500
+        return response
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
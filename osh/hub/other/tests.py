@@ -0,0 +1,61 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""`osh.hub.other` tests."""
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from kobo.hub.models import Task
+
+from osh.hub.other.instrumentation import (Histogram, instrumented,
+                                           normalize_sql, registry)
+
+
+class InstrumentationTestSuite(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def test_normalize_sql(self):
+        self.assertEqual(normalize_sql('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+                         'SELECT * FROM t WHERE id IN (%s, ...)')
+        self.assertEqual(normalize_sql('SELECT * FROM t WHERE id = %s'),
+                         'SELECT * FROM t WHERE id = %s')
+
+    def test_histogram(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative_counts(), [('1', 2), ('5', 3), ('+Inf', 4)])
+        self.assertEqual(histogram.sum, 14)
+
+    @override_settings(SLOW_CALL_QUERIES=2)
+    def test_slow_call(self):
+        with self.assertLogs('osh.hub.other.instrumentation', 'WARNING') as cm:
+            with instrumented('xmlrpc', 'client.foo'):
+                for task_id in (1, 2):
+                    Task.objects.filter(id=task_id).exists()
+        self.assertIn('Slow xmlrpc client.foo', cm.output[0])
+        self.assertIn('2x SELECT', cm.output[0])
+
+    @override_settings(SLOW_CALL_SECONDS=0)
+    def test_long_poll(self):
+        with self.assertNoLogs('osh.hub.other.instrumentation', 'WARNING'):
+            with instrumented('view', 'xmlrpc/client'):
+                with instrumented('xmlrpc', 'scan.watch_tasks'):
+                    pass
+        with self.assertLogs('osh.hub.other.instrumentation', 'WARNING'):
+            with instrumented('view', 'xmlrpc/client'):
+                with instrumented('xmlrpc', 'scan.find_tasks'):
+                    pass
+
+    def test_metrics(self):
+        call = {'method': 'scan.find_tasks', 'params': [{'regex': '.'}]}
+        self.client.post(reverse('jsonrpc', args=['client']), call,
+                         content_type='application/json')
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('osh_call_duration_seconds_count{kind="xmlrpc",name="scan.find_tasks"} 1',
+                      metrics)
+        self.assertIn('osh_call_db_queries_count{kind="view",name="jsonrpc"} 1', metrics)
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(response.status_code, 403)
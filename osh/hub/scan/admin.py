@@ -11,7 +11,8 @@ from django.utils.safestring import mark_safe
 from kobo.hub.models import TASK_STATES, Task
 
 from osh.hub.other.autoregister import OSHModelAdmin, autoregister_app_admin
-from osh.hub.scan.models import SCAN_STATES, Scan, ScanBinding
+from osh.hub.scan.models import (DISK_USAGE_GROUPS, SCAN_STATES, Scan,
+                                 ScanBinding, TaskDiskUsage)
 from osh.hub.scan.notify import send_scan_notification
 from osh.hub.scan.xmlrpc_helper import cancel_scan as h_cancel_scan
 from osh.hub.scan.xmlrpc_helper import cancel_scan_tasks
@@ -37,7 +38,7 @@ class LogEntryAdmin(OSHModelAdmin):
         return False
 
 
-autoregister_app_admin('scan', exclude_models=[Scan])
+autoregister_app_admin('scan', exclude_models=[Scan, TaskDiskUsage])
 
 
 @admin.register(Scan)
@@ -61,7 +62,7 @@ class ScanAdmin(OSHModelAdmin):
             'title': 'Notify: %s' % scan.nvr,
             'object': scan,
             'opts': self.model._meta,
-            'result': mark_safe("Number of e-mails sent: <b>%s</b>" % result),
+            'result': mark_safe("Number of e-mails queued: <b>%s</b>" % result),
             'app_label': self.model._meta.app_label,
         }
         return render(request, 'admin/scan/scan/state_change.html', context)
@@ -112,3 +113,28 @@ class ScanAdmin(OSHModelAdmin):
             'app_label': self.model._meta.app_label,
         }
         return render(request, 'admin/scan/scan/state_change.html', context)
+
+
+@admin.register(TaskDiskUsage)
+class TaskDiskUsageAdmin(OSHModelAdmin):
+    def get_urls(self):
+        urls = super().get_urls()
+        my_urls = [
+            path('top/', self.admin_site.admin_view(self.top_consumers)),
+        ]
+        return my_urls + urls
+
+    def top_consumers(self, request):
+        group_by = request.GET.get('group_by')
+        if group_by not in DISK_USAGE_GROUPS:
+            group_by = 'package'
+
+        context = {
+            'title': 'Top disk consumers per %s' % group_by,
+            'opts': self.model._meta,
+            'app_label': self.model._meta.app_label,
+            'groups': DISK_USAGE_GROUPS,
+            'group_by': group_by,
+            'consumers': TaskDiskUsage.objects.top_consumers(group_by),
+        }
+        return render(request, 'admin/scan/taskdiskusage/top_consumers.html', context)
@@ -0,0 +1,71 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Background refresh of the cache with versions of analyzers
+
+The cache is updated from results of each finished errata scan.  Mock profiles
+which did not get any scan for longer than ANALYZERS_VERSIONS_CACHE_DURATION
+are refreshed here by a standalone AnalyzerVersionRetriever task, so that
+submitted scans never wait for it.
+"""
+
+import logging
+
+from kobo.client.constants import TASK_STATES
+from kobo.hub.models import Task
+
+from osh.hub.scan.models import (SCAN_TYPES_TARGET, AnalyzerVersion,
+                                 AppSettings, Profile, ScanBinding)
+from osh.hub.scan.scanner import dig_arch
+from osh.hub.scan.xmlrpc_helper import prepare_version_retriever
+
+logger = logging.getLogger(__name__)
+
+# profile used by errata scans
+ERRATA_PROFILE = 'errata'
+
+
+def is_retrieval_pending(mock_config):
+    """ is there an unfinished version retriever for the mock profile? """
+    tasks = Task.objects.filter(
+        method='AnalyzerVersionRetriever',
+        state__in=(TASK_STATES['FREE'], TASK_STATES['ASSIGNED'], TASK_STATES['OPEN']))
+    return any(task.args.get('mock_config') == mock_config for task in tasks)
+
+
+def get_task_owner(mock_config):
+    """ owner of the latest errata scan using the mock profile or None """
+    sb = ScanBinding.objects.filter(scan__tag__mock__name=mock_config,
+                                    scan__scan_type__in=SCAN_TYPES_TARGET,
+                                    task__isnull=False) \
+        .select_related('task__owner') \
+        .order_by('-id') \
+        .first()
+    return sb.task.owner.username if sb else None
+
+
+def refresh_analyzers_versions():
+    """ spawn version retrievers for stale mock profiles, return their IDs """
+    profile = Profile.objects.get(name=ERRATA_PROFILE)
+    su_user = AppSettings.setting_get_su_user()
+    task_ids = []
+
+    for mock_config in AnalyzerVersion.objects.get_stale_mock_configs():
+        if is_retrieval_pending(mock_config):
+            logger.info('Versions of analyzers for %s are already being retrieved', mock_config)
+            continue
+
+        owner = get_task_owner(mock_config)
+        if owner is None:
+            logger.info('No errata scan uses %s, not refreshing its versions of analyzers', mock_config)
+            continue
+
+        method, args, label = prepare_version_retriever(
+            mock_config, profile.analyzers, su_user, profile.csmock_args)
+        task_id = Task.create_task(owner_name=owner, label=label, method=method, args=args,
+                                   arch_name=dig_arch(mock_config))
+        logger.info('Refreshing versions of analyzers for %s in task %d', mock_config, task_id)
+        task_ids.append(task_id)
+
+    return task_ids
@@ -0,0 +1,286 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Planning of the number of single-use workers requested by osh-worker-manager
+
+Each running or queued top-level user scan (MockBuild, DiffBuild and
+VersionDiffBuild tasks) needs its own single-use worker.  The predictive
+planner additionally requests workers for tasks expected to arrive to each
+pool (architecture and channel) before newly requested workers boot, keeps
+a pool of warm workers and applies hysteresis, so that the number of workers
+does not oscillate.  Arrival rates per hour of the day and durations
+of tasks per package and method are learned from the task history.
+
+Planners only work with QueuedTask instances, so that they can be evaluated on
+historical data by simulate_autoscaling() as well.
+"""
+
+import datetime
+import heapq
+import json
+import logging
+import math
+import statistics
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from kobo.hub.models import Task
+
+from osh.hub.scan.scheduling import QueuedTask, load_task_history
+
+logger = logging.getLogger(__name__)
+
+# duration of tasks without any history, in seconds
+DEFAULT_DURATION = 30 * 60
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# methods of user scans run on single-use workers
+SCALED_METHODS = ('MockBuild', 'DiffBuild', 'VersionDiffBuild')
+
+
+def get_pool(task):
+    return task.arch, task.channel
+
+
+class DurationEstimator:
+    """ median duration of finished tasks per package and method """
+    def __init__(self, history, default=DEFAULT_DURATION):
+        per_package = defaultdict(list)
+        per_method = defaultdict(list)
+        for task, duration in history:
+            per_package[task.package, task.method].append(duration)
+            per_method[task.method].append(duration)
+
+        self.per_package = {k: statistics.median(v) for k, v in per_package.items()}
+        self.per_method = {k: statistics.median(v) for k, v in per_method.items()}
+        self.default = default
+
+    def estimate(self, task):
+        """ expected duration of the task in seconds """
+        try:
+            return self.per_package[task.package, task.method]
+        except KeyError:
+            return self.per_method.get(task.method, self.default)
+
+
+class ArrivalForecast:
+    """ average number of tasks submitted per pool and hour of the day """
+    def __init__(self, history, days):
+        counts = Counter((get_pool(task), task.dt_created.hour) for task, _ in history)
+        # {(pool, hour): tasks per hour}
+        self.rates = {k: count / days for k, count in counts.items()}
+        self.pools = {pool for pool, _ in counts}
+
+    def expected(self, pool, now, minutes):
+        """ number of tasks expected to arrive to the pool in the next minutes """
+        return self.rates.get((pool, now.hour), 0) * minutes / 60
+
+
+class LegacyPlanner:
+    """ one worker for each running or queued task """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+
+    def plan(self, queue, running, now, state):
+        """
+        Return the number of workers needed and the state to be passed to the
+        next call.
+        """
+        return min(len(running) + len(queue), self.max_workers), state
+
+
+class PredictivePlanner(LegacyPlanner):
+    """
+    warm_pool -- minimal number of idle workers
+    lead_time -- minutes it takes to start a new worker
+    scale_up_threshold -- start workers once at least this many are missing
+    scale_down_delay -- minutes the demand has to stay lower before workers
+                        are released
+    """
+    def __init__(self, max_workers, estimator, forecast, warm_pool=0, lead_time=5,
+                 scale_up_threshold=1, scale_down_delay=15):
+        super().__init__(max_workers)
+        self.estimator = estimator
+        self.forecast = forecast
+        self.warm_pool = warm_pool
+        self.lead_time = lead_time
+        self.scale_up_threshold = scale_up_threshold
+        self.scale_down_delay = scale_down_delay
+
+    def demand(self, queue, running, now):
+        """ {pool: workers} needed by current tasks and tasks about to arrive """
+        demand = Counter(get_pool(task) for task in running + queue)
+        for pool in self.forecast.pools | set(demand):
+            expected = self.forecast.expected(pool, now, self.lead_time)
+            demand[pool] += math.floor(expected + 0.5)
+        return demand
+
+    def expected_wait(self, queue, running, workers, now):
+        """
+        Estimate how long the last queued task waits, in seconds, if only the
+        given number of workers is available.
+        """
+        free = workers - len(running)
+        waiting = sorted(queue, key=lambda t: (-t.priority, t.id))[max(0, free):]
+        if not waiting:
+            return 0
+
+        # a worker is released and replaced by a new one once its task finishes
+        released = [max(now, t.dt_started + datetime.timedelta(seconds=self.estimator.estimate(t)))
+                    for t in running]
+        if not released:
+            return None
+        heapq.heapify(released)
+        for task in waiting:
+            start = heapq.heappop(released) + datetime.timedelta(minutes=self.lead_time)
+            heapq.heappush(released, start + datetime.timedelta(seconds=self.estimator.estimate(task)))
+        return (start - task.dt_created).total_seconds()
+
+    def plan(self, queue, running, now, state):
+        demand = self.demand(queue, running, now)
+        busy = len(running) + len(queue)
+        predicted = sum(demand.values()) - busy
+        wanted = min(self.max_workers, busy + max(self.warm_pool, predicted))
+
+        target = state.get('target', 0)
+        low_since = state.get('low_since')
+        if wanted > target:
+            if wanted - target >= self.scale_up_threshold or busy > target:
+                target = wanted
+            low_since = None
+        elif wanted < target:
+            if low_since is None:
+                low_since = now.strftime(TIME_FORMAT)
+            elif now - datetime.datetime.strptime(low_since, TIME_FORMAT) \
+                    >= datetime.timedelta(minutes=self.scale_down_delay):
+                target = wanted
+                low_since = None
+        else:
+            low_since = None
+
+        # never release workers which are needed right now
+        target = max(target, min(busy, self.max_workers))
+        return target, {'target': target, 'low_since': low_since}
+
+
+def load_scaled_history(since, until=None):
+    """ load_task_history() of the scans run on single-use workers """
+    history = load_task_history(since, until)
+    return [(task, duration) for task, duration in history if task.method in SCALED_METHODS]
+
+
+def get_planner(history_days=14, **options):
+    """ instantiate the planner configured in settings """
+    max_workers = settings.MAX_SINGLE_USE_WORKERS
+    if not settings.ENABLE_PREDICTIVE_AUTOSCALING:
+        return LegacyPlanner(max_workers)
+
+    history = load_scaled_history(datetime.datetime.now() - datetime.timedelta(days=history_days))
+    return PredictivePlanner(max_workers, DurationEstimator(history),
+                             ArrivalForecast(history, history_days), **options)
+
+
+def load_state():
+    try:
+        with open(settings.AUTOSCALING_STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    with open(settings.AUTOSCALING_STATE_FILE, 'w') as f:
+        json.dump(state, f)
+
+
+def get_current_tasks():
+    """ return queued and running top-level scans as lists of QueuedTask """
+    # subtasks run on the worker of their parent
+    free = Task.objects.free().filter(parent=None, method__in=SCALED_METHODS) \
+        .select_related('owner', 'arch', 'channel')
+    running = Task.objects.running().filter(parent=None, method__in=SCALED_METHODS) \
+        .select_related('owner', 'arch', 'channel')
+    return [QueuedTask.from_task(t) for t in free], [QueuedTask.from_task(t) for t in running]
+
+
+class SimulationReport:
+    def __init__(self, waits, worker_seconds, not_started):
+        # [seconds, ...] for each started task
+        self.waits = waits
+        self.worker_hours = worker_seconds / 3600
+        self.not_started = not_started
+
+    def percentile(self, fraction):
+        if not self.waits:
+            return 0
+        values = sorted(self.waits)
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def simulate_autoscaling(history, planner, lead_time=5, interval=60):
+    """
+    Replay tasks on single-use workers scaled by the planner, which is asked
+    every `interval` seconds.  New workers are ready after `lead_time` minutes.
+
+    history -- list of (QueuedTask, duration in seconds) pairs
+    """
+    durations = {task.id: duration for task, duration in history}
+    arrivals = sorted((task for task, _ in history), key=lambda t: (t.dt_created, t.id))
+    if not arrivals:
+        return SimulationReport([], 0, 0)
+
+    step = datetime.timedelta(seconds=interval)
+    boot = datetime.timedelta(minutes=lead_time)
+    deadline = arrivals[-1].dt_created + datetime.timedelta(days=1)
+
+    # [datetime of creation, ...] of workers without a task
+    idle = []
+    # [(datetime of finish, datetime of worker creation, task), ...]
+    running = []
+    queue = []
+    waits = []
+    worker_seconds = 0
+    state = {}
+    now = arrivals[0].dt_created
+    next_arrival = 0
+
+    while next_arrival < len(arrivals) or queue or running:
+        if now > deadline:
+            break
+
+        for entry in [e for e in running if e[0] <= now]:
+            running.remove(entry)
+            worker_seconds += (entry[0] - entry[1]).total_seconds()
+
+        while next_arrival < len(arrivals) and arrivals[next_arrival].dt_created <= now:
+            queue.append(arrivals[next_arrival])
+            next_arrival += 1
+
+        target, state = planner.plan(queue, [e[2] for e in running], now, state)
+        missing = target - len(idle) - len(running)
+        if missing > 0:
+            idle.extend([now] * missing)
+        elif missing < 0:
+            # release the workers created last, they might not be ready yet
+            idle.sort()
+            for created in idle[missing:]:
+                worker_seconds += (now - created).total_seconds()
+            del idle[missing:]
+
+        queue.sort(key=lambda t: (-t.priority, t.id))
+        ready = sorted(created for created in idle if created + boot <= now)
+        while ready and queue:
+            created = ready.pop(0)
+            idle.remove(created)
+            task = queue.pop(0)
+            task.dt_started = now
+            waits.append((now - task.dt_created).total_seconds())
+            running.append((now + datetime.timedelta(seconds=durations[task.id]), created, task))
+
+        now += step
+
+    for created in idle:
+        worker_seconds += (now - created).total_seconds()
+    return SimulationReport(waits, worker_seconds, len(arrivals) - len(waits))
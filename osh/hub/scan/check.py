@@ -11,7 +11,7 @@ import os
 
 import koji
 from django.core.exceptions import ObjectDoesNotExist
-from kobo.django.upload.models import FileUpload
+from kobo.django.upload.models import UPLOAD_STATES, FileUpload
 from kobo.rpmlib import parse_nvr
 
 from osh.hub.other.exceptions import PackageBlockedException
@@ -88,7 +88,8 @@ def is_container_build(nvr, koji_profile):
 
 def check_upload(upload_id, task_user, is_tarball=False):
     """
-    srpm was uploaded via FileUpload, lets fetch it and check it
+    srpm was uploaded via FileUpload, lets fetch it and check it; uploads of
+    files reused from the store of the user are finished FileUploads too
 
     return (nvr, filename, path to srpm)
     """
@@ -100,6 +101,9 @@ def check_upload(upload_id, task_user, is_tarball=False):
     if upload.owner.username != task_user:
         raise RuntimeError("Can't process a file uploaded by a different user")
 
+    if upload.state != UPLOAD_STATES['FINISHED']:
+        raise RuntimeError("Upload of %s is not finished" % upload.name)
+
     srpm_path = os.path.join(upload.target_dir, upload.name)
     srpm_name = upload.name
     nvr = ''
@@ -0,0 +1,210 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Coalescing of duplicate user scan submissions
+
+If ENABLE_SCAN_COALESCING is set, a user scan with the same inputs (build,
+mock config, analyzers, profile and csmock arguments) as a scan which is still
+queued or running is not scheduled on a worker.  It is attached to the running
+task instead and receives a copy of its results once it finishes.  A recent
+successful result is reused directly if it was produced by analyzers of the
+versions that are currently cached for the mock config.
+
+Each submitter still gets a task of their own, including the notification.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from django.conf import settings
+from django.db import transaction
+from kobo.client.constants import TASK_STATES
+from kobo.hub.models import Task
+
+from osh.hub.scan.models import AnalyzerVersion, ClientAnalyzer, CoalescedTask
+from osh.hub.scan.notify import send_task_notification
+from osh.hub.service.csmock_parser import CsmockAPI
+from osh.hub.service.path import TaskResultPaths
+
+logger = logging.getLogger(__name__)
+
+# task arguments which determine results of a scan
+DIGEST_ARGS = (
+    'analyzers',
+    'build',
+    'csmock_args',
+    'dist_git_url',
+    'mock_config',
+    'profile',
+    'source',
+)
+
+# inputs uploaded by the user cannot be compared by name
+UNCOMPARABLE_ARGS = (
+    'custom_model_name',
+    'srpm_name',
+    'upload_id',
+)
+
+
+def _canonicalize_args(args):
+    """ return None if the scan inputs cannot be compared """
+    if any(args.get(key) for key in UNCOMPARABLE_ARGS):
+        return None
+
+    canonical = {key: args[key] for key in DIGEST_ARGS if args.get(key)}
+    if 'analyzers' in canonical:
+        # the analyzer chain is built from a set, so the order is random
+        analyzers = ClientAnalyzer.chain_to_list(canonical['analyzers'])
+        canonical['analyzers'] = sorted(a for a in analyzers if a)
+    return canonical
+
+
+def compute_input_digest(method, args):
+    """
+    Return a hash of canonicalized inputs of a scan or None if the scan is not
+    eligible for coalescing
+    """
+    canonical = _canonicalize_args(args)
+    if canonical is None:
+        return None
+
+    data = {'method': method, 'args': canonical}
+
+    base_task_args = args.get('base_task_args')
+    if base_task_args:
+        base_method, base_args, _ = base_task_args
+        base_canonical = _canonicalize_args(base_args)
+        if base_canonical is None:
+            return None
+        data['base'] = {'method': base_method, 'args': base_canonical}
+
+    serialized = json.dumps(data, sort_keys=True)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def analyzers_are_actual(task, mock_config):
+    """ were results of the task produced by currently cached analyzer versions? """
+    try:
+        analyzers = CsmockAPI(TaskResultPaths(task).get_json_results()).get_analyzers()
+    except (OSError, RuntimeError, ValueError):
+        return False
+
+    cached = AnalyzerVersion.objects.get_analyzer_versions_for_mockprofile(mock_config)
+    cached = {av.analyzer.name: av.version for av in cached.select_related('analyzer')}
+    if not cached or not analyzers:
+        # there is nothing to compare with
+        return False
+
+    for analyzer in analyzers:
+        if cached.get(analyzer['name'], analyzer['version']) != analyzer['version']:
+            logger.info("Version of %s changed since task %s: %s != %s", analyzer['name'],
+                        task, analyzer['version'], cached[analyzer['name']])
+            return False
+    return True
+
+
+def find_primary_task(digest, mock_config):
+    """ return a running or recently finished task with identical inputs """
+    task = CoalescedTask.objects.in_flight(digest)
+    if task is not None:
+        return task
+
+    hours = settings.SCAN_COALESCING_REUSE_HOURS
+    if not hours:
+        return None
+
+    since = datetime.datetime.now() - datetime.timedelta(hours=hours)
+    for task in CoalescedTask.objects.finished_since(digest, since)[:1]:
+        if analyzers_are_actual(task, mock_config):
+            return task
+    return None
+
+
+def coalesce_task(task):
+    """
+    Record inputs of a freshly created task and attach it to a task with
+    identical inputs if there is one.  Return the primary task or None if the
+    task has to be scheduled on its own.
+    """
+    if not settings.ENABLE_SCAN_COALESCING:
+        return None
+
+    digest = compute_input_digest(task.method, task.args)
+    if digest is None:
+        return None
+
+    primary = find_primary_task(digest, task.args['mock_config'])
+    CoalescedTask.objects.create(task=task, digest=digest, primary=primary)
+    if primary is not None:
+        logger.info("Task %s coalesced with task %s", task.id, primary.id)
+    return primary
+
+
+def _link_tree(src, dst):
+    """ hard-link (or copy if not possible) all files from src to dst """
+    for root, _, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            target = os.path.join(target_root, name)
+            if os.path.exists(target):
+                continue
+            try:
+                os.link(os.path.join(root, name), target)
+            except OSError:
+                shutil.copy2(os.path.join(root, name), target)
+
+
+def _take_over_results(task, primary):
+    task_dir = Task.get_task_dir(task.id, create=True)
+    _link_tree(Task.get_task_dir(primary.id), task_dir)
+
+    # the task has never been scheduled, pass it through the states a worker
+    # would so that kobo closes it the usual way (including logs compression)
+    with transaction.atomic():
+        task.assign_task()
+        task.open_task()
+        task.close_task(task_result=primary.result)
+    logger.info("Task %s took over results of task %s", task.id, primary.id)
+
+
+def resolve_coalesced_tasks(request, primary):
+    """
+    Hand results of the finished primary task over to the attached tasks.  If
+    the primary task has not succeeded, the oldest attached task is scheduled
+    instead and the others are attached to it.
+    """
+    if not primary.is_finished():
+        return
+
+    followers = list(CoalescedTask.objects.pending_followers(primary))
+    if not followers:
+        return
+
+    if primary.state == TASK_STATES['CLOSED']:
+        for coalesced in followers:
+            _take_over_results(coalesced.task, primary)
+            send_task_notification(request, coalesced.task_id)
+        return
+
+    new_primary = followers[0]
+    new_primary.primary = None
+    new_primary.save()
+    CoalescedTask.objects.filter(id__in=[c.id for c in followers[1:]]) \
+        .update(primary=new_primary.task)
+    new_primary.task.free_task()
+    logger.info("Task %s did not succeed, scheduling coalesced task %s instead",
+                primary.id, new_primary.task_id)
+
+
+def resolve_submitted_task(request, task_id):
+    """ results of a recently finished task may be reused right away """
+    coalesced = CoalescedTask.objects.filter(task__id=task_id, primary__isnull=False).first()
+    if coalesced is not None:
+        resolve_coalesced_tasks(request, coalesced.primary)
@@ -7,15 +7,26 @@ Created on Mon Aug 20 10:36:56 2012
 @author: ttomecek@redhat.com, kdudka@redhat.com
 
 module for sending messages using UMB (Unified Message Bus)
+
+Each message is sent to the broker by a separate thread over its own
+connection.  If ENABLE_UMB_OUTBOX is set, messages are stored in the database
+in the same transaction as the change they announce and published by
+osh-umb-publisher over a persistent connection to the broker instead.  A
+message is marked as sent once the broker accepts it, so that no message is
+lost if the broker is down or the publisher exits.
 """
 
+import json
 import logging
 import threading
 
+import django.db
 import proton
 import proton.handlers
 import proton.reactor
+from django.apps import apps
 from django.conf import settings
+from django.utils import timezone
 
 __all__ = (
     "send_message",
@@ -25,26 +36,34 @@ __all__ = (
 logger = logging.getLogger(__name__)
 
 
+def _get_model():
+    # models of the scan app import this module
+    return apps.get_model('scan', 'OutgoingBusMessage')
+
+
+def _get_ssl_domain(cert):
+    if not cert:
+        return None
+    ssl_domain = proton.SSLDomain(proton.SSLDomain.MODE_CLIENT)
+    ssl_domain.set_credentials(str(cert), str(cert), "")
+    return ssl_domain
+
+
 class UMBSender(proton.handlers.MessagingHandler):
-    def __init__(self, key, msg, topic_prefix):
+    """ send a single message over its own connection """
+    def __init__(self, topic, body):
         super().__init__()
         self.urls = settings.UMB_BROKER_URLS
         self.cert = settings.UMB_CLIENT_CERT
-        self.topic = topic_prefix + '.' + key
-        self.scan_id = msg['scan_id']
-        self.scan_state = msg['scan_state']
+        self.topic = topic
+        self.body = body
 
     def on_start(self, event):
-        ssl = proton.SSLDomain(1)
-        cert = str(self.cert)
-        ssl.set_credentials(cert, cert, "")
-        conn = event.container.connect(urls=self.urls, ssl_domain=ssl)
+        conn = event.container.connect(urls=self.urls, ssl_domain=_get_ssl_domain(self.cert))
         event.container.create_sender(conn, self.topic)
 
     def on_sendable(self, event):
-        json_msg = '{ "scan_id": %d, "scan_state": "%s" }' % (self.scan_id, self.scan_state)
-        msg = proton.Message(body=json_msg)
-        event.sender.send(msg)
+        event.sender.send(proton.Message(body=self.body))
         event.sender.close()
 
     def on_accepted(self, event):
@@ -55,32 +74,153 @@ class SenderThread(threading.Thread):
     """
     new thread that handles sending messages to broker
     """
-    def __init__(self, key, msg, topic_prefix):
+    def __init__(self, topic, body):
         threading.Thread.__init__(self)
-        self.key = key
-        self.msg = msg
-        self.topic_prefix = topic_prefix
+        self.topic = topic
+        self.body = body
 
     def run(self):
-        sender = UMBSender(self.key, self.msg, self.topic_prefix)
-        cont = proton.reactor.Container(sender)
-        cont.run()
+        proton.reactor.Container(UMBSender(self.topic, self.body)).run()
+
+
+class UMBPublisher(proton.handlers.MessagingHandler):
+    """
+    Publish due messages of the outbox every `interval` seconds over a single
+    connection with a sender link per topic.  With `once`, stop when the
+    outbox is drained.
+    """
+    def __init__(self, urls, cert=None, interval=5, batch_size=100, once=False):
+        super().__init__()
+        self.urls = urls
+        self.cert = cert
+        self.interval = interval
+        self.batch_size = batch_size
+        self.once = once
+        self.container = None
+        self.connection = None
+        self.senders = {}
+        # loaded messages waiting for credit of their sender
+        self.queue = []
+        # {delivery: message} sent but not acknowledged yet
+        self.in_flight = {}
+        self.published = 0
+
+    def on_start(self, event):
+        self.container = event.container
+        # keep reconnecting to the broker unless the outbox is drained just once
+        self.connection = event.container.connect(urls=self.urls,
+                                                  ssl_domain=_get_ssl_domain(self.cert),
+                                                  reconnect=not self.once)
+        event.container.schedule(0, self)
+
+    def on_timer_task(self, event):
+        # the connection to the database may be closed while waiting
+        django.db.close_old_connections()
+        self._load()
+        self._publish()
+
+        if self.once and not self.queue and not self.in_flight:
+            self.connection.close()
+            return
+        event.container.schedule(self.interval, self)
+
+    def _load(self):
+        if self.queue:
+            return
+        in_flight = [message.id for message in self.in_flight.values()]
+        self.queue = list(_get_model().objects.due(timezone.now())
+                          .exclude(id__in=in_flight)[:self.batch_size])
+
+    def _get_sender(self, topic):
+        sender = self.senders.get(topic)
+        if sender is None:
+            sender = self.container.create_sender(self.connection, topic)
+            self.senders[topic] = sender
+        return sender
+
+    def _publish(self):
+        waiting = []
+        for message in self.queue:
+            sender = self._get_sender(message.topic)
+            if sender.credit > 0:
+                delivery = sender.send(proton.Message(body=message.body, durable=True))
+                self.in_flight[delivery] = message
+            else:
+                waiting.append(message)
+        self.queue = waiting
+
+    def on_sendable(self, event):
+        self._publish()
+
+    def on_accepted(self, event):
+        message = self.in_flight.pop(event.delivery, None)
+        if message is None:
+            return
+
+        _get_model().objects.filter(id=message.id) \
+            .update(date_sent=timezone.now(), date_next_attempt=None)
+        self.published += 1
+
+        if not self.in_flight and not self.queue:
+            # publish the next batch right away
+            self._load()
+            self._publish()
+
+    def _record_failure(self, event, error):
+        message = self.in_flight.pop(event.delivery, None)
+        if message is None:
+            return
+
+        retried = message.record_failure(error, timezone.now(), settings.UMB_RETRY_DELAY,
+                                         settings.UMB_RETRY_MAX_DELAY,
+                                         settings.UMB_MAX_ATTEMPTS)
+        if retried:
+            logger.warning('Publishing message #%s to %s failed, retrying at %s: %s',
+                           message.id, message.topic, message.date_next_attempt, error)
+        else:
+            logger.error('Giving up publishing message #%s to %s: %s',
+                         message.id, message.topic, error)
+
+    def on_rejected(self, event):
+        self._record_failure(event, 'rejected by the broker')
+
+    def on_released(self, event):
+        self._record_failure(event, 'released by the broker')
+
+    def on_link_error(self, event):
+        logger.warning('Link to %s closed: %s', event.link.target.address,
+                       event.link.remote_condition)
+        self.senders.pop(event.link.target.address, None)
+
+    def on_disconnected(self, event):
+        # unacknowledged messages are published again after reconnection
+        if self.in_flight:
+            logger.warning('Disconnected from the broker, %d messages not acknowledged',
+                           len(self.in_flight))
+        self.in_flight.clear()
+        self.queue = []
+        if self.once:
+            event.container.stop()
 
 
 def send_message(message, key):
     """
-    this function sends specified message to broker and append specified
-        key to ROUTING_KEY
+    this function sends (or queues if ENABLE_UMB_OUTBOX is set) specified
+        message to broker and append specified key to ROUTING_KEY
     """
     tp_list = settings.UMB_TOPIC_PREFIX
     if isinstance(tp_list, str):
         # wrap string as a one-item list
         tp_list = [tp_list]
 
-    # start a separate instance of SenderThread for each topic prefix in the list
+    # send a separate message for each topic prefix in the list
+    body = json.dumps(message)
     for topic_prefix in tp_list:
-        s = SenderThread(key, message, topic_prefix)
-        s.start()
+        topic = f'{topic_prefix}.{key}'
+        if settings.ENABLE_UMB_OUTBOX:
+            _get_model().objects.create(topic=topic, body=body, date_next_attempt=timezone.now())
+        else:
+            SenderThread(topic, body).start()
 
 
 def post_qpid_message(state, etm, key):
@@ -88,3 +228,11 @@ def post_qpid_message(state, etm, key):
     logger.info('message bus: %s %s', etm, state)
     message = {'scan_id': etm.id, 'scan_state': state}
     send_message(message, key)
+
+
+def publish_messages(once=False):
+    """ publish queued messages until interrupted (or the outbox is drained) """
+    publisher = UMBPublisher(settings.UMB_BROKER_URLS, settings.UMB_CLIENT_CERT,
+                             settings.UMB_PUBLISHER_INTERVAL, settings.UMB_BATCH_SIZE, once)
+    proton.reactor.Container(publisher).run()
+    return publisher.published
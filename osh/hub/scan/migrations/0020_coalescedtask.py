@@ -0,0 +1,24 @@
+# Generated by Django 3.2.20 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_alter_task_worker'),
+        ('scan', '0019_alter_analyzer_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoalescedTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(db_index=True, help_text='SHA-256 of canonicalized scan inputs', max_length=64)),
+                ('primary', models.ForeignKey(blank=True, help_text='Task which produces results for this task; empty if the task runs on its own', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='coalesced_tasks', to='hub.task')),
+                ('task', models.OneToOneField(help_text='Task with coalescible inputs', on_delete=django.db.models.deletion.CASCADE, to='hub.task')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_alter_task_worker'),
+        ('scan', '0020_coalescedtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskDiskUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('package_name', models.CharField(db_index=True, max_length=128)),
+                ('release', models.CharField(blank=True, db_index=True, help_text='Short tag of the system release, set for errata scans only', max_length=16, null=True)),
+                ('tarball_size', models.BigIntegerField(default=0, help_text='Size of the results tarball in bytes')),
+                ('total_size', models.BigIntegerField(default=0, help_text='Size of the task directory in bytes')),
+                ('file_count', models.IntegerField(default=0)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='disk_usage', to='hub.task')),
+            ],
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.25 on 2026-10-19 01:06
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+from kobo.rpmlib import parse_nvr
+
+BATCH_SIZE = 10000
+
+NAME_VERSION_RE = re.compile(r'^(.+?)-\d')
+
+
+# copy of osh.hub.scan.scheduling.get_package_name(), the migration must not
+# change when the application code does
+def get_package_name(label):
+    """ best effort guess of the package name from a task label """
+    if label.endswith('.src.rpm'):
+        label = label[:-len('.src.rpm')]
+    try:
+        return parse_nvr(label)['name']
+    except ValueError:
+        # name and version of an upstream tarball
+        match = NAME_VERSION_RE.match(label)
+        return match.group(1) if match else label
+
+
+def forwards_func(apps, schema_editor):
+    Task = apps.get_model('hub', 'task')
+    TaskPackage = apps.get_model('scan', 'taskpackage')
+
+    # index existing tasks in batches, the task table is large
+    last_id = 0
+    while True:
+        batch = list(Task.objects.filter(id__gt=last_id).order_by('id')
+                     .values_list('id', 'label', 'args')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        packages = []
+        for task_id, label, args in batch:
+            result_filename = args.get('result_filename') if isinstance(args, dict) else None
+            name = get_package_name(result_filename or label)[:128]
+            packages.append(TaskPackage(task_id=task_id, name=name))
+        TaskPackage.objects.bulk_create(packages, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    # do not hold a single transaction while indexing all the tasks
+    atomic = False
+
+    dependencies = [
+        ('hub', '0004_alter_task_worker'),
+        ('scan', '0021_taskdiskusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskPackage',
+            fields=[
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='hub.task')),
+                ('name', models.CharField(max_length=128)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taskpackage',
+            index=models.Index(fields=['name', '-task'], name='scan_taskpa_name_53bab8_idx'),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
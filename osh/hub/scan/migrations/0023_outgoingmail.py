@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0022_taskpackage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingMail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.TextField()),
+                ('body', models.TextField()),
+                ('from_addr', models.CharField(max_length=254)),
+                ('recipients', models.JSONField(default=list)),
+                ('bcc', models.JSONField(default=list)),
+                ('headers', models.JSONField(default=dict)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_next_attempt', models.DateTimeField(blank=True, null=True)),
+                ('date_sent', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outgoingmail',
+            index=models.Index(fields=['date_sent', 'date_next_attempt'], name='scan_outgoi_date_se_1c1814_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 01:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0023_outgoingmail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingBusMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_next_attempt', models.DateTimeField(blank=True, null=True)),
+                ('date_sent', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('topic', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outgoingbusmessage',
+            index=models.Index(fields=['date_sent', 'date_next_attempt'], name='scan_outgoi_date_se_deb48e_idx'),
+        ),
+    ]
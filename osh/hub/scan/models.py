@@ -19,6 +19,7 @@ from kobo.types import Enum, EnumItem
 
 from osh.hub.other import get_or_none
 from osh.hub.scan.messaging import post_qpid_message
+from osh.hub.scan.scheduling import get_package_name
 
 logger = logging.getLogger(__name__)
 
@@ -1034,14 +1035,19 @@ class AppSettings(models.Model):
 
     @classmethod
     def settings_set_last_versions_check(cls, mock_config):
-        obj, _ = cls.objects.get_or_create(key="ANALYZERS_VERSIONS_LAST_CHECKED")
-        try:
-            value = json.loads(obj.value)
-        except TypeError:
-            value = {}
-        value[mock_config] = datetime.datetime.now().isoformat()
-        obj.value = json.dumps(value)
-        obj.save()
+        cls.objects.get_or_create(key="ANALYZERS_VERSIONS_LAST_CHECKED")
+        # the row is shared by all mock configs, lock it for the short
+        # read-modify-write so that concurrent updates do not overwrite
+        # timestamps of each other
+        with transaction.atomic():
+            obj = cls.objects.select_for_update().filter(key="ANALYZERS_VERSIONS_LAST_CHECKED").first()
+            try:
+                value = json.loads(obj.value)
+            except TypeError:
+                value = {}
+            value[mock_config] = datetime.datetime.now().isoformat()
+            obj.value = json.dumps(value)
+            obj.save()
 
     @classmethod
     def settings_get_last_versions_check(cls, mock_config=None):
@@ -1158,20 +1164,22 @@ class AnalyzerVersionManager(models.Manager):
         version_model, _ = self.get_or_create(version=version, analyzer=analyzer)
         return version_model
 
-    def get_or_create_bulk(self, analyzers, mock):
-        for analyzer in analyzers:
-            v = self.get_or_create_(analyzer['name'], analyzer['version'])
-            v.mocks.add(mock)
-
     def update_analyzers_versions(self, analyzers, mock_name):
         """ update mock profile with latest analyzer versions """
-        # has to be in one transaction because we clear all analyzers first
-        # and then populate the set with actual analyzers
+        # only the differences against the current set are written, so
+        # concurrent updates with the same versions do not block each other
         with transaction.atomic():
+            wanted = {self.get_or_create_(analyzer['name'], analyzer['version']).id
+                      for analyzer in analyzers}
             mock = MockConfig.objects.get(name=mock_name)
-            mock.analyzers.clear()
-            self.get_or_create_bulk(analyzers, mock)
-            AppSettings.settings_set_last_versions_check(mock_name)
+            current = set(mock.analyzers.values_list('id', flat=True))
+            if current - wanted:
+                mock.analyzers.remove(*(current - wanted))
+            if wanted - current:
+                mock.analyzers.add(*(wanted - current))
+        # recorded in a transaction of its own not to lock the row shared by
+        # all mock configs for the whole update
+        AppSettings.settings_set_last_versions_check(mock_name)
 
     def is_cache_uptodate(self, mock_name):
         """ according to configuration, are versions up to date, or should we check? """
@@ -1186,6 +1194,17 @@ class AnalyzerVersionManager(models.Manager):
         delta = datetime.timedelta(hours=duration)
         return last_checked + delta > now
 
+    def has_cached_versions(self, mock_name):
+        """ were versions of analyzers ever recorded for the mock profile? """
+        return AppSettings.settings_get_last_versions_check(mock_name) is not None \
+            and self.filter(mocks__name=mock_name).exists()
+
+    def get_stale_mock_configs(self):
+        """ names of enabled mock profiles with cached versions which should be checked """
+        last_checks = AppSettings.settings_get_last_versions_check() or {}
+        enabled = MockConfig.objects.filter(name__in=last_checks, enabled=True)
+        return [mock.name for mock in enabled if not self.is_cache_uptodate(mock.name)]
+
     def get_analyzer_versions_for_mockprofile(self, mock_name):
         """
         return serializable data wrt analyzers for given mock profile
@@ -1298,3 +1317,203 @@ class TaskResultsRemoval(models.Model):
     reason = models.ForeignKey(RetentionPolicySetting, on_delete=models.CASCADE,
                                help_text="Reason why the retention was applied to the task")
     date_retention_applied = models.DateTimeField(auto_now_add=True)
+
+
+# {name of the group: field of TaskDiskUsage the usage is grouped by}
+DISK_USAGE_GROUPS = {
+    'package': 'package_name',
+    'release': 'release',
+    'owner': 'task__owner__username',
+}
+
+
+class TaskDiskUsageManager(models.Manager):
+    def top_consumers(self, group_by, limit=20):
+        """
+        return [{'name', 'size', 'tarball_size', 'files', 'tasks'}, ...] for
+        the groups of tasks with the largest results
+        """
+        field = DISK_USAGE_GROUPS[group_by]
+        return list(self.values(name=models.F(field))
+                    .annotate(size=models.Sum('total_size'),
+                              tarball_size=models.Sum('tarball_size'),
+                              files=models.Sum('file_count'),
+                              tasks=models.Count('id'))
+                    .order_by('-size')[:limit])
+
+
+class TaskDiskUsage(models.Model):
+    """
+    Disk space occupied by results of a task, updated when the results are
+    unpacked, archived, restored or removed by the retention policy
+    """
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, related_name='disk_usage')
+    package_name = models.CharField(max_length=128, db_index=True)
+    release = models.CharField(max_length=16, blank=True, null=True, db_index=True,
+                               help_text="Short tag of the system release, set for errata scans only")
+    tarball_size = models.BigIntegerField(default=0, help_text="Size of the results tarball in bytes")
+    total_size = models.BigIntegerField(default=0, help_text="Size of the task directory in bytes")
+    file_count = models.IntegerField(default=0)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    objects = TaskDiskUsageManager()
+
+    def __str__(self):
+        return "%s: %d bytes" % (self.task_id, self.total_size)
+
+
+class CoalescedTaskManager(models.Manager):
+    def in_flight(self, digest):
+        """ return the task which runs a scan of the given inputs right now """
+        coalesced = self.filter(
+            digest=digest, primary__isnull=True,
+            task__state__in=(TASK_STATES['CREATED'], TASK_STATES['FREE'],
+                             TASK_STATES['ASSIGNED'], TASK_STATES['OPEN']),
+        ).order_by('task__id').first()
+        return coalesced.task if coalesced else None
+
+    def finished_since(self, digest, since):
+        """ return tasks which scanned the given inputs successfully, latest first """
+        return Task.objects.filter(
+            coalescedtask__digest=digest,
+            coalescedtask__primary__isnull=True,
+            state=TASK_STATES['CLOSED'],
+            dt_finished__gte=since,
+        ).order_by('-dt_finished')
+
+    def pending_followers(self, primary):
+        """ tasks attached to the primary task which are still waiting for results """
+        return self.filter(primary=primary, task__state=TASK_STATES['CREATED']).order_by('task__id')
+
+
+class CoalescedTask(models.Model):
+    """
+    Digest of inputs of a user scan.  Tasks with identical inputs are attached
+    to a primary task, which is the only one executed on a worker.
+    """
+    task = models.OneToOneField(Task, on_delete=models.CASCADE,
+                                help_text="Task with coalescible inputs")
+    digest = models.CharField(max_length=64, db_index=True,
+                              help_text="SHA-256 of canonicalized scan inputs")
+    primary = models.ForeignKey(Task, on_delete=models.SET_NULL, blank=True, null=True,
+                                related_name='coalesced_tasks',
+                                help_text="Task which produces results for this task; "
+                                          "empty if the task runs on its own")
+
+    objects = CoalescedTaskManager()
+
+    def __str__(self):
+        if self.primary_id:
+            return "#%s -> #%s (%s)" % (self.task_id, self.primary_id, self.digest[:12])
+        return "#%s (%s)" % (self.task_id, self.digest[:12])
+
+
+class TaskPackageManager(models.Manager):
+    def index_task(self, task):
+        """ record name of the package scanned by the task """
+        # results of the task are named by the scanned NVR or tarball
+        name = get_package_name(task.args.get('result_filename') or task.label)
+        self.update_or_create(task=task, defaults={'name': name[:128]})
+
+
+class TaskPackage(models.Model):
+    """
+    Name of the package scanned by a task, recorded when the task is created
+    so that tasks of a package can be found without matching their labels
+    """
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, primary_key=True)
+    name = models.CharField(max_length=128)
+
+    objects = TaskPackageManager()
+
+    class Meta:
+        indexes = [
+            # tasks of a package are listed from the latest one
+            models.Index(fields=['name', '-task']),
+        ]
+
+    def __str__(self):
+        return "#%s: %s" % (self.task_id, self.name)
+
+
+class OutboxManager(models.Manager):
+    def due(self, now):
+        """ messages waiting to be sent at the given time, oldest first """
+        return self.filter(date_sent__isnull=True, date_next_attempt__lte=now).order_by('id')
+
+    def remove_sent(self, days):
+        """ remove messages sent more than the given number of days ago """
+        since = datetime.datetime.now() - datetime.timedelta(days=days)
+        removed, _ = self.filter(date_sent__lt=since).delete()
+        return removed
+
+
+class OutboxMessage(models.Model):
+    """
+    Message stored in the database until a daemon sends it.  Messages which
+    could not be sent in the maximum number of attempts have no date of the
+    next attempt.
+    """
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_next_attempt = models.DateTimeField(blank=True, null=True)
+    date_sent = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    objects = OutboxManager()
+
+    class Meta:
+        abstract = True
+
+    def record_failure(self, error, now, retry_delay, max_retry_delay, max_attempts):
+        """
+        Schedule the next attempt after retry_delay seconds doubled with each
+        failed attempt.  Return False if there are no attempts left.
+        """
+        self.attempts += 1
+        self.last_error = error
+        if self.attempts >= max_attempts:
+            self.date_next_attempt = None
+        else:
+            delay = min(retry_delay * 2 ** (self.attempts - 1), max_retry_delay)
+            self.date_next_attempt = now + datetime.timedelta(seconds=delay)
+        self.save(update_fields=['attempts', 'last_error', 'date_next_attempt'])
+        return self.date_next_attempt is not None
+
+
+class OutgoingMail(OutboxMessage):
+    """
+    E-mail notification queued by the hub and sent by osh-mail-sender, see
+    osh.hub.service.mail_outbox
+    """
+    subject = models.TextField()
+    body = models.TextField()
+    from_addr = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    headers = models.JSONField(default=dict)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_sent', 'date_next_attempt']),
+        ]
+
+    def __str__(self):
+        return "#%s: %s" % (self.id, self.subject)
+
+
+class OutgoingBusMessage(OutboxMessage):
+    """
+    Message for the UMB queued by the hub and published by
+    osh-umb-publisher, see osh.hub.scan.messaging
+    """
+    topic = models.CharField(max_length=255)
+    body = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_sent', 'date_next_attempt']),
+        ]
+
+    def __str__(self):
+        return "#%s: %s" % (self.id, self.topic)
@@ -14,7 +14,9 @@ from kobo.client.constants import TASK_STATES
 from kobo.hub.models import Task
 
 from osh.hub.scan.models import SCAN_STATES, AppSettings, Scan
-from osh.hub.service.loading import get_defect_stats, load_defects
+from osh.hub.service.loading import (get_defect_stats, load_defect_stats,
+                                     load_defects, load_diff_stats)
+from osh.hub.service.mail_outbox import queue_mail
 from osh.hub.waiving.service import get_scans_new_defects_count
 
 __all__ = (
@@ -27,8 +29,10 @@ logger = logging.getLogger(__name__)
 
 
 def send_mail(message, subject, recipients, headers, bcc=None):
-    connection = get_connection(fail_silently=False)
-
+    """
+    send the e-mail, or queue it for osh-mail-sender if ENABLE_MAIL_OUTBOX is
+    set, and return number of sent or queued e-mails
+    """
     if not AppSettings.setting_send_mail():
         # mail just admins if AppSettings/SEND_MAIL is disabled
         recipients = [a[1] for a in settings.ADMINS]
@@ -38,11 +42,17 @@ def send_mail(message, subject, recipients, headers, bcc=None):
     headers["X-Application-ID"] = "OpenScanHub"
     headers["X-Hostname"] = socket.gethostname()
 
-    logger.debug('Sending e-mail to %s ...', ", ".join(recipients))
-    result = EmailMessage(subject, message, from_addr, recipients, bcc=bcc,
-                          headers=headers, connection=connection).send()
-    logger.debug("result: %d", result)
-    return result
+    if not settings.ENABLE_MAIL_OUTBOX:
+        logger.debug('Sending e-mail to %s ...', ", ".join(recipients))
+        connection = get_connection(fail_silently=False)
+        result = EmailMessage(subject, message, from_addr, recipients, bcc=bcc,
+                              headers=headers, connection=connection).send()
+        logger.debug("result: %d", result)
+        return result
+
+    mail = queue_mail(subject, message, from_addr, recipients, headers, bcc=bcc)
+    logger.debug('E-mail #%s to %s queued', mail.id, ", ".join(recipients))
+    return 1
 
 
 def get_recipient(user):
@@ -73,22 +83,33 @@ def generate_stats(task, diff_task=False, with_defects_in_patches=False):
             result_list += ["%-25s %s%d" % (checker, diff_sign, count) for checker, count in sorted_list]
             result_list.append('')
         return result_list
+    result = []
+    label = 'Defects in patches' if with_defects_in_patches else 'All defects'
+    if diff_task:
+        stats = load_diff_stats(task.id)
+        if stats is not None:
+            display_defects(result, "Added (+), Fixed (-)", stats['added'], '+')
+            display_defects(result, "", stats['fixed'], '-')
+            return '\n'.join(result)
+    else:
+        defects = load_defect_stats(task.id)
+        if defects is not None:
+            display_defects(result, label, defects)
+            return '\n'.join(result)
+
+    # counts were not precomputed (e.g. results processed by an older hub)
     try:
         defects_json = load_defects(task.id, diff_task)
     except RuntimeError:
         return ''
-    result = []
     if diff_task:
         added = get_defect_stats(defects_json['added'])
         fixed = get_defect_stats(defects_json['fixed'])
         display_defects(result, "Added (+), Fixed (-)", added, '+')
         display_defects(result, "", fixed, '-')
-    elif with_defects_in_patches:
-        defects = get_defect_stats(defects_json['defects'])
-        display_defects(result, 'Defects in patches', defects)
     else:
         defects = get_defect_stats(defects_json['defects'])
-        display_defects(result, 'All defects', defects)
+        display_defects(result, label, defects)
     return '\n'.join(result)
 
 
@@ -23,13 +23,16 @@ from osh.hub.scan.check import (check_analyzers, check_build, check_nvr,
                                 check_obsolete_scan, check_package_is_blocked,
                                 check_srpm, check_task_metadata, check_upload,
                                 is_container_build)
+from osh.hub.scan.coalesce import coalesce_task
 from osh.hub.scan.mock import generate_mock_configs
 from osh.hub.scan.models import (REQUEST_STATES, SCAN_TYPES, AppSettings,
                                  ClientAnalyzer, ETMapping, MockConfig,
-                                 Package, Profile, Scan, ScanBinding, Tag)
+                                 Package, Profile, Scan, ScanBinding, Tag,
+                                 TaskPackage)
 from osh.hub.scan.service import get_latest_binding
 from osh.hub.scan.utils import get_or_fail, is_rebase
 from osh.hub.service.processing import task_has_results
+from osh.hub.service.upload import keep_upload
 
 logger = logging.getLogger(__name__)
 
@@ -279,6 +282,7 @@ class AbstractTargetScheduler(AbstractScheduler):
         self.store()
         task_id = Task.create_task(**self.task_args)
         task = Task.objects.get(id=task_id)
+        TaskPackage.objects.index_task(task)
         task_dir = Task.get_task_dir(task_id, create=True)
 
         if self.task_args['args']['mock_config'] == 'auto':
@@ -570,22 +574,29 @@ class ClientScanScheduler(AbstractClientScanScheduler):
     def spawn(self):
         task_id = Task.create_task(**self.task_args)
         task = Task.objects.get(id=task_id)
+        TaskPackage.objects.index_task(task)
         task_dir = Task.get_task_dir(task_id, create=True)
 
         if self.upload_id:
-            # move file to task dir, remove upload record and make the task
-            # available
+            # keep the file for later scans, move it to task dir, remove
+            # upload record and make the task available
+            upload = FileUpload.objects.get(id=self.upload_id)
+            keep_upload(upload)
             shutil.move(self.srpm_path, os.path.join(task_dir, self.srpm_name))
-            FileUpload.objects.get(id=self.upload_id).delete()
+            upload.delete()
 
         if self.upload_model_id:
+            upload = FileUpload.objects.get(id=self.upload_model_id)
+            keep_upload(upload)
             shutil.move(self.model_path, os.path.join(task_dir, self.model_name))
-            FileUpload.objects.get(id=self.upload_model_id).delete()
+            upload.delete()
 
         if self.mock_config == 'auto':
             move_mock_configs(self.mock_config_tmpdir, task_dir)
 
-        task.free_task()
+        # identical scan is already running -- wait for its results instead
+        if coalesce_task(task) is None:
+            task.free_task()
         return task_id
 
 
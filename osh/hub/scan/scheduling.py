@@ -0,0 +1,254 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Policies deciding which FREE tasks are offered to workers and in what order
+
+kobo offers tasks ordered by priority and age.  The policy configured by
+TASK_SCHEDULING_POLICY may reorder them or hold some of them back.  Policies
+only work with QueuedTask and PoolState instances, so that they can be
+evaluated on historical data by simulate() as well.
+"""
+
+import datetime
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from kobo.client.constants import TASK_STATES
+from kobo.hub.models import Task, Worker
+from kobo.rpmlib import parse_nvr
+
+logger = logging.getLogger(__name__)
+
+ERRATA_METHODS = ('ErrataDiffBuild',)
+
+NAME_VERSION_RE = re.compile(r'^(.+?)-\d')
+
+
+def get_package_name(label):
+    """ best effort guess of the package name from a task label """
+    if label.endswith('.src.rpm'):
+        label = label[:-len('.src.rpm')]
+    try:
+        return parse_nvr(label)['name']
+    except ValueError:
+        # name and version of an upstream tarball
+        match = NAME_VERSION_RE.match(label)
+        return match.group(1) if match else label
+
+
+class QueuedTask:
+    """ attributes of a task relevant for scheduling """
+    def __init__(self, task_id, owner, label, method, arch, priority, weight, dt_created,
+                 channel='default', dt_started=None):
+        self.id = task_id
+        self.owner = owner
+        self.label = label
+        self.package = get_package_name(label)
+        self.method = method
+        self.arch = arch
+        self.channel = channel
+        self.priority = priority
+        self.weight = weight
+        self.dt_created = dt_created
+        self.dt_started = dt_started
+
+    def __repr__(self):
+        return f'<QueuedTask #{self.id} {self.method} {self.package}>'
+
+    @property
+    def is_errata(self):
+        return self.method in ERRATA_METHODS
+
+    @classmethod
+    def from_task(cls, task):
+        return cls(task.id, task.owner.username, task.label, task.method,
+                   task.arch.name, task.priority, task.weight, task.dt_created,
+                   task.channel.name, task.dt_started)
+
+
+class PoolState:
+    """ capacity of workers per architecture and tasks running on them """
+    def __init__(self, capacity, running):
+        # {'x86_64': <sum of max_load of workers supporting the arch>, ...}
+        self.capacity = capacity
+        # [QueuedTask, ...]
+        self.running = running
+
+    @classmethod
+    def from_db(cls):
+        capacity = Counter()
+        for worker in Worker.objects.enabled().prefetch_related('arches'):
+            for arch in worker.arches.all():
+                capacity[arch.name] += worker.max_load
+
+        running = Task.objects.running().select_related('owner', 'arch', 'channel')
+        return cls(capacity, [QueuedTask.from_task(t) for t in running])
+
+
+def load_task_history(since, until=None):
+    """
+    Return (QueuedTask, duration in seconds) pairs of finished top-level tasks
+    created in the given period.
+    """
+    tasks = Task.objects.filter(parent__isnull=True,
+                                dt_created__gte=since,
+                                dt_started__isnull=False,
+                                dt_finished__isnull=False,
+                                state__in=(TASK_STATES['CLOSED'], TASK_STATES['FAILED'])) \
+        .select_related('owner', 'arch', 'channel')
+    if until is not None:
+        tasks = tasks.filter(dt_created__lt=until)
+
+    return [(QueuedTask.from_task(t), (t.dt_finished - t.dt_started).total_seconds())
+            for t in tasks]
+
+
+class PriorityPolicy:
+    """ kobo's default: higher priority first, older tasks first """
+    def __init__(self, **options):
+        if options:
+            raise TypeError(f'{type(self).__name__} does not accept options: {options}')
+
+    def order(self, tasks, pool, now):
+        """ return tasks which should be offered to workers, in order """
+        return sorted(tasks, key=lambda t: (-t.priority, t.id))
+
+
+class FairSharePolicy(PriorityPolicy):
+    """
+    The effective priority of a task is its priority, increased by one for
+    every `aging_minutes` it has been waiting (up to `max_aging`) and lowered
+    by `share_weight` for every task of the same owner and of the same package
+    that is running or ordered before it.
+
+    A fraction `errata_reserve` of the capacity of each architecture is kept
+    for errata scans.  Other tasks are held back when they would take it.
+    """
+    def __init__(self, share_weight=1.0, aging_minutes=30, max_aging=10,
+                 errata_reserve=0.2):
+        self.share_weight = share_weight
+        self.aging_minutes = aging_minutes
+        self.max_aging = max_aging
+        self.errata_reserve = errata_reserve
+
+    def aging_bonus(self, task, now):
+        if not self.aging_minutes:
+            return 0
+        waited = (now - task.dt_created).total_seconds() / 60
+        return min(self.max_aging, max(0, waited / self.aging_minutes))
+
+    def order(self, tasks, pool, now):
+        owners = Counter(t.owner for t in pool.running)
+        packages = Counter(t.package for t in pool.running)
+        load = Counter()
+        for task in pool.running:
+            if not task.is_errata:
+                load[task.arch] += task.weight
+
+        def effective_priority(task):
+            share = owners[task.owner] + packages[task.package]
+            return task.priority + self.aging_bonus(task, now) - self.share_weight * share
+
+        ordered = []
+        pending = list(tasks)
+        while pending:
+            task = max(pending, key=lambda t: (effective_priority(t), -t.id))
+            pending.remove(task)
+
+            if not task.is_errata and task.arch in pool.capacity:
+                capacity = pool.capacity[task.arch]
+                limit = capacity - int(capacity * self.errata_reserve)
+                if load[task.arch] + task.weight > limit:
+                    logger.debug('Holding back %s, capacity of %s is reserved for errata',
+                                 task, task.arch)
+                    continue
+                load[task.arch] += task.weight
+
+            owners[task.owner] += 1
+            packages[task.package] += 1
+            ordered.append(task)
+
+        return ordered
+
+
+def get_scheduling_policy():
+    """ instantiate the policy configured in settings """
+    policy_class = import_string(settings.TASK_SCHEDULING_POLICY)
+    return policy_class(**settings.TASK_SCHEDULING_OPTIONS)
+
+
+class SimulatedWorker:
+    def __init__(self, name, arches, max_load=1):
+        self.name = name
+        self.arches = set(arches)
+        self.max_load = max_load
+        self.load = 0
+
+    @classmethod
+    def from_worker(cls, worker):
+        return cls(worker.name, [a.name for a in worker.arches.all()], worker.max_load)
+
+
+def simulate(history, workers, policy):
+    """
+    Replay tasks on workers according to the policy.
+
+    history -- list of (QueuedTask, duration in seconds) pairs
+    workers -- list of SimulatedWorker
+
+    Return {task_id: waiting time in seconds}.  Tasks which could never be
+    started are missing.
+    """
+    durations = {task.id: duration for task, duration in history}
+    arrivals = sorted((task for task, _ in history), key=lambda t: (t.dt_created, t.id))
+    if not arrivals:
+        return {}
+
+    capacity = Counter()
+    for worker in workers:
+        for arch in worker.arches:
+            capacity[arch] += worker.max_load
+
+    # [(datetime of finish, worker, task), ...]
+    running = []
+    queue = []
+    waits = {}
+    now = arrivals[0].dt_created
+    next_arrival = 0
+
+    while True:
+        for entry in [e for e in running if e[0] <= now]:
+            running.remove(entry)
+            entry[1].load -= entry[2].weight
+
+        while next_arrival < len(arrivals) and arrivals[next_arrival].dt_created <= now:
+            queue.append(arrivals[next_arrival])
+            next_arrival += 1
+
+        # like kobo workers, every worker takes what fits from the offered list
+        for worker in workers:
+            pool = PoolState(capacity, [e[2] for e in running])
+            candidates = [t for t in queue if t.arch in worker.arches]
+            for task in policy.order(candidates, pool, now):
+                if worker.load + task.weight > worker.max_load:
+                    continue
+                queue.remove(task)
+                worker.load += task.weight
+                waits[task.id] = (now - task.dt_created).total_seconds()
+                end = now + datetime.timedelta(seconds=durations[task.id])
+                running.append((end, worker, task))
+
+        events = [e[0] for e in running]
+        if next_arrival < len(arrivals):
+            events.append(arrivals[next_arrival].dt_created)
+        if not events:
+            break
+        now = min(events)
+
+    if queue:
+        logger.warning('%d tasks could not be started: %s', len(queue), queue)
+    return waits
@@ -17,8 +17,8 @@ from kobo.shortcuts import run
 from osh.common.constants import (ERROR_DIFF_FILE, ERROR_HTML_FILE,
                                   ERROR_TXT_FILE, FIXED_DIFF_FILE,
                                   FIXED_HTML_FILE, FIXED_TXT_FILE)
+from osh.common.diff import add_title_to_json
 from osh.hub.other.exceptions import ScanException
-from osh.hub.service.processing import add_title_to_json
 
 from .models import (SCAN_STATES, SCAN_STATES_FINISHED_BAD, SCAN_TYPES_TARGET,
                      Scan, ScanBinding)
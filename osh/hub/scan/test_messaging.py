@@ -0,0 +1,108 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""Test :mod:`osh.hub.scan.messaging` module."""
+
+import socket
+import threading
+import time
+
+import proton
+import proton.handlers
+import proton.reactor
+from django.test import TestCase, override_settings
+
+from osh.hub.scan.messaging import UMBPublisher, send_message
+from osh.hub.scan.models import OutgoingBusMessage
+
+
+class FakeBroker(proton.handlers.MessagingHandler):
+    """ local stand-in of an AMQP broker rejecting messages for '*.rejected' """
+    def __init__(self, url):
+        super().__init__(auto_accept=False)
+        self.url = url
+        self.messages = []
+        self.connections = 0
+        self.ready = threading.Event()
+        self.injector = proton.reactor.EventInjector()
+
+    def on_start(self, event):
+        event.container.selectable(self.injector)
+        self.acceptor = event.container.listen(self.url)
+        self.ready.set()
+
+    def on_connection_opened(self, event):
+        self.connections += 1
+
+    def on_message(self, event):
+        address = event.link.remote_target.address
+        if address.endswith('.rejected'):
+            self.reject(event.delivery)
+        else:
+            self.messages.append((address, event.message.body))
+            self.accept(event.delivery)
+
+    def on_stop(self, event):
+        self.acceptor.close()
+        self.injector.close()
+
+
+@override_settings(UMB_TOPIC_PREFIX=['topic://osh.scan', 'topic://osh.copy'],
+                   ENABLE_UMB_OUTBOX=True)
+class UMBPublisherTestSuite(TestCase):
+    def setUp(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.url = '127.0.0.1:%d' % s.getsockname()[1]
+
+        self.broker = FakeBroker(self.url)
+        thread = threading.Thread(target=proton.reactor.Container(self.broker).run, daemon=True)
+        thread.start()
+        self.broker.ready.wait()
+        self.addCleanup(thread.join, 10)
+        self.addCleanup(self.broker.injector.trigger, proton.reactor.ApplicationEvent('stop'))
+
+    def publish(self):
+        publisher = UMBPublisher([f'amqp://{self.url}'], interval=0.1, once=True)
+        proton.reactor.Container(publisher).run()
+        return publisher.published
+
+    def test_publish(self):
+        for scan_id in (1, 2):
+            send_message({'scan_id': scan_id, 'scan_state': 'BUG_CONFIRMED'}, 'finished')
+        self.assertEqual(OutgoingBusMessage.objects.count(), 4)
+
+        self.assertEqual(self.publish(), 4)
+        self.assertEqual(self.broker.connections, 1)
+        self.assertEqual(sorted(self.broker.messages), [
+            ('topic://osh.copy.finished', '{"scan_id": 1, "scan_state": "BUG_CONFIRMED"}'),
+            ('topic://osh.copy.finished', '{"scan_id": 2, "scan_state": "BUG_CONFIRMED"}'),
+            ('topic://osh.scan.finished', '{"scan_id": 1, "scan_state": "BUG_CONFIRMED"}'),
+            ('topic://osh.scan.finished', '{"scan_id": 2, "scan_state": "BUG_CONFIRMED"}'),
+        ])
+        self.assertFalse(OutgoingBusMessage.objects.filter(date_sent__isnull=True).exists())
+        self.assertEqual(self.publish(), 0)
+
+    def test_rejected(self):
+        send_message({'scan_id': 1, 'scan_state': 'FAILED'}, 'rejected')
+
+        self.assertEqual(self.publish(), 0)
+        message = OutgoingBusMessage.objects.first()
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNotNone(message.date_next_attempt)
+        self.assertIsNone(message.date_sent)
+
+    def test_without_outbox(self):
+        with override_settings(ENABLE_UMB_OUTBOX=False, UMB_BROKER_URLS=[f'amqp://{self.url}'],
+                               UMB_CLIENT_CERT=None):
+            send_message({'scan_id': 1, 'scan_state': 'BUG_CONFIRMED'}, 'finished')
+            # the messages are sent in background threads
+            deadline = time.monotonic() + 10
+            while len(self.broker.messages) < 2 and time.monotonic() < deadline:
+                time.sleep(0.1)
+
+        self.assertEqual(sorted(self.broker.messages), [
+            ('topic://osh.copy.finished', '{"scan_id": 1, "scan_state": "BUG_CONFIRMED"}'),
+            ('topic://osh.scan.finished', '{"scan_id": 1, "scan_state": "BUG_CONFIRMED"}'),
+        ])
+        self.assertFalse(OutgoingBusMessage.objects.exists())
@@ -3,10 +3,29 @@
 
 """`osh.hub.scan` tests."""
 
-from django.test import TestCase
+import datetime
+import json
+import os
+import pathlib
+import tempfile
+from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from kobo.hub.models import TASK_STATES, Arch, Channel, Task
+
+from osh.hub.scan.analyzer_versions import refresh_analyzers_versions
+from osh.hub.scan.autoscaling import (ArrivalForecast, DurationEstimator,
+                                      PredictivePlanner, get_current_tasks,
+                                      load_scaled_history)
+from osh.hub.scan.coalesce import compute_input_digest
 from osh.hub.scan.compare import (CSS_CLASS_BASE, CSS_CLASS_OTHER,
                                   get_compare_title)
+from osh.hub.scan.models import AnalyzerVersion, AppSettings, MockConfig
+from osh.hub.scan.notify import generate_stats
+from osh.hub.scan.scheduling import FairSharePolicy, PoolState, QueuedTask
+from osh.hub.service.path import TaskResultPaths
 
 
 class CompareTestSuite(TestCase):
@@ -259,3 +278,273 @@ class CompareTestSuite(TestCase):
                 f'<span class="{CSS_CLASS_BASE}">el8</span>'
             )
         )
+
+
+class InputDigestTestSuite(TestCase):
+    ARGS = {
+        'build': 'units-2.21-5.fc37',
+        'mock_config': 'fedora-37-x86_64',
+        'analyzers': 'gcc,clang,cppcheck',
+        'profile': 'default',
+        'su_user': 'csmock',
+    }
+
+    def test_analyzer_order_is_ignored(self):
+        args = dict(self.ARGS, analyzers='cppcheck,gcc,clang')
+        self.assertEqual(compute_input_digest('VersionDiffBuild', self.ARGS),
+                         compute_input_digest('VersionDiffBuild', args))
+
+    def test_inputs_are_compared(self):
+        args = dict(self.ARGS, build='units-2.21-6.fc37')
+        self.assertNotEqual(compute_input_digest('VersionDiffBuild', self.ARGS),
+                            compute_input_digest('VersionDiffBuild', args))
+        self.assertNotEqual(compute_input_digest('VersionDiffBuild', self.ARGS),
+                            compute_input_digest('MockBuild', self.ARGS))
+
+    def test_uploads_are_not_coalesced(self):
+        args = dict(self.ARGS, srpm_name='units-2.21-5.fc37.src.rpm', upload_id=1)
+        self.assertIsNone(compute_input_digest('VersionDiffBuild', args))
+
+
+class FairSharePolicyTestSuite(TestCase):
+    NOW = datetime.datetime(2024, 1, 1, 12, 0)
+
+    def make_task(self, task_id, owner, method='VersionDiffBuild', minutes_ago=0):
+        return QueuedTask(task_id, owner, f'pkg{task_id}-1.0-1.fc40', method, 'x86_64',
+                          10, 1, self.NOW - datetime.timedelta(minutes=minutes_ago))
+
+    def test_owners_are_interleaved(self):
+        tasks = [self.make_task(1, 'alice'), self.make_task(2, 'alice'), self.make_task(3, 'bob')]
+        pool = PoolState({'x86_64': 10}, [])
+        ordered = FairSharePolicy(errata_reserve=0).order(tasks, pool, self.NOW)
+        self.assertEqual([t.id for t in ordered], [1, 3, 2])
+
+    def test_old_tasks_age(self):
+        tasks = [self.make_task(1, 'alice'), self.make_task(2, 'bob', minutes_ago=60)]
+        tasks[1].priority = 9
+        pool = PoolState({'x86_64': 10}, [])
+        ordered = FairSharePolicy(aging_minutes=30).order(tasks, pool, self.NOW)
+        self.assertEqual([t.id for t in ordered], [2, 1])
+
+    def test_capacity_is_reserved_for_errata(self):
+        running = [self.make_task(1, 'alice'), self.make_task(2, 'bob')]
+        tasks = [self.make_task(3, 'carol'), self.make_task(4, 'errata', 'ErrataDiffBuild')]
+        pool = PoolState({'x86_64': 4}, running)
+        ordered = FairSharePolicy(errata_reserve=0.5).order(tasks, pool, self.NOW)
+        self.assertEqual([t.id for t in ordered], [4])
+
+
+class AnalyzerVersionCacheTestSuite(TestCase):
+    def versions(self, mock):
+        return sorted(str(v) for v in AnalyzerVersion.objects.get_analyzer_versions_for_mockprofile(mock.name))
+
+    def test_only_changes_are_applied(self):
+        mock = MockConfig.objects.create(name='fedora-rawhide-x86_64')
+        AnalyzerVersion.objects.update_analyzers_versions(
+            [{'name': 'gcc', 'version': '13.1'}, {'name': 'clang', 'version': '16.0'}], mock.name)
+        clang = AnalyzerVersion.objects.get(analyzer__name='clang')
+
+        AnalyzerVersion.objects.update_analyzers_versions(
+            [{'name': 'gcc', 'version': '13.2'}, {'name': 'clang', 'version': '16.0'}], mock.name)
+        self.assertEqual(self.versions(mock), ['clang-16.0', 'gcc-13.2'])
+        self.assertIn(mock, clang.mocks.all())
+        self.assertTrue(AnalyzerVersion.objects.has_cached_versions(mock.name))
+
+    def test_last_checks_are_kept(self):
+        for name in ('fedora-rawhide-x86_64', 'fedora-39-x86_64'):
+            MockConfig.objects.create(name=name)
+            AnalyzerVersion.objects.update_analyzers_versions([{'name': 'gcc', 'version': '13.1'}], name)
+        self.assertEqual(sorted(AppSettings.settings_get_last_versions_check()),
+                         ['fedora-39-x86_64', 'fedora-rawhide-x86_64'])
+
+
+class AnalyzerVersionRefreshTestSuite(TestCase):
+    fixtures = ['initial_test_data.json']
+
+    # used by the errata scan in the fixture
+    ERRATA_MOCK = 'rhel-7.7.z-x86_64'
+
+    def cache_versions(self, mock_name, hours_ago=0):
+        AnalyzerVersion.objects.update_analyzers_versions([{'name': 'gcc', 'version': '13.1'}], mock_name)
+        last_checked = AppSettings.objects.get(key='ANALYZERS_VERSIONS_LAST_CHECKED')
+        value = json.loads(last_checked.value)
+        timestamp = datetime.datetime.now() - datetime.timedelta(hours=hours_ago)
+        value[mock_name] = timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')
+        last_checked.value = json.dumps(value)
+        last_checked.save()
+
+    def test_has_cached_versions(self):
+        self.assertFalse(AnalyzerVersion.objects.has_cached_versions(self.ERRATA_MOCK))
+        self.cache_versions(self.ERRATA_MOCK)
+        self.assertTrue(AnalyzerVersion.objects.has_cached_versions(self.ERRATA_MOCK))
+
+    def test_stale_mock_configs(self):
+        self.cache_versions(self.ERRATA_MOCK, hours_ago=24)
+        self.cache_versions('rhel-8-x86_64')
+        # disabled mock profiles are not refreshed
+        self.cache_versions('fedora-36-x86_64', hours_ago=24)
+        MockConfig.objects.filter(name='fedora-36-x86_64').update(enabled=False)
+        self.assertEqual(AnalyzerVersion.objects.get_stale_mock_configs(), [self.ERRATA_MOCK])
+
+    def test_refresh(self):
+        self.cache_versions(self.ERRATA_MOCK, hours_ago=24)
+        # no errata scan uses this mock profile
+        self.cache_versions('rhel-8-x86_64', hours_ago=24)
+
+        task_ids = refresh_analyzers_versions()
+        self.assertEqual(len(task_ids), 1)
+        task = Task.objects.get(id=task_ids[0])
+        self.assertEqual(task.method, 'AnalyzerVersionRetriever')
+        self.assertEqual(task.owner.username, 'user')
+        self.assertEqual(task.args['mock_config'], self.ERRATA_MOCK)
+        self.assertEqual(task.args['analyzers'], 'gcc,clang,cppcheck,shellcheck')
+        self.assertEqual(task.args['su_user'], 'csmock')
+
+        # the retriever is still pending
+        self.assertEqual(refresh_analyzers_versions(), [])
+
+
+class PredictivePlannerTestSuite(TestCase):
+    NOW = datetime.datetime(2024, 1, 1, 12, 0)
+
+    def make_planner(self, history=(), **options):
+        return PredictivePlanner(8, DurationEstimator(history), ArrivalForecast(history, 1), **options)
+
+    def make_task(self, task_id, hour=12):
+        return QueuedTask(task_id, 'alice', f'pkg{task_id}-1.0-1.fc40', 'MockBuild', 'x86_64',
+                          10, 1, self.NOW.replace(hour=hour))
+
+    def test_expected_arrivals_are_planned(self):
+        history = [(self.make_task(i), 600) for i in range(24)]
+        planner = self.make_planner(history, lead_time=10)
+        needed, _ = planner.plan([self.make_task(100)], [], self.NOW, {})
+        # one queued task and 24 tasks per hour expected in the next 10 minutes
+        self.assertEqual(needed, 5)
+
+    def test_scale_down_is_delayed(self):
+        planner = self.make_planner(warm_pool=1, scale_down_delay=15)
+        state = {'target': 6, 'low_since': None}
+        needed, state = planner.plan([], [], self.NOW, state)
+        self.assertEqual(needed, 6)
+        needed, state = planner.plan([], [], self.NOW + datetime.timedelta(minutes=15), state)
+        self.assertEqual(needed, 1)
+
+
+class CurrentTasksTestSuite(TestCase):
+    def setUp(self):
+        get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+
+    def test_only_scans_are_counted(self):
+        scan_id = Task.create_task('user', 'units-2.22-5.el9', 'MockBuild', args={})
+        diff_id = Task.create_task('user', 'units-2.22-5.el9', 'VersionDiffBuild', args={})
+        Task.create_task('user', 'units-2.22-5.el9', 'MockBuild', args={}, parent_id=diff_id)
+        Task.create_task('user', 'Refresh version cache.', 'AnalyzerVersionRetriever', args={})
+        Task.create_task('user', 'units-2.22-5.el9', 'ErrataDiffBuild', args={})
+        Task.objects.filter(id=diff_id).update(state=TASK_STATES['OPEN'])
+
+        free, running = get_current_tasks()
+        self.assertEqual([t.id for t in free], [scan_id])
+        self.assertEqual([t.id for t in running], [diff_id])
+
+    def test_only_scans_are_in_history(self):
+        now = datetime.datetime.now()
+        scan_id = Task.create_task('user', 'units-2.22-5.el9', 'MockBuild', args={})
+        Task.create_task('user', 'Refresh version cache.', 'AnalyzerVersionRetriever', args={})
+        Task.create_task('user', 'units-2.22-5.el9', 'ErrataDiffBuild', args={})
+        Task.objects.update(state=TASK_STATES['CLOSED'], dt_started=now, dt_finished=now)
+
+        history = load_scaled_history(now - datetime.timedelta(days=1))
+        self.assertEqual([t.id for t, _ in history], [scan_id])
+
+
+class DefectStatsTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(TASK_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+        task_id = Task.create_task('user', 'units-2.22-5.el9', 'MockBuild', args={})
+        self.task = Task.objects.get(id=task_id)
+
+        task_dir = Task.get_task_dir(task_id, create=True)
+        results_dir = os.path.join(task_dir, 'units-2.22-5.el9')
+        os.mkdir(results_dir)
+        pathlib.Path(results_dir + '.tar.xz').touch()
+        defects = [{'checker': checker} for checker in ('COMPILER_WARNING', 'SHELLCHECK_WARNING',
+                                                        'COMPILER_WARNING')]
+        with open(os.path.join(results_dir, 'scan-results.js'), 'w') as f:
+            json.dump({'defects': defects}, f)
+
+    def test_manifest(self):
+        self.assertTrue(TaskResultPaths(self.task).write_manifest())
+        self.assertEqual(TaskResultPaths(self.task).get_defect_stats(),
+                         {'COMPILER_WARNING': 2, 'SHELLCHECK_WARNING': 1})
+
+    def test_notification(self):
+        TaskResultPaths(self.task).write_manifest()
+        with patch('osh.hub.scan.notify.load_defects') as load_defects:
+            stats = generate_stats(self.task)
+        load_defects.assert_not_called()
+        self.assertIn('COMPILER_WARNING          2', stats)
+
+        # results processed before the counts were recorded
+        os.remove(TaskResultPaths(self.task).get_manifest())
+        self.assertEqual(generate_stats(self.task), stats)
+
+    def test_task_page(self):
+        TaskResultPaths(self.task).write_manifest()
+        self.task.state = TASK_STATES['CLOSED']
+        self.task.save()
+        response = self.client.get(reverse('task/detail', args=(self.task.id,)))
+        self.assertEqual(response.context['checker_stats'],
+                         [('COMPILER_WARNING', 2, 0, 0), ('SHELLCHECK_WARNING', 1, 0, 0)])
+        self.assertContains(response, 'Defects per checker')
+
+
+@override_settings(LOG_TAIL_MIN_INTERVAL=0)
+class LogTailViewTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(TASK_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        self.user = get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+        # the log of the running task is empty so far
+        self.task_id = Task.create_task('user', 'units-2.22-5.el9', 'MockBuild', args={})
+        Task.get_task_dir(self.task_id, create=True)
+
+        patcher = patch('osh.hub.service.log_tail.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_log_tail(self):
+        url = reverse('task/log-tail', args=(self.task_id, 'stdout.log'))
+        response = self.client.get(url, {'offset': 0, 'wait': 0.1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+
+    def test_wait(self):
+        self.client.force_login(self.user)
+        self.get_log_tail()
+        self.sleep.assert_called()
+
+    def test_anonymous_does_not_wait(self):
+        self.get_log_tail()
+        self.sleep.assert_not_called()
+
+    @override_settings(LOG_TAIL_MAX_WAITERS=0)
+    def test_busy_hub(self):
+        self.client.force_login(self.user)
+        self.get_log_tail()
+        self.sleep.assert_not_called()
@@ -1,19 +1,37 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
-from django.http import HttpResponseRedirect
-from django.shortcuts import render
+import logging
+import math
+import os
+import subprocess
+import tarfile
+
+import kobo.hub.views
+from django.conf import settings
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseForbidden, HttpResponseRedirect,
+                         HttpResponseServerError)
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.views.decorators.http import require_POST
 from django.views.generic.detail import DetailView
 from kobo.django.views.generic import ExtraListView, SearchView
 from kobo.django.xmlrpc.decorators import login_required
+from kobo.hub.models import Task
 
 from osh.hub.osh_xmlrpc.scan import (create_user_diff_task, diff_build,
                                      mock_build)
 from osh.hub.scan.forms import PackageSearchForm, ScanSubmissionForm
+from osh.hub.service.archive import is_archived, restore_task_results
+from osh.hub.service.artifacts import serve_task_file
+from osh.hub.service.loading import load_defect_stats, load_diff_stats
+from osh.hub.service.log_tail import WAITERS, is_rate_limited, read_log_tail
 
 from .models import MockConfig, Package
 
+logger = logging.getLogger(__name__)
+
 
 class MockConfigListView(ExtraListView):
     template_name = "mock_config/list.html"
@@ -80,3 +98,106 @@ def scan_submission(request):
         raise RuntimeError("Unknown scan type: " + scan_type)
 
     return HttpResponseRedirect(reverse('task/detail', args=(task_id,)))
+
+
+@require_POST
+@login_required
+def task_restore_results(request, id):
+    """ expand archived results of the task on request of a logged in user """
+    task = get_object_or_404(Task, id=id)
+    try:
+        restore_task_results(task.id)
+    except (OSError, tarfile.TarError, subprocess.CalledProcessError) as ex:
+        logger.error("Cannot restore archived results of task %s: %s", task.id, ex)
+        return HttpResponseServerError("Cannot restore archived results of the task.")
+
+    return HttpResponseRedirect(reverse('task/detail', args=(task.id,)))
+
+
+class TaskDetail(kobo.hub.views.TaskDetail):
+    """
+    kobo's task detail with numbers of defects per checker recorded when the
+    results were processed and a button to restore archived results
+    """
+    template_name = "scan/task_detail.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        task = kwargs['object']
+        context['archived'] = is_archived(task.id)
+        if not task.is_finished():
+            return context
+
+        # the full results are not loaded if the counts were not recorded
+        defects = load_defect_stats(task.id)
+        if defects is None:
+            return context
+        diff_stats = load_diff_stats(task.id) or {}
+        added = diff_stats.get('added', {})
+        fixed = diff_stats.get('fixed', {})
+        context['diffed'] = bool(diff_stats)
+        context['checker_stats'] = [
+            (checker, defects.get(checker, 0), added.get(checker, 0), fixed.get(checker, 0))
+            for checker in sorted(set(defects) | set(added) | set(fixed))
+        ]
+        return context
+
+
+def is_served_raw(request, log_name):
+    """ would kobo send the file as it is instead of rendering it? """
+    if request.GET.get('format') == 'raw':
+        return True
+    exts = getattr(settings, 'VIEW_RAW_LOG_EXTENSIONS', ['.htm', '.html'])
+    return log_name.endswith(tuple(exts))
+
+
+def task_log(request, id, log_name):
+    # kobo checks permissions for tracebacks and streams logs from an offset
+    if is_served_raw(request, log_name) and 'offset' not in request.GET \
+            and not os.path.basename(log_name).startswith('traceback'):
+        task = get_object_or_404(Task, id=id)
+        response = serve_task_file(request, task.id, log_name,
+                                   as_attachment=request.GET.get('format') == 'raw')
+        if response is not None:
+            return response
+
+    return kobo.hub.views.task_log(request, id, log_name)
+
+
+def task_log_tail(request, id, log_name):
+    """
+    Return bytes of the task log following the `offset` query parameter.  If
+    there are none yet, wait for them up to `wait` seconds.  The offset to ask
+    for next is sent in the X-Log-Offset header.
+
+    Only logged in users may wait and at most LOG_TAIL_MAX_WAITERS requests
+    wait at the same time, the others are answered right away.
+    """
+    if os.path.basename(log_name).startswith("traceback") and \
+            not request.user.has_perm('hub.can_see_traceback'):
+        return HttpResponseForbidden("You don't have permission to see the traceback.")
+
+    task = get_object_or_404(Task, id=id)
+    try:
+        offset = max(0, int(request.GET.get('offset', 0)))
+        wait = min(max(0.0, float(request.GET.get('wait', 0))), settings.LOG_TAIL_MAX_WAIT)
+    except ValueError:
+        return HttpResponseBadRequest('offset and wait have to be numbers')
+
+    client = request.user.username if request.user.is_authenticated else request.META.get('REMOTE_ADDR')
+    if is_rate_limited(client, task.id, settings.LOG_TAIL_MIN_INTERVAL):
+        response = HttpResponse('Too many requests', status=429)
+        response['Retry-After'] = math.ceil(settings.LOG_TAIL_MIN_INTERVAL)
+        return response
+
+    if not request.user.is_authenticated:
+        wait = 0
+
+    with WAITERS.acquire(settings.LOG_TAIL_MAX_WAITERS) as may_wait:
+        content, finished = read_log_tail(task, log_name, offset, wait if may_wait else 0,
+                                          settings.LOG_TAIL_MAX_SIZE)
+    response = HttpResponse(content, content_type='text/plain; charset=utf-8')
+    response['X-Log-Offset'] = offset + len(content)
+    response['X-Task-Finished'] = int(finished)
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Compare payload sizes and serialization times of responses of the largest hub
+calls over XML-RPC and JSON-RPC (see osh.hub.osh_xmlrpc.jsonrpc).
+
+The calls are dispatched on data in the database of the hub, the network is
+not involved:
+
+./osh/hub/scripts/osh-benchmark-rpc.py --tasks 5000 --repeat 5
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+import xmlrpc.client
+
+import django
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'osh.hub.settings'
+django.setup()
+
+import kobo.django.xmlrpc.views  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from kobo.hub.models import Task  # noqa: E402
+
+from osh.hub.osh_xmlrpc.jsonrpc import JSONRPCEncoder  # noqa: E402
+
+
+def get_calls(tasks):
+    task_ids = list(Task.objects.order_by('-id').values_list('id', flat=True)[:tasks])
+    return [
+        ('scan.get_scan_list_page', ({}, None, tasks)),
+        ('scan.get_filtered_scan_list', ({}, tasks)),
+        ('scan.get_tasks_info', (task_ids,)),
+        ('scan.find_tasks', ({'regex': '.'},)),
+        ('scan.list_analyzers', ()),
+    ]
+
+
+def measure(func, repeat):
+    """ return result of the function and the best time of its runs in ms """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def benchmark(result, repeat):
+    xml, xml_dump = measure(lambda: xmlrpc.client.dumps((result,), methodresponse=True,
+                                                        allow_none=True).encode(), repeat)
+    _, xml_load = measure(lambda: xmlrpc.client.loads(xml), repeat)
+    xml_gz, xml_gzip = measure(lambda: gzip.compress(xml, compresslevel=6), repeat)
+
+    reply = {'jsonrpc': '2.0', 'id': 1, 'result': result}
+    js, js_dump = measure(lambda: json.dumps(reply, cls=JSONRPCEncoder).encode(), repeat)
+    _, js_load = measure(lambda: json.loads(js), repeat)
+    js_gz, js_gzip = measure(lambda: gzip.compress(js, compresslevel=6), repeat)
+
+    return [
+        ('XML-RPC', len(xml), len(xml_gz), xml_dump, xml_gzip, xml_load),
+        ('JSON-RPC', len(js), len(js_gz), js_dump, js_gzip, js_load),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=1000,
+                        help='number of tasks or scans asked for (default: 1000)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='report the best time of this many runs (default: 3)')
+    parser.add_argument('--method', action='append',
+                        help='benchmark only this method (may be repeated)')
+    args = parser.parse_args()
+
+    dispatcher = kobo.django.xmlrpc.views.client_handler.xmlrpc_dispatcher
+    host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+    request = RequestFactory(HTTP_HOST=host).post('/')
+    request.user = AnonymousUser()
+
+    print(f"{'method':28} {'protocol':8} {'size [B]':>10} {'gzip [B]':>10} "
+          f"{'dump [ms]':>10} {'gzip [ms]':>10} {'load [ms]':>10}")
+    for method, params in get_calls(args.tasks):
+        if args.method and method not in args.method:
+            continue
+
+        result = dispatcher._dispatch(method, (request,) + params)
+        for protocol, size, gz_size, dump, gz, load in benchmark(result, args.repeat):
+            print(f"{method:28} {protocol:8} {size:10} {gz_size:10} "
+                  f"{dump:10.1f} {gz:10.1f} {load:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
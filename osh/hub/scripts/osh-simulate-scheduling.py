@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Replay historical tasks on a simulated worker pool and compare queue waiting
+times under task scheduling policies (see osh.hub.scan.scheduling).
+
+Compare the default policy with fair-share scheduling on last week's tasks:
+
+./osh/hub/scripts/osh-simulate-scheduling.py --days 7 \\
+    --policy osh.hub.scan.scheduling.PriorityPolicy \\
+    --policy 'osh.hub.scan.scheduling.FairSharePolicy:{"errata_reserve": 0.25}'
+
+The history may be dumped with --dump and replayed elsewhere with --load.
+Unless --workers is given, enabled workers from the database are simulated.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+
+import django
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'osh.hub.settings'
+django.setup()
+
+from django.utils.module_loading import import_string  # noqa: E402
+from kobo.hub.models import Worker  # noqa: E402
+
+from osh.hub.scan.scheduling import (QueuedTask, SimulatedWorker,  # noqa: E402
+                                     load_task_history, simulate)
+
+DEFAULT_POLICIES = [
+    'osh.hub.scan.scheduling.PriorityPolicy',
+    'osh.hub.scan.scheduling.FairSharePolicy',
+]
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def load_history_from_db(days):
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    return load_task_history(since)
+
+
+def dump_history(history, path):
+    data = [{
+        'id': task.id,
+        'owner': task.owner,
+        'label': task.label,
+        'method': task.method,
+        'arch': task.arch,
+        'channel': task.channel,
+        'priority': task.priority,
+        'weight': task.weight,
+        'dt_created': task.dt_created.strftime(TIME_FORMAT),
+        'duration': duration,
+    } for task, duration in history]
+
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def load_history(path):
+    with open(path) as f:
+        data = json.load(f)
+
+    return [(QueuedTask(t['id'], t['owner'], t['label'], t['method'], t['arch'],
+                        t['priority'], t['weight'],
+                        datetime.datetime.strptime(t['dt_created'], TIME_FORMAT),
+                        t.get('channel', 'default')),
+             t['duration']) for t in data]
+
+
+def parse_workers(specs):
+    """ ARCH[,ARCH...]:COUNT[:MAX_LOAD] """
+    workers = []
+    for spec in specs:
+        arches, count, *max_load = spec.split(':')
+        max_load = int(max_load[0]) if max_load else 1
+        for i in range(int(count)):
+            workers.append(SimulatedWorker(f'{arches}-{i}', arches.split(','), max_load))
+    return workers
+
+
+def parse_policy(spec):
+    """ PATH[:JSON_OPTIONS] """
+    path, _, options = spec.partition(':')
+    return import_string(path)(**json.loads(options or '{}'))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def print_report(spec, history, waits):
+    groups = {'all': [], 'errata': [], 'other': []}
+    for task, _ in history:
+        if task.id not in waits:
+            continue
+        wait = waits[task.id] / 60
+        groups['all'].append(wait)
+        groups['errata' if task.is_errata else 'other'].append(wait)
+
+    print(spec)
+    print(f"  not started: {len(history) - len(waits)}")
+    for name, values in groups.items():
+        if not values:
+            continue
+        print(f"  {name:6} tasks: {len(values):6}  wait [min]: "
+              f"mean {statistics.mean(values):8.1f}  "
+              f"median {statistics.median(values):8.1f}  "
+              f"p95 {percentile(values, 0.95):8.1f}  "
+              f"max {max(values):8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=7,
+                        help='replay tasks created in this many last days (default: 7)')
+    parser.add_argument('--load', metavar='FILE', help='load history from a JSON file')
+    parser.add_argument('--dump', metavar='FILE', help='dump history to a JSON file')
+    parser.add_argument('--workers', metavar='ARCHES:COUNT[:MAX_LOAD]', action='append',
+                        help='simulated workers, e.g. x86_64,noarch:4')
+    parser.add_argument('--policy', metavar='PATH[:JSON_OPTIONS]', action='append',
+                        help='scheduling policy to evaluate (may be repeated)')
+    args = parser.parse_args()
+
+    history = load_history(args.load) if args.load else load_history_from_db(args.days)
+    if args.dump:
+        dump_history(history, args.dump)
+
+    for spec in args.policy or DEFAULT_POLICIES:
+        if args.workers:
+            workers = parse_workers(args.workers)
+        else:
+            workers = [SimulatedWorker.from_worker(w) for w in Worker.objects.enabled()]
+        waits = simulate(history, workers, parse_policy(spec))
+        print_report(spec, history, waits)
+
+
+if __name__ == '__main__':
+    main()
@@ -40,6 +40,9 @@ filter scans according to optional filters, hub url is slightly changed!
    --target 'python-six-1.9.0-2.el7' --base 'python-six-1.3.0-4.el7' --username='admin' \
    --state-type "BASE_SCANNING" --release='rhel-7.2'
 
+use --all to get all the scans page by page instead of at most 1000 of them,
+each scan is printed as a JSON object on a separate line
+
 
 
 ## DEBUGGING
@@ -91,6 +94,12 @@ def create_scan_cmd(options):
 
 def get_filtered_scan_list_cmd(options):
     c = Client(options.hub)
+    if options.all:
+        for scan in c.iter_scan_list(options.id, options.target, options.base, options.username,
+                                     options.state_type, options.release):
+            print(json.dumps(scan, default=str))
+        return
+
     response = c.get_filtered_scan_list(options.id, options.target, options.base, options.username,
                                         options.state_type, options.release)
     logger.info(json.dumps(response, indent=2))
@@ -126,6 +135,8 @@ def set_options():
     get_filtered_scan_list_parser.add_argument("--username", help="name of owner")
     get_filtered_scan_list_parser.add_argument("--state-type", help="state of tasks")
     get_filtered_scan_list_parser.add_argument("--release", help="release name")
+    get_filtered_scan_list_parser.add_argument("--all", action="store_true",
+                                               help="get all the scans page by page")
     get_filtered_scan_list_parser.set_defaults(func=get_filtered_scan_list_cmd)
 
     get_scan_state_parser = subparsers.add_parser(
@@ -213,6 +224,22 @@ class Client:
         filters = {k: v for k, v in filters.items() if v is not None}  # removes None values from dictionary
         return str(self.hub.scan.get_filtered_scan_list(filters))
 
+    def iter_scan_list(self, id=None, target=None, base=None, username=None, state=None, release=None):
+        """
+        Call xmlrpc function get_scan_list_page until all the scans are fetched.
+        """
+        filters = dict(id=id, target=target, base=base, state=state, owner=username, release=release)
+        filters = {k: v for k, v in filters.items() if v is not None}  # removes None values from dictionary
+        cursor = None
+        while True:
+            page = self.hub.scan.get_scan_list_page(filters, cursor)
+            if page['status'] == 'ERROR':
+                raise RuntimeError(page['message'])
+            yield from page['scans']
+            cursor = page['cursor']
+            if cursor is None:
+                break
+
     def login(self):
         """
         Perform login via username/password if the credentials were provided
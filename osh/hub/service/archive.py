@@ -0,0 +1,178 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Archival of task results
+
+Results unpacked from the results tarball and HTML/text renderings of diffs
+(including their compressed siblings) can be regenerated, so they are deleted.
+The rest of the task directory is packed into a single archive, which is
+expanded back when a logged in user asks for it on the task page.  Restored
+results can be archived again by the retention policy.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import tarfile
+from contextlib import contextmanager
+from glob import glob
+
+from kobo.hub.models import Task
+
+from osh.common.constants import (ERROR_DIFF_FILE, ERROR_HTML_FILE,
+                                  ERROR_TXT_FILE, FIXED_DIFF_FILE,
+                                  FIXED_HTML_FILE, FIXED_TXT_FILE,
+                                  SCAN_RESULTS_FILENAME)
+from osh.common.diff import csgrep_err, cshtml
+from osh.hub.scan.models import AppSettings, TaskResultsRemoval
+from osh.hub.service.artifacts import ENCODINGS
+from osh.hub.service.csmock_parser import ResultsExtractor
+from osh.hub.service.disk_usage import update_disk_usage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE = 'task-archive.txz'
+
+# {rendering: JSON diff it is generated from}
+DIFF_RENDERINGS = {
+    ERROR_HTML_FILE: ERROR_DIFF_FILE,
+    FIXED_HTML_FILE: FIXED_DIFF_FILE,
+    ERROR_TXT_FILE: ERROR_DIFF_FILE,
+    FIXED_TXT_FILE: FIXED_DIFF_FILE,
+}
+
+
+def get_directory_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+@contextmanager
+def _locked(task_dir):
+    """ serialize archival and restoration of the task directory """
+    fd = os.open(task_dir, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _get_derived_paths(task_dir):
+    """ paths in the task directory which can be regenerated """
+    paths = []
+    if glob(os.path.join(task_dir, '*.tar.xz')):
+        paths += [os.path.dirname(p) for p in glob(os.path.join(task_dir, '*', SCAN_RESULTS_FILENAME))]
+
+    for rendering, source in DIFF_RENDERINGS.items():
+        if os.path.exists(os.path.join(task_dir, source)):
+            path = os.path.join(task_dir, rendering)
+            paths += [path] + [path + suffix for suffix in ENCODINGS.values()]
+    return [p for p in paths if os.path.lexists(p)]
+
+
+def get_derived_size(task_id):
+    """ number of bytes archival of the task would reclaim at least """
+    task_dir = Task.get_task_dir(task_id)
+    return sum(get_directory_size(p) if os.path.isdir(p) else os.lstat(p).st_size
+               for p in _get_derived_paths(task_dir))
+
+
+def _verify_archive(archive_path, entries):
+    """ read the whole archive back and check that it holds all the entries """
+    with tarfile.open(archive_path) as tar:
+        names = {member.name.split('/', 1)[0] for member in tar}
+    missing = set(entries) - names
+    if missing:
+        raise tarfile.TarError(f'{archive_path} misses {", ".join(sorted(missing))}')
+
+
+def archive_task_results(task_id):
+    """ archive results of the task and return number of reclaimed bytes """
+    task_dir = Task.get_task_dir(task_id)
+    if not os.path.isdir(task_dir):
+        return 0
+
+    with _locked(task_dir):
+        archive_path = os.path.join(task_dir, ARCHIVE_FILE)
+        if os.path.exists(archive_path):
+            return 0
+
+        size = get_directory_size(task_dir)
+        tmp_path = archive_path + '.part'
+        if os.path.exists(tmp_path):
+            # left behind by an interrupted archival
+            os.remove(tmp_path)
+
+        derived = _get_derived_paths(task_dir)
+        entries = [entry for entry in os.listdir(task_dir)
+                   if os.path.join(task_dir, entry) not in derived]
+        with tarfile.open(tmp_path, 'w:xz') as tar:
+            for entry in entries:
+                tar.add(os.path.join(task_dir, entry), arcname=entry)
+        _verify_archive(tmp_path, entries)
+
+        # the archive is complete once it has its final name
+        os.rename(tmp_path, archive_path)
+        for path in derived + [os.path.join(task_dir, entry) for entry in entries]:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+        reclaimed = size - get_directory_size(task_dir)
+
+    logger.info('Results of task %s archived, %d bytes reclaimed', task_id, reclaimed)
+    update_disk_usage(task_id)
+    return reclaimed
+
+
+def is_archived(task_id):
+    return os.path.exists(os.path.join(Task.get_task_dir(task_id), ARCHIVE_FILE))
+
+
+def restore_task_results(task_id):
+    """ expand archived results of the task, return False if not archived """
+    task_dir = Task.get_task_dir(task_id)
+    archive_path = os.path.join(task_dir, ARCHIVE_FILE)
+    if not os.path.exists(archive_path):
+        return False
+
+    with _locked(task_dir):
+        # restored by another process meanwhile
+        if not os.path.exists(archive_path):
+            return True
+
+        with tarfile.open(archive_path) as tar:
+            tar.extractall(task_dir, filter='data')
+
+        tarballs = glob(os.path.join(task_dir, '*.tar.xz'))
+        if tarballs:
+            # prefer results of a scanned upstream tarball, which is a *.tar.xz too
+            tarballs.sort(key=lambda p: p.endswith('-results.tar.xz'))
+            rex = ResultsExtractor(tarballs[-1], output_dir=task_dir, unpack_in_temp=False)
+            rex.extract_tarball(AppSettings.settings_get_results_tb_exclude_dirs())
+
+        for rendering, source in DIFF_RENDERINGS.items():
+            if not os.path.exists(os.path.join(task_dir, source)):
+                continue
+            if rendering.endswith('.html'):
+                cshtml(source, rendering, task_dir)
+            else:
+                csgrep_err(source, rendering, task_dir)
+
+        os.remove(archive_path)
+
+    # let the retention policy archive the results again
+    TaskResultsRemoval.objects.filter(task_id=task_id).delete()
+    logger.info('Archived results of task %s restored', task_id)
+    update_disk_usage(task_id)
+    return True
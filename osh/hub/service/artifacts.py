@@ -0,0 +1,215 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Serving of task files
+
+Text artifacts (HTML reports, JSON results, ...) get compressed siblings when
+results of the task are processed, so that clients accepting the encoding get
+them compressed without compressing them on each request.  Large files are
+passed to the web server by X-Sendfile or X-Accel-Redirect, otherwise they are
+streamed by Django, which honours a single byte range of the request.
+"""
+
+import gzip
+import logging
+import mimetypes
+import os
+import re
+import shutil
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from kobo.hub.models import Task
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# {content coding: suffix of the compressed sibling} in order of preference
+ENCODINGS = {
+    'zstd': '.zst',
+    'gzip': '.gz',
+}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _compress_gzip(src, dst):
+    with open(src, 'rb') as f_in, gzip.open(dst, 'wb', compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out, CHUNK_SIZE)
+
+
+def _compress_zstd(src, dst):
+    with open(src, 'rb') as f_in, open(dst, 'wb') as f_out:
+        zstandard.ZstdCompressor().copy_stream(f_in, f_out)
+
+
+def get_compressors():
+    """ {content coding: function compressing a file} for available encodings """
+    compressors = {'gzip': _compress_gzip}
+    if zstandard is not None:
+        compressors['zstd'] = _compress_zstd
+    return compressors
+
+
+def is_fresh(path, sibling):
+    """ is the compressed sibling up to date with the file? """
+    try:
+        return os.stat(sibling).st_mtime >= os.stat(path).st_mtime
+    except OSError:
+        return False
+
+
+def precompress_file(path):
+    """ create missing or outdated compressed siblings of the file """
+    for encoding, compress in get_compressors().items():
+        sibling = path + ENCODINGS[encoding]
+        if is_fresh(path, sibling):
+            continue
+
+        tmp_path = sibling + '.part'
+        compress(path, tmp_path)
+        os.replace(tmp_path, sibling)
+
+
+def precompress_task_artifacts(task_id):
+    """ compress large text files of the task, return number of compressed files """
+    count = 0
+    for root, _, files in os.walk(Task.get_task_dir(task_id)):
+        for name in files:
+            if not name.endswith(tuple(settings.PRECOMPRESS_EXTENSIONS)):
+                continue
+
+            path = os.path.join(root, name)
+            try:
+                if os.path.getsize(path) < settings.PRECOMPRESS_MIN_SIZE:
+                    continue
+                precompress_file(path)
+                count += 1
+            except OSError as ex:
+                logger.warning("Can't compress %s: %s", path, ex)
+
+    return count
+
+
+def parse_accept_encoding(header):
+    """ return set of content codings accepted by the client """
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.lower())
+    return accepted
+
+
+def parse_range(header, size):
+    """
+    Return (first, last) byte of the requested range or None if the whole file
+    is to be sent.  Raise ValueError if the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        # multiple ranges are not supported, send the whole file
+        return None
+
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # suffix range, i.e. last N bytes
+        first = max(0, size - int(last))
+        last = size - 1
+    else:
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+
+    if first > last or first >= size:
+        raise ValueError(f'Range not satisfiable: {header}')
+    return first, last
+
+
+def select_encoding(path, accept_encoding):
+    """ return path of the file to be sent and its content coding or None """
+    accepted = parse_accept_encoding(accept_encoding)
+    exists = os.path.isfile(path)
+    for encoding, suffix in ENCODINGS.items():
+        if encoding not in accepted:
+            continue
+
+        sibling = path + suffix
+        # task logs are replaced by their gzipped version once the task finishes
+        if is_fresh(path, sibling) or (not exists and os.path.isfile(sibling)):
+            return sibling, encoding
+
+    return (path, None) if exists else (None, None)
+
+
+def _read_range(f, length):
+    try:
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def serve_task_file(request, task_id, name, as_attachment=False):
+    """ return response with the task file or None if it does not exist """
+    task_dir = Task.get_task_dir(task_id)
+    path = os.path.abspath(os.path.join(task_dir, name))
+    if not path.startswith(os.path.join(task_dir, '')):
+        return None
+
+    served, encoding = select_encoding(path, request.headers.get('Accept-Encoding', ''))
+    if served is None:
+        return None
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    size = os.path.getsize(served)
+    header = settings.TASK_FILES_SENDFILE_HEADER
+
+    if header and size >= settings.TASK_FILES_SENDFILE_MIN_SIZE:
+        # the web server sends the file and handles ranges
+        response = HttpResponse(content_type=content_type)
+        if header == 'X-Accel-Redirect':
+            relpath = os.path.relpath(served, os.path.abspath(settings.TASK_DIR))
+            response[header] = settings.TASK_FILES_ACCEL_PREFIX + quote(relpath)
+        else:
+            response[header] = served
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        f = open(served, 'rb')
+        if byte_range is None:
+            response = FileResponse(f, content_type=content_type)
+        else:
+            first, last = byte_range
+            f.seek(first)
+            response = StreamingHttpResponse(_read_range(f, last - first + 1), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+            response['Content-Length'] = last - first + 1
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Vary'] = 'Accept-Encoding'
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    if as_attachment:
+        response['Content-Disposition'] = 'attachment; filename=%s' % os.path.basename(path)
+    return response
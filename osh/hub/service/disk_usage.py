@@ -0,0 +1,84 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Accounting of disk space occupied by results of tasks
+
+Each task directory is measured once its results are unpacked and again after
+the results are archived, restored or removed, so that the largest consumers
+can be listed without walking the whole task storage.
+"""
+
+import datetime
+import logging
+import os
+from glob import glob
+
+from django.core.exceptions import ObjectDoesNotExist
+from kobo.hub.models import Task
+
+from osh.hub.scan.models import TaskDiskUsage
+from osh.hub.scan.scheduling import get_package_name
+
+logger = logging.getLogger(__name__)
+
+
+def get_directory_usage(path):
+    """ return total size in bytes and number of files in the directory """
+    size = 0
+    count = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+            count += 1
+    return size, count
+
+
+def get_attribution(task):
+    """ return package name and short tag of the system release of the task """
+    try:
+        scan = task.scanbinding.scan
+    except ObjectDoesNotExist:
+        return get_package_name(task.label), None
+
+    release = scan.tag.release.tag if scan.tag else None
+    return scan.package.name, release
+
+
+def update_disk_usage(task_id):
+    """ measure the task directory and store the result """
+    task_dir = Task.get_task_dir(task_id)
+    total_size, file_count = get_directory_usage(task_dir)
+    tarball_size = 0
+    for path in glob(os.path.join(task_dir, '*.tar.xz')):
+        try:
+            tarball_size += os.path.getsize(path)
+        except OSError:
+            pass
+
+    values = {
+        'tarball_size': tarball_size,
+        'total_size': total_size,
+        'file_count': file_count,
+        # update() bypasses auto_now
+        'date_updated': datetime.datetime.now(),
+    }
+    updated = TaskDiskUsage.objects.filter(task_id=task_id).update(**values)
+    if not updated:
+        task = Task.objects.select_related('scanbinding__scan__package',
+                                           'scanbinding__scan__tag__release').get(id=task_id)
+        package_name, release = get_attribution(task)
+        TaskDiskUsage.objects.update_or_create(
+            task=task, defaults={'package_name': package_name, 'release': release, **values})
+
+    logger.debug('Results of task %s occupy %d bytes in %d files', task_id, total_size, file_count)
+
+
+def clear_disk_usage(task_ids):
+    """ record that results of the tasks were removed """
+    TaskDiskUsage.objects.filter(task_id__in=task_ids) \
+        .update(tarball_size=0, total_size=0, file_count=0,
+                date_updated=datetime.datetime.now())
@@ -5,6 +5,7 @@
 module for loading defects from JSON formatted files and making operations upon these data
 """
 
+import json
 import logging
 
 from kobo.hub.models import Task
@@ -55,3 +56,25 @@ def get_defect_stats(defects):
             result.setdefault(defect['checker'], 0)
             result[defect['checker']] += 1
     return result
+
+
+def load_diff_stats(task_id):
+    """
+    Load numbers of added and fixed defects per checker precomputed when the
+    task was diffed, return None if they are not available
+    """
+    task = Task.objects.get(id=task_id)
+    try:
+        with open(TaskResultPaths(task).get_json_diff_stats()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_defect_stats(task_id):
+    """
+    Load numbers of defects per checker precomputed when results of the task
+    were unpacked, return None if they are not available
+    """
+    task = Task.objects.get(id=task_id)
+    return TaskResultPaths(task).get_defect_stats()
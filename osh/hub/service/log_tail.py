@@ -0,0 +1,52 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Incremental reading of task logs
+
+Clients watching a running task ask for bytes of its log following the offset
+they have already read.  If there are none yet, the request waits for them,
+so that the client does not need to poll the hub repeatedly.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.http import Http404
+
+from osh.hub.service.waiting import WaitingSlots
+
+# seconds between checks of the log while waiting for new bytes
+POLL_INTERVAL = 1
+
+# requests of this process which wait for new bytes
+WAITERS = WaitingSlots()
+
+
+def read_log_tail(task, log_name, offset, timeout, max_size):
+    """
+    Return bytes of the log from the offset and whether the task is finished.
+    Wait up to timeout seconds for new bytes if the task is not finished.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        finished = task.is_finished()
+        try:
+            content = task.logs.get_chunk(log_name, offset, max_size)
+        except Http404:
+            # the log has not been uploaded yet
+            content = b''
+
+        if content or finished or time.monotonic() >= deadline:
+            return content, finished
+
+        time.sleep(POLL_INTERVAL)
+        task.refresh_from_db(fields=['state'])
+
+
+def is_rate_limited(client, task_id, interval):
+    """
+    Return True if the client asked for a log of the task less than interval
+    seconds ago.  The state is kept in the default cache of Django.
+    """
+    return not cache.add(f'log-tail:{client}:{task_id}', True, interval)
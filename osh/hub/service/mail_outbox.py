@@ -0,0 +1,131 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Outbox of e-mail notifications
+
+If ENABLE_MAIL_OUTBOX is set, notifications are stored in the database by the
+request which generates them and sent later by osh-mail-sender, so that a slow
+or unreachable mail relay does not delay workers and users.  All the due
+messages are sent over a single SMTP connection.  Messages which cannot be
+sent are retried with an exponential backoff.  A burst of messages for the
+same recipients is joined into a single digest.
+"""
+
+import logging
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.utils import timezone
+
+from osh.hub.scan.models import OutgoingMail
+
+logger = logging.getLogger(__name__)
+
+# errors caused by the message itself, the connection may be used further
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                  smtplib.SMTPDataError)
+
+DIGEST_SEPARATOR = '\n\n' + '-' * 72 + '\n\n'
+
+
+def queue_mail(subject, body, from_addr, recipients, headers, bcc=None):
+    return OutgoingMail.objects.create(
+        subject=subject,
+        body=body,
+        from_addr=from_addr,
+        recipients=sorted(recipients),
+        bcc=sorted(bcc or []),
+        headers={name: str(value) for name, value in headers.items()},
+        date_next_attempt=timezone.now(),
+    )
+
+
+def group_bursts(messages):
+    """
+    Return lists of messages to be sent as a single e-mail.  Messages for the
+    same recipients are joined if there are at least MAIL_DIGEST_MIN of them.
+    """
+    bursts = {}
+    for message in messages:
+        key = (message.from_addr, tuple(message.recipients), tuple(message.bcc))
+        bursts.setdefault(key, []).append(message)
+
+    groups = []
+    for burst in bursts.values():
+        if settings.MAIL_DIGEST_MIN and len(burst) >= settings.MAIL_DIGEST_MIN:
+            groups.append(burst)
+        else:
+            groups += [[message] for message in burst]
+    return sorted(groups, key=lambda group: group[0].id)
+
+
+def build_email(group, connection):
+    first = group[0]
+    if len(group) == 1:
+        return EmailMessage(first.subject, first.body, first.from_addr, first.recipients,
+                            bcc=first.bcc, headers=first.headers, connection=connection)
+
+    subject = f'{first.subject} (and {len(group) - 1} more)'
+    body = DIGEST_SEPARATOR.join(f'Subject: {m.subject}\n\n{m.body}' for m in group)
+    # only headers common to all the messages apply to the digest
+    headers = {name: value for name, value in first.headers.items()
+               if all(m.headers.get(name) == value for m in group)}
+    headers['X-Digest-Count'] = str(len(group))
+    return EmailMessage(subject, body, first.from_addr, first.recipients,
+                        bcc=first.bcc, headers=headers, connection=connection)
+
+
+def _record_failure(group, error, now):
+    for message in group:
+        retried = message.record_failure(f'{type(error).__name__}: {error}', now,
+                                         settings.MAIL_RETRY_DELAY,
+                                         settings.MAIL_RETRY_MAX_DELAY,
+                                         settings.MAIL_MAX_ATTEMPTS)
+        if retried:
+            logger.warning('Sending e-mail #%s failed, retrying at %s: %s', message.id,
+                           message.date_next_attempt, message.last_error)
+        else:
+            logger.error('Giving up sending e-mail #%s to %s: %s', message.id,
+                         ', '.join(message.recipients), message.last_error)
+
+
+def _send(connection, email):
+    try:
+        connection.send_messages([email])
+    except smtplib.SMTPServerDisconnected:
+        # the relay closed the connection kept open since the previous batch
+        connection.close()
+        connection.send_messages([email])
+
+
+def send_due_mail(connection):
+    """
+    Send at most MAIL_BATCH_SIZE due messages over the connection, which is
+    opened if needed and kept open.  Return the number of sent messages.
+    Errors of the connection are raised after the failed attempt is recorded.
+    """
+    now = timezone.now()
+    messages = list(OutgoingMail.objects.due(now)[:settings.MAIL_BATCH_SIZE])
+    if not messages:
+        return 0
+
+    connection.open()
+    sent = 0
+    for group in group_bursts(messages):
+        try:
+            _send(connection, build_email(group, connection))
+        except MESSAGE_ERRORS as ex:
+            _record_failure(group, ex, now)
+            continue
+        except (smtplib.SMTPException, OSError) as ex:
+            _record_failure(group, ex, now)
+            raise
+
+        OutgoingMail.objects.filter(id__in=[m.id for m in group]) \
+            .update(date_sent=timezone.now(), date_next_attempt=None)
+        sent += len(group)
+
+    logger.info('%d e-mails sent', sent)
+    return sent
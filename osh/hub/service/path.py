@@ -3,8 +3,16 @@
 
 """
 Functions related to retrieving paths of tasks results
+
+Once results of a task are unpacked, names of the results tarball and of the
+directory with unpacked results are recorded in the results manifest.  Paths
+are resolved from it without listing the task directory, which is slow on
+network file systems.  Tasks without the manifest fall back to globbing.
+The manifest also holds numbers of defects per checker, so that they can be
+shown without loading the full results.
 """
 
+import json
 import logging
 import os
 from glob import glob
@@ -12,6 +20,7 @@ from glob import glob
 from kobo.hub.models import Task
 
 import osh.common.constants
+from osh.common.diff import count_defects_per_checker
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +34,67 @@ class TaskResultPaths:
 
         self.task = task
         self.task_dir = Task.get_task_dir(task.id, create=True)
+        self._manifest = None
+
+    def get_manifest(self):
+        return os.path.join(self.task_dir, osh.common.constants.RESULTS_MANIFEST_FILE)
+
+    def _load_manifest(self):
+        if self._manifest is None:
+            try:
+                with open(self.get_manifest()) as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def write_manifest(self):
+        """
+        record locations of unpacked results and numbers of defects per
+        checker, return False if the results are not available
+        """
+        self._manifest = {}
+        try:
+            json_results = self.get_json_results()
+            manifest = {
+                'tarball': os.path.basename(self.get_tarball_path()),
+                'results_dir': os.path.basename(os.path.dirname(json_results)),
+            }
+            try:
+                manifest['defect_stats'] = count_defects_per_checker(json_results)
+            except (KeyError, TypeError, ValueError) as ex:
+                # the counts are computed from the full results when needed
+                logger.warning("Can't count defects of task %s: %s", self.task, ex)
+            tmp_path = self.get_manifest() + '.part'
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.get_manifest())
+        except (OSError, RuntimeError) as ex:
+            logger.warning("Can't write results manifest of task %s: %s", self.task, ex)
+            return False
+
+        self._manifest = manifest
+        return True
+
+    def get_defect_stats(self):
+        """ numbers of defects per checker, None if not recorded in the manifest """
+        return self._load_manifest().get('defect_stats')
+
+    def _get_results_file(self, name, description):
+        """ path to the file in the directory with unpacked results """
+        results_dir = self._load_manifest().get('results_dir')
+        if results_dir is not None:
+            path = os.path.join(self.task_dir, results_dir, name)
+            if os.path.exists(path):
+                return path
+            g = [path]
+        else:
+            g = glob(os.path.join(self.task_dir, '*', name))
+            if len(g) == 1:
+                return g[0]
+
+        logger.warning("%s not found: '%s', task %s", description, g, self.task)
+        raise RuntimeError('%s not found: "%s"' % (description, g))
 
     def get_json_added(self):
         return os.path.join(self.task_dir, osh.common.constants.ERROR_DIFF_FILE)
@@ -32,6 +102,13 @@ class TaskResultPaths:
     def get_json_fixed(self):
         return os.path.join(self.task_dir, osh.common.constants.FIXED_DIFF_FILE)
 
+    def get_json_diff_stats(self):
+        return os.path.join(self.task_dir, osh.common.constants.DIFF_STATS_FILE)
+
+    def get_worker_diff_dir(self):
+        """ diff uploaded by the worker before it is validated """
+        return os.path.join(self.task_dir, osh.common.constants.WORKER_DIFF_DIR)
+
     def get_html_added(self):
         return os.path.join(self.task_dir, osh.common.constants.ERROR_HTML_FILE)
 
@@ -45,30 +122,23 @@ class TaskResultPaths:
         return os.path.join(self.task_dir, osh.common.constants.FIXED_TXT_FILE)
 
     def get_json_defects_in_patches(self):
-        g = glob(os.path.join(self.task_dir, '*', osh.common.constants.DEFECTS_IN_PATCHES_FILE))
-        if len(g) == 1:
-            return g[0]
-        else:
-            logger.warning("defects in patches file not found: '%s', task %s", g, self.task)
-            raise RuntimeError('defects in patches file not found: "%s"' % g)
+        return self._get_results_file(osh.common.constants.DEFECTS_IN_PATCHES_FILE,
+                                      'defects in patches file')
 
     def get_json_results(self):
-        g = glob(os.path.join(self.task_dir, '*', osh.common.constants.SCAN_RESULTS_FILENAME))
-        if len(g) == 1:
-            return g[0]
-        else:
-            logger.warning("json results not found: '%s', task %s", g, self.task)
-            raise RuntimeError('json results not found: "%s"' % g)
+        return self._get_results_file(osh.common.constants.SCAN_RESULTS_FILENAME, 'json results')
 
     def get_txt_summary(self):
-        g = glob(os.path.join(self.task_dir, '*', osh.common.constants.SCAN_RESULTS_SUMMARY))
-        if len(g) == 1:
-            return g[0]
-        else:
-            logger.warning("result's summary not found: '%s', task %s", g, self.task)
-            raise RuntimeError("result's summary not found: '%s'" % g)
+        return self._get_results_file(osh.common.constants.SCAN_RESULTS_SUMMARY,
+                                      "result's summary")
 
     def get_tarball_path(self):
+        tarball = self._load_manifest().get('tarball')
+        if tarball is not None:
+            path = os.path.join(self.task_dir, tarball)
+            if os.path.exists(path):
+                return path
+
         glob_paths = glob(os.path.join(self.task_dir, '*.tar.xz'))
         # usually we have just one .tar.xz but, if we analyze an usptream
         # tarball which itself has .tar.xz suffix, we need to pick a file
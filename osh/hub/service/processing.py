@@ -8,67 +8,15 @@ Util functions related to processing data -- results of analysis
 import json
 import logging
 import os
-import shlex
+import shutil
 
-from kobo.shortcuts import run
-
-from osh.common.constants import CSDIFF_ARGS
+from osh.common.constants import DIFF_STATS_FILE
+from osh.common.diff import DIFF_FILES, compute_diff_stats, generate_diff_files
 from osh.hub.service.path import TaskResultPaths
 
 logger = logging.getLogger(__name__)
 
 
-def _run(command, workdir):
-    """ kobo.shortcuts.run wrapper with predefined setup and logging """
-    retcode, output = run(command,
-                          workdir=workdir,
-                          stdout=False,
-                          can_fail=True,
-                          return_stdout=False,
-                          show_cmd=False)
-    if retcode != 0:
-        logger.critical("'%s' wasn't successfull; path: %s, code: %s",
-                        command, workdir, retcode)
-    return retcode == 0
-
-
-def csdiff(old, new, result, workdir):
-    """
-    use csdiff with constants.CSDIFF_ARGS arguments
-    compare `old` and `new` files and store the diff in `result`
-    all three files have '.err' type
-    """
-    # whole csdiff call must be in one string, because character '>' cannot be
-    # enclosed into quotes -- command '"csdiff" "-j" "old.err" "new.err" ">"
-    # "csdiff.out"' does not work
-    diff_cmd = ' '.join(['csdiff', CSDIFF_ARGS, shlex.quote(old),
-                         shlex.quote(new), '>', result])
-    return _run(diff_cmd, workdir)
-
-
-def csdiff_new_defects(old, new, result, task_dir):
-    """ create file with newly introduced findings"""
-    return csdiff(old, new, result, task_dir)
-
-
-def csdiff_fixed_defects(old, new, result, task_dir):
-    """ create file with fixed findings"""
-    return csdiff(new, old, result, task_dir)
-
-
-def cshtml(input_file, output_file, workdir):
-    """ generate HTML report """
-    cmd = 'csgrep --prune-events 1 --mode json %s | cshtml - > %s' % \
-        (input_file, output_file)
-    return _run(cmd, workdir)
-
-
-def csgrep_err(input_file, output_file, workdir):
-    """ generate ERR text files """
-    cmd = 'csgrep --prune-events 1 %s > %s' % (input_file, output_file)
-    return _run(cmd, workdir)
-
-
 class TaskDiffer:
     def __init__(self, task, base_task):
         self.task = task
@@ -80,36 +28,47 @@ class TaskDiffer:
         """
         create diffs, html reports and .err files
         """
-        succ = csdiff_new_defects(
-            self.base_paths.get_json_results(),
-            self.paths.get_json_results(),
-            self.paths.get_json_added(),
-            self.paths.task_dir
-        )
-        if succ:
-            f_succ = csdiff_new_defects(
-                self.paths.get_json_results(),
-                self.base_paths.get_json_results(),
-                self.paths.get_json_fixed(),
-                self.paths.task_dir
-            )
-
-            if f_succ:
-                # these are basicly optional, don't fail if one of them
-                # was not successfull
-                add_title_to_json(self.paths.get_json_added(), 'Newly introduced findings')
-                add_title_to_json(self.paths.get_json_fixed(), 'Fixed findings')
-
-                cshtml(self.paths.get_json_added(), self.paths.get_html_added(), self.paths.task_dir)
-                cshtml(self.paths.get_json_fixed(), self.paths.get_html_fixed(), self.paths.task_dir)
-                csgrep_err(self.paths.get_json_added(), self.paths.get_txt_added(), self.paths.task_dir)
-                csgrep_err(self.paths.get_json_fixed(), self.paths.get_txt_fixed(), self.paths.task_dir)
-            else:
-                return False
-        else:
+        base_json = self.base_paths.get_json_results()
+        target_json = self.paths.get_json_results()
+        if not generate_diff_files(base_json, target_json, self.paths.task_dir):
             return False
+
+        stats = compute_diff_stats(base_json, target_json, self.paths.task_dir)
+        with open(self.paths.get_json_diff_stats(), 'w') as f:
+            json.dump(stats, f, indent=4)
         return True
 
+    def ingest_worker_diff(self):
+        """
+        Move the diff computed by the worker into the task directory if it
+        matches the results of both tasks.  Return False if there is no such
+        diff.
+        """
+        worker_dir = self.paths.get_worker_diff_dir()
+        if not os.path.isdir(worker_dir):
+            return False
+
+        try:
+            with open(os.path.join(worker_dir, DIFF_STATS_FILE)) as f:
+                stats = json.load(f)
+            expected = compute_diff_stats(self.base_paths.get_json_results(),
+                                          self.paths.get_json_results(),
+                                          worker_dir)
+            valid = stats == expected and \
+                all(os.path.exists(os.path.join(worker_dir, name)) for name in DIFF_FILES)
+        except (OSError, KeyError, TypeError, ValueError, RuntimeError) as ex:
+            logger.warning("Can't validate diff of task %s computed by worker: %s", self.task, ex)
+            valid = False
+
+        if valid:
+            for name in DIFF_FILES:
+                os.replace(os.path.join(worker_dir, name), os.path.join(self.paths.task_dir, name))
+            logger.info("Using diff of task %s computed by worker", self.task)
+        else:
+            logger.warning("Diff of task %s computed by worker does not match its results", self.task)
+        shutil.rmtree(worker_dir, ignore_errors=True)
+        return valid
+
     def diff_results(self):
         """ generate diff files for VersionDiffBuild task """
         try:
@@ -123,16 +82,6 @@ class TaskDiffer:
         return self.generate_diff_files()
 
 
-def add_title_to_json(path, title):
-    # encoding="utf-8" is needed to load JSON with utf-8 chars on RHEL-8 when running in POSIX locale
-    with open(path, "r+", encoding="utf-8") as fd:
-        loaded_json = json.load(fd)
-        loaded_json['scan']['title'] = title
-        fd.seek(0)
-        fd.truncate()
-        json.dump(loaded_json, fd, indent=4)
-
-
 def task_has_results(task):
     trp = TaskResultPaths(task)
     try:
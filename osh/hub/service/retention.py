@@ -0,0 +1,165 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Retention policy applied by osh-retention
+
+Tasks eligible for each retention setting are selected in the database and
+processed in batches ordered by ID.  Results of a batch are deleted (or
+archived, see osh.hub.service.archive) in parallel and the processed tasks are
+marked right after that, so that an interrupted run continues with the first
+unprocessed task.
+"""
+
+import logging
+import shutil
+import tarfile
+from datetime import datetime, timedelta
+
+from django.db import DatabaseError
+from django.db.models import Q
+from kobo.client.constants import FAILED_STATES, FINISHED_STATES
+from kobo.hub.models import Task
+
+from osh.hub.scan.models import RetentionPolicySetting, TaskResultsRemoval
+from osh.hub.service.archive import (archive_task_results, get_derived_size,
+                                     get_directory_size)
+from osh.hub.service.disk_usage import clear_disk_usage
+
+logger = logging.getLogger(__name__)
+
+
+# Conditions to determine membership for given retention setting
+
+def is_failed():
+    return Q(state__in=FAILED_STATES)
+
+
+def is_personal():
+    # If the username does not contain /, @ or -, assume that the task is personal.
+    return ~Q(owner__username__regex='[/@-]')
+
+
+def is_errata():
+    # only errata scans have scan bindings
+    return Q(scanbinding__isnull=False)
+
+
+ELIGIBILITY_CONDITIONS = {
+    # "setting name": function returning a condition on tasks,
+    "FailedStatus": is_failed,
+    "PersonalScan": is_personal,
+}
+
+# results of these tasks are archived instead of being deleted
+ARCHIVAL_CONDITIONS = {
+    "ErrataArchive": is_errata,
+}
+
+
+def delete_task_results(task_id):
+    """ return True if results of the task were deleted """
+    task_dir = Task.get_task_dir(task_id)
+    try:
+        shutil.rmtree(task_dir)
+        logger.debug('The following directory was deleted: %s', task_dir)
+    except FileNotFoundError:
+        # proceed silently when the task directory is missing
+        pass
+
+    except OSError as e:
+        logger.error("Error deleting task directory: %s", e)
+        return False
+
+    return True
+
+
+def archive_results(task_id):
+    """ return number of reclaimed bytes or None if the archival failed """
+    try:
+        return archive_task_results(task_id)
+    except (OSError, tarfile.TarError) as e:
+        logger.error("Error archiving results of task %d: %s", task_id, e)
+        return None
+
+
+def get_setting(name):
+    try:
+        return RetentionPolicySetting.objects.get(name=name)
+    except RetentionPolicySetting.DoesNotExist:
+        logger.warning(f"Retention policy setting ({name}) does not exist. "
+                       "The affected tasks results will not be deleted.")
+        return None
+    except DatabaseError as e:
+        logger.error("Error obtaining %s value: %s", name, e)
+        raise
+
+
+def get_retention_settings():
+    """
+    Return the configured settings in the order they apply, results are
+    archived only if they are not to be deleted.
+    """
+    retention_settings = map(get_setting, [*ELIGIBILITY_CONDITIONS, *ARCHIVAL_CONDITIONS])
+
+    # filter out unset settings
+    return [s for s in retention_settings if s and s.days]
+
+
+def get_condition(setting):
+    cutoff = datetime.now() - timedelta(days=setting.days)
+    conditions = {**ELIGIBILITY_CONDITIONS, **ARCHIVAL_CONDITIONS}
+    return conditions[setting.name]() & Q(dt_finished__lte=cutoff)
+
+
+def apply_setting(setting, previous_settings, executor, batch_size, dry_run):
+    """
+    Return number of processed tasks and number of reclaimed bytes.  Only
+    archival and the dry run count the bytes, in the latter case at least the
+    reported number of bytes would be reclaimed by the archival.
+    """
+    archive = setting.name in ARCHIVAL_CONDITIONS
+    tasks = Task.objects.filter(get_condition(setting),
+                                state__in=FINISHED_STATES,
+                                taskresultsremoval__isnull=True)
+    if dry_run:
+        # tasks eligible for previous settings are not marked as processed
+        for previous in previous_settings:
+            tasks = tasks.exclude(get_condition(previous))
+
+    task_count = 0
+    freed = 0
+    last_id = 0
+
+    while True:
+        batch = list(tasks.filter(id__gt=last_id).order_by('id')
+                     .values_list('id', flat=True)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1]
+
+        if dry_run:
+            task_count += len(batch)
+            if archive:
+                freed += sum(executor.map(get_derived_size, batch))
+            else:
+                freed += sum(executor.map(get_directory_size, map(Task.get_task_dir, batch)))
+            continue
+
+        if archive:
+            reclaimed = list(executor.map(archive_results, batch))
+            freed += sum(size for size in reclaimed if size is not None)
+            done = [size is not None for size in reclaimed]
+        else:
+            done = executor.map(delete_task_results, batch)
+        processed = [TaskResultsRemoval(task_id=task_id, reason=setting)
+                     for task_id, ok in zip(batch, done) if ok]
+
+        # mark the tasks as processed
+        TaskResultsRemoval.objects.bulk_create(processed)
+        if not archive:
+            clear_disk_usage([removal.task_id for removal in processed])
+        task_count += len(processed)
+        logger.info("%s: processed %d tasks up to task %d", setting.name, task_count, last_id)
+
+    return task_count, freed
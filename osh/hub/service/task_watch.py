@@ -0,0 +1,89 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Batched watching of task states
+
+A client watching many tasks asks for all of them at once.  The hub returns
+the tasks (and their subtasks) whose state differs from the one recorded in
+the cursor of the client together with a new cursor.  If there are no changes
+yet, the request waits for them, so that the client does not need to poll the
+hub repeatedly.  The cursor is an opaque string for the client, which lists
+the states known to it, so the hub does not need to keep any state of watchers.
+"""
+
+import time
+
+from django.db.models import Q
+from kobo.client.constants import FINISHED_STATES
+from kobo.hub.models import Task
+
+from osh.hub.service.waiting import WaitingSlots
+
+# seconds between checks of the tasks while waiting for changes
+POLL_INTERVAL = 2
+
+# requests of this process which wait for changes
+WATCHERS = WaitingSlots()
+
+
+def parse_cursor(cursor):
+    """ return {task ID: state} recorded in the cursor """
+    states = {}
+    for item in cursor.split(',') if cursor else []:
+        task_id, _, state = item.partition(':')
+        try:
+            states[int(task_id)] = int(state)
+        except ValueError:
+            raise ValueError(f'Invalid cursor: {cursor}') from None
+    return states
+
+
+def format_cursor(states):
+    return ','.join(f'{task_id}:{state}' for task_id, state in sorted(states.items()))
+
+
+def _get_states(task_ids):
+    query = Q(id__in=task_ids) | Q(parent_id__in=task_ids)
+    return dict(Task.objects.filter(query).values_list('id', 'state'))
+
+
+def export_task_state(task):
+    return {
+        'id': task.id,
+        'parent_id': task.parent_id,
+        'method': task.method,
+        'state': task.state,
+        'state_label': task.get_state_display(),
+        'is_finished': task.is_finished(),
+        'is_failed': task.is_failed(),
+        'worker': task.worker.name if task.worker else None,
+    }
+
+
+def get_task_changes(task_ids, cursor, timeout):
+    """
+    Return tasks whose state is not recorded in the cursor, new cursor, IDs
+    of tasks which do not exist and whether all the tasks are finished.  Wait
+    up to timeout seconds for a change if there is none.
+    """
+    known = parse_cursor(cursor)
+    deadline = time.monotonic() + timeout
+    while True:
+        states = _get_states(task_ids)
+        changed = [task_id for task_id, state in states.items() if known.get(task_id) != state]
+        if changed or time.monotonic() >= deadline:
+            break
+        time.sleep(POLL_INTERVAL)
+
+    tasks = Task.objects.filter(id__in=changed).select_related('worker').order_by('id')
+    exported = [export_task_state(task) for task in tasks]
+    # the state could change since it was read
+    states.update((info['id'], info['state']) for info in exported)
+
+    return {
+        'tasks': exported,
+        'cursor': format_cursor(states),
+        'missing': sorted(set(task_ids) - set(states)),
+        'finished': all(state in FINISHED_STATES for state in states.values()),
+    }
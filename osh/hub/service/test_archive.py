@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""Test :mod:`osh.hub.service.archive` module."""
+
+import os
+import pathlib
+import tarfile
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from kobo.hub.models import Arch, Channel, Task
+
+from osh.hub.scan.models import RetentionPolicySetting, TaskResultsRemoval
+from osh.hub.service import archive
+from osh.hub.service.path import TaskResultPaths
+
+
+class ArchiveTestSuite(TestCase):
+    NVR = 'units-2.22-5.el9'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(TASK_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        self.user = get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+        self.task_id = Task.create_task('user', self.NVR, 'MockBuild', args={})
+        self.task_dir = Task.get_task_dir(self.task_id, create=True)
+
+        # the results tarball, results unpacked from it and a log
+        results_dir = os.path.join(self.task_dir, self.NVR)
+        os.mkdir(results_dir)
+        pathlib.Path(results_dir, 'scan-results.js').write_text('{"defects": []}')
+        with tarfile.open(results_dir + '.tar.xz', 'w:xz') as tar:
+            tar.add(results_dir, arcname=self.NVR)
+        pathlib.Path(self.task_dir, 'stdout.log').write_text('build log\n' * 10000)
+
+    def archived_names(self):
+        with tarfile.open(os.path.join(self.task_dir, archive.ARCHIVE_FILE)) as tar:
+            return sorted(tar.getnames())
+
+    def test_archive(self):
+        self.assertGreater(archive.archive_task_results(self.task_id), 0)
+        self.assertEqual(os.listdir(self.task_dir), [archive.ARCHIVE_FILE])
+        # the unpacked results are not archived
+        self.assertEqual(self.archived_names(), ['stdout.log', self.NVR + '.tar.xz'])
+
+    def test_restore(self):
+        archive.archive_task_results(self.task_id)
+        setting = RetentionPolicySetting.objects.create(name='ErrataArchive', days=30)
+        TaskResultsRemoval.objects.create(task_id=self.task_id, reason=setting)
+
+        self.assertTrue(archive.restore_task_results(self.task_id))
+        self.assertEqual(sorted(os.listdir(self.task_dir)),
+                         ['stdout.log', self.NVR, self.NVR + '.tar.xz'])
+        self.assertTrue(os.path.exists(os.path.join(self.task_dir, self.NVR, 'scan-results.js')))
+        # the restored results can be archived again
+        self.assertFalse(TaskResultsRemoval.objects.filter(task_id=self.task_id).exists())
+        self.assertGreater(archive.archive_task_results(self.task_id), 0)
+
+    def test_skip(self):
+        self.assertFalse(archive.restore_task_results(self.task_id))
+        archive.archive_task_results(self.task_id)
+        self.assertEqual(archive.archive_task_results(self.task_id), 0)
+        self.assertEqual(archive.archive_task_results(self.task_id + 1), 0)
+
+    def test_failed_verification(self):
+        with patch.object(archive, '_verify_archive', side_effect=tarfile.TarError('truncated')):
+            with self.assertRaises(tarfile.TarError):
+                archive.archive_task_results(self.task_id)
+        # nothing is deleted unless the archive is complete
+        self.assertNotIn(archive.ARCHIVE_FILE, os.listdir(self.task_dir))
+        self.assertTrue(os.path.exists(os.path.join(self.task_dir, self.NVR, 'scan-results.js')))
+
+    def test_paths_do_not_restore(self):
+        archive.archive_task_results(self.task_id)
+        paths = TaskResultPaths(Task.objects.get(id=self.task_id))
+        self.assertIsNone(paths.get_defect_stats())
+        self.assertEqual(os.listdir(self.task_dir), [archive.ARCHIVE_FILE])
+
+    def test_views_do_not_restore(self):
+        archive.archive_task_results(self.task_id)
+        self.assertContains(self.client.get(f'/task/{self.task_id}/'), 'log in to restore them')
+        self.assertEqual(self.client.get(f'/task/{self.task_id}/log/stdout.log').status_code, 404)
+        self.assertEqual(os.listdir(self.task_dir), [archive.ARCHIVE_FILE])
+
+    def test_restore_view(self):
+        archive.archive_task_results(self.task_id)
+        url = reverse('task/restore-results', args=(self.task_id,))
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(f'/task/{self.task_id}/'), url)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertRedirects(self.client.post(url), reverse('task/detail', args=(self.task_id,)))
+        self.assertFalse(archive.is_archived(self.task_id))
+        self.assertIn('stdout.log', os.listdir(self.task_dir))
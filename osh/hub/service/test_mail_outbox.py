@@ -0,0 +1,123 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""Test :mod:`osh.hub.service.mail_outbox` module."""
+
+import socketserver
+import threading
+
+from django.core.mail import get_connection
+from django.test import TestCase, override_settings
+
+from osh.hub.scan.models import AppSettings, OutgoingMail
+from osh.hub.scan.notify import send_mail
+from osh.hub.service.mail_outbox import send_due_mail
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """ local stand-in of a mail relay refusing recipients named 'refused' """
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+        recipients, data = [], None
+        for line in self.rfile:
+            if data is not None:
+                if line == b'.\r\n':
+                    self.server.messages.append((recipients, b''.join(data).decode()))
+                    recipients, data = [], None
+                    self.reply('250 OK')
+                else:
+                    data.append(line)
+                continue
+
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'RCPT' and 'refused' in command:
+                self.reply('550 No such user')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                data = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class MailOutboxTestSuite(TestCase):
+    def setUp(self):
+        AppSettings.objects.update_or_create(key='SEND_MAIL', defaults={'value': 'Y'})
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeSMTPHandler)
+        self.server.daemon_threads = True
+        self.server.connections = 0
+        self.server.messages = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        overridden = override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                                       EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.server.server_address[1],
+                                       EMAIL_USE_TLS=False, ENABLE_MAIL_OUTBOX=True,
+                                       MAIL_DIGEST_MIN=3)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def send(self):
+        connection = get_connection(fail_silently=False)
+        try:
+            return send_due_mail(connection)
+        finally:
+            connection.close()
+
+    def test_single_connection(self):
+        for user in ('alice', 'bob', 'carol'):
+            send_mail('Body', f'Hello {user}', [f'{user}@example.org'], {'X-Task-ID': 1})
+        self.assertEqual(OutgoingMail.objects.count(), 3)
+        self.assertEqual(self.server.messages, [])
+
+        self.assertEqual(self.send(), 3)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual([r for r, _ in self.server.messages],
+                         [['alice@example.org'], ['bob@example.org'], ['carol@example.org']])
+        self.assertFalse(OutgoingMail.objects.filter(date_sent__isnull=True).exists())
+        self.assertEqual(self.send(), 0)
+
+    def test_digest(self):
+        for task_id in (1, 2, 3):
+            send_mail(f'Task {task_id}', f'Task #{task_id}', ['alice@example.org'],
+                      {'X-Task-ID': task_id})
+
+        self.assertEqual(self.send(), 3)
+        self.assertEqual(len(self.server.messages), 1)
+        content = self.server.messages[0][1]
+        self.assertIn('Task #1 (and 2 more)', content)
+        self.assertIn('X-Digest-Count: 3', content)
+        self.assertNotIn('X-Task-ID', content)
+
+    def test_retry(self):
+        send_mail('Body', 'Hello', ['refused@example.org'], {})
+        send_mail('Body', 'Hello', ['alice@example.org'], {})
+
+        self.assertEqual(self.send(), 1)
+        failed = OutgoingMail.objects.get(recipients=['refused@example.org'])
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('SMTPRecipientsRefused', failed.last_error)
+        self.assertIsNone(failed.date_sent)
+        self.assertGreater(failed.date_next_attempt, failed.date_created)
+        # the message is not due until the backoff elapses
+        self.assertEqual(self.send(), 0)
+
+    @override_settings(ENABLE_MAIL_OUTBOX=False)
+    def test_without_outbox(self):
+        self.assertEqual(send_mail('Body', 'Hello', ['alice@example.org'], {}), 1)
+        self.assertEqual([r for r, _ in self.server.messages], [['alice@example.org']])
+        self.assertFalse(OutgoingMail.objects.exists())
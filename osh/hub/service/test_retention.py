@@ -0,0 +1,99 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""Test :mod:`osh.hub.service.retention` module."""
+
+import datetime
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from kobo.hub.models import TASK_STATES, Arch, Channel, Task
+
+from osh.hub.scan.models import RetentionPolicySetting, TaskResultsRemoval
+from osh.hub.service import retention
+
+
+class RetentionTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(TASK_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        get_user_model().objects.create(username='user')
+        get_user_model().objects.create(username='osh/errata')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+
+        self.failed_status = RetentionPolicySetting.objects.create(name='FailedStatus', days=30)
+        self.personal_scan = RetentionPolicySetting.objects.create(name='PersonalScan', days=30)
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        self.executor = executor
+
+    def create_task(self, state, owner='osh/errata', days_ago=60):
+        task_id = Task.create_task(owner, 'units-2.22-5.el9', 'MockBuild', args={})
+        finished = datetime.datetime.now() - datetime.timedelta(days=days_ago)
+        Task.objects.filter(id=task_id).update(state=TASK_STATES[state], dt_finished=finished)
+        Task.get_task_dir(task_id, create=True)
+        return task_id
+
+    def processed(self):
+        return sorted(TaskResultsRemoval.objects.values_list('task_id', flat=True))
+
+    def test_failed_states(self):
+        failed = [self.create_task(state) for state in ('FAILED', 'CANCELED', 'INTERRUPTED', 'TIMEOUT')]
+        closed = self.create_task('CLOSED')
+        recent = self.create_task('FAILED', days_ago=10)
+
+        task_count, _ = retention.apply_setting(self.failed_status, [], self.executor, 1000, False)
+        self.assertEqual(task_count, len(failed))
+        self.assertEqual(self.processed(), failed)
+        for task_id in failed:
+            self.assertFalse(os.path.exists(Task.get_task_dir(task_id)))
+        for task_id in (closed, recent):
+            self.assertTrue(os.path.exists(Task.get_task_dir(task_id)))
+
+    def test_batches(self):
+        task_ids = [self.create_task('FAILED') for _ in range(5)]
+        batches = []
+
+        def delete_task_results(task_id):
+            batches.append(task_id)
+            # the directory of the second task cannot be deleted
+            return task_id != task_ids[1]
+
+        with patch.object(retention, 'delete_task_results', side_effect=delete_task_results):
+            task_count, _ = retention.apply_setting(self.failed_status, [], self.executor, 2, False)
+        self.assertEqual(batches, task_ids)
+        self.assertEqual(task_count, 4)
+        self.assertEqual(self.processed(), task_ids[:1] + task_ids[2:])
+
+        # only the task which was not processed is retried by the next run
+        task_count, _ = retention.apply_setting(self.failed_status, [], self.executor, 2, False)
+        self.assertEqual(task_count, 1)
+        self.assertEqual(self.processed(), task_ids)
+
+    def test_dry_run(self):
+        failed = self.create_task('FAILED', owner='user')
+        personal = self.create_task('CLOSED', owner='user')
+        self.create_task('CLOSED')
+
+        counts = [retention.apply_setting(setting, previous, self.executor, 1000, True)[0]
+                  for setting, previous in ((self.failed_status, []),
+                                            (self.personal_scan, [self.failed_status]))]
+        # the failed personal task is counted for the first setting only
+        self.assertEqual(counts, [1, 1])
+        self.assertEqual(self.processed(), [])
+        for task_id in (failed, personal):
+            self.assertTrue(os.path.exists(Task.get_task_dir(task_id)))
+
+    def test_unset_settings(self):
+        RetentionPolicySetting.objects.filter(name='PersonalScan').update(days=None)
+        self.assertEqual(retention.get_retention_settings(), [self.failed_status])
@@ -0,0 +1,363 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""`osh.hub.service` tests."""
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import xmlrpc.client
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from kobo.django.upload.models import UPLOAD_STATES, FileUpload
+from kobo.hub.models import Arch, Channel, Task
+
+from osh.common.constants import WORKER_DIFF_DIR
+from osh.common.diff import DIFF_FILES, write_diff_stats
+from osh.hub.scan.check import check_upload
+from osh.hub.service.artifacts import parse_accept_encoding, parse_range
+from osh.hub.service.disk_usage import get_directory_usage
+from osh.hub.service.log_tail import read_log_tail
+from osh.hub.service.path import TaskResultPaths
+from osh.hub.service.processing import TaskDiffer
+from osh.hub.service.task_watch import (format_cursor, get_task_changes,
+                                        parse_cursor)
+from osh.hub.service.upload import (ChunkedUpload, StoredUpload, keep_upload,
+                                    remove_unused_files, reuse_stored_file)
+from osh.hub.service.waiting import WaitingSlots
+from osh.hub.waiving.results_loader import TaskResultsProcessor
+
+
+class ResultsManifestTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(TASK_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+        task_id = Task.create_task('user', 'units-2.22-5.el9', 'MockBuild', args={})
+        self.task = Task.objects.get(id=task_id)
+        self.task_dir = Task.get_task_dir(task_id, create=True)
+
+    def unpack(self, name='units-2.22-5.el9'):
+        results_dir = os.path.join(self.task_dir, name)
+        os.mkdir(results_dir)
+        pathlib.Path(results_dir + '.tar.xz').touch()
+        with open(os.path.join(results_dir, 'scan-results.js'), 'w') as f:
+            json.dump({'defects': []}, f)
+        return results_dir
+
+    def test_manifest(self):
+        results_dir = self.unpack()
+        self.assertTrue(TaskResultPaths(self.task).write_manifest())
+        with open(TaskResultPaths(self.task).get_manifest()) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['tarball'], 'units-2.22-5.el9.tar.xz')
+        self.assertEqual(manifest['results_dir'], 'units-2.22-5.el9')
+
+        # another directory with results would make globbing ambiguous
+        self.unpack('units-2.22-5.el9-old')
+        paths = TaskResultPaths(self.task)
+        self.assertEqual(paths.get_json_results(), os.path.join(results_dir, 'scan-results.js'))
+
+    def test_without_manifest(self):
+        results_dir = self.unpack()
+        paths = TaskResultPaths(self.task)
+        self.assertEqual(paths.get_json_results(), os.path.join(results_dir, 'scan-results.js'))
+        self.assertEqual(paths.get_tarball_path(), results_dir + '.tar.xz')
+
+    def test_missing_results(self):
+        paths = TaskResultPaths(self.task)
+        self.assertFalse(paths.write_manifest())
+        self.assertFalse(os.path.exists(paths.get_manifest()))
+        with self.assertRaises(RuntimeError):
+            paths.get_json_results()
+
+
+class WorkerDiffTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(TASK_DIR=tmp_dir.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        get_user_model().objects.create(username='user')
+        Arch.objects.create(name='noarch', pretty_name='noarch')
+        Channel.objects.create(name='default')
+        self.base_task = self.create_task('units-2.21-5.el9', ['COMPILER_WARNING'])
+        self.task = self.create_task('units-2.22-5.el9', ['COMPILER_WARNING', 'SHELLCHECK_WARNING'])
+
+        # diff of the results as uploaded by the worker
+        self.worker_dir = os.path.join(Task.get_task_dir(self.task.id), WORKER_DIFF_DIR)
+        os.mkdir(self.worker_dir)
+        for name in DIFF_FILES:
+            self.write_json(os.path.join(self.worker_dir, name), [])
+        self.write_json(os.path.join(self.worker_dir, 'added.js'), ['SHELLCHECK_WARNING'])
+
+    def write_json(self, path, checkers):
+        with open(path, 'w') as f:
+            json.dump({'defects': [{'checker': checker} for checker in checkers]}, f)
+
+    def create_task(self, nvr, checkers):
+        task = Task.objects.get(id=Task.create_task('user', nvr, 'VersionDiffBuild', args={}))
+        results_dir = os.path.join(Task.get_task_dir(task.id, create=True), nvr)
+        os.mkdir(results_dir)
+        self.write_json(os.path.join(results_dir, 'scan-results.js'), checkers)
+        return task
+
+    def write_stats(self):
+        write_diff_stats(TaskResultPaths(self.base_task).get_json_results(),
+                         TaskResultPaths(self.task).get_json_results(), self.worker_dir)
+
+    def test_valid_diff(self):
+        self.write_stats()
+        self.assertTrue(TaskDiffer(self.task, self.base_task).ingest_worker_diff())
+
+        paths = TaskResultPaths(self.task)
+        self.assertFalse(os.path.exists(self.worker_dir))
+        with open(paths.get_json_diff_stats()) as f:
+            self.assertEqual(json.load(f)['added'], {'SHELLCHECK_WARNING': 1})
+        self.assertTrue(os.path.exists(paths.get_json_added()))
+
+    def test_checksum_mismatch(self):
+        self.write_stats()
+        # results of the task differ from those diffed by the worker
+        self.write_json(TaskResultPaths(self.task).get_json_results(), ['COMPILER_WARNING'])
+        self.assertFalse(TaskDiffer(self.task, self.base_task).ingest_worker_diff())
+        self.assertFalse(os.path.exists(self.worker_dir))
+        self.assertFalse(os.path.exists(TaskResultPaths(self.task).get_json_added()))
+
+    def test_fallback_to_hub_diff(self):
+        # the worker did not finish its diff
+        with patch('osh.hub.service.processing.generate_diff_files', return_value=True) as diff, \
+                patch('osh.hub.service.processing.compute_diff_stats', return_value={}):
+            self.assertTrue(TaskResultsProcessor(self.task, self.base_task).generate_diffs())
+        diff.assert_called_once()
+        self.assertFalse(os.path.exists(self.worker_dir))
+
+
+class DiskUsageTestSuite(TestCase):
+    def test_directory_usage(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.mkdir(os.path.join(tmpdir, 'results'))
+            for name, size in (('results.tar.xz', 100), ('results/scan-results.js', 40)):
+                with open(os.path.join(tmpdir, name), 'wb') as f:
+                    f.write(b'x' * size)
+
+            self.assertEqual(get_directory_usage(tmpdir), (140, 2))
+
+    def test_missing_directory(self):
+        self.assertEqual(get_directory_usage('/nonexistent/task/dir'), (0, 0))
+
+
+class ArtifactServingTestSuite(TestCase):
+    def test_accept_encoding(self):
+        self.assertEqual(parse_accept_encoding('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(parse_accept_encoding('zstd;q=0.9, gzip;q=0'), {'zstd'})
+        self.assertEqual(parse_accept_encoding(''), set())
+
+    def test_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=500-5000', 1000), (500, 999))
+
+    def test_whole_file(self):
+        self.assertIsNone(parse_range(None, 1000))
+        self.assertIsNone(parse_range('bytes=0-1,5-9', 1000))
+
+    def test_unsatisfiable_range(self):
+        with self.assertRaises(ValueError):
+            parse_range('bytes=1000-', 1000)
+
+
+class FakeLogs:
+    def __init__(self, content):
+        self.content = content
+
+    def get_chunk(self, name, offset=0, length=-1):
+        return self.content[offset:offset + length]
+
+
+class FakeTask:
+    def __init__(self, content, finished):
+        self.logs = FakeLogs(content)
+        self.finished = finished
+
+    def is_finished(self):
+        return self.finished
+
+
+class LogTailTestSuite(TestCase):
+    def test_new_bytes(self):
+        task = FakeTask(b'0123456789', finished=False)
+        self.assertEqual(read_log_tail(task, 'stdout.log', 4, 0, 3), (b'456', False))
+
+    def test_finished_task(self):
+        task = FakeTask(b'0123456789', finished=True)
+        self.assertEqual(read_log_tail(task, 'stdout.log', 10, 30, 1024), (b'', True))
+
+
+class ChunkedUploadTestSuite(TestCase):
+    CHUNK_SIZE = 16
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overridden = override_settings(UPLOAD_DIR=os.path.join(tmp_dir.name, 'upload'),
+                                       TASK_DIR=os.path.join(tmp_dir.name, 'tasks'))
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        self.content = b'results' * 10
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+
+    def start(self, checksum=None):
+        upload = ChunkedUpload(1, 'units-results.tar.xz')
+        return upload, upload.start(len(self.content), checksum or self.checksum, self.CHUNK_SIZE)
+
+    def write(self, upload, index, checksum=None):
+        chunk = self.content[index * self.CHUNK_SIZE:(index + 1) * self.CHUNK_SIZE]
+        checksum = checksum or hashlib.sha256(chunk).hexdigest()
+        return upload.write_chunk(index, checksum, xmlrpc.client.Binary(chunk))
+
+    def test_upload(self):
+        upload, confirmed = self.start()
+        self.assertEqual(confirmed, [])
+        for index in (4, 0, 2, 1, 3):
+            percent = self.write(upload, index)
+        self.assertEqual(percent, 100)
+
+        path = upload.finish()
+        self.assertEqual(path, os.path.join(Task.get_task_dir(1), 'units-results.tar.xz'))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        with open(path + '.sha256') as f:
+            self.assertEqual(f.read(), f'{self.checksum}  units-results.tar.xz\n')
+
+    def test_resume(self):
+        upload, _ = self.start()
+        self.write(upload, 0)
+        self.write(upload, 3)
+        with self.assertRaisesRegex(ValueError, r'missing chunks: \[1, 2, 4\]'):
+            upload.finish()
+
+        # the interrupted upload continues with the missing chunks only
+        upload, confirmed = self.start()
+        self.assertEqual(sorted(confirmed), [0, 3])
+        for index in (1, 2, 4):
+            self.write(upload, index)
+        with open(upload.finish(), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_chunk_checksum(self):
+        upload, _ = self.start()
+        with self.assertRaisesRegex(ValueError, 'Checksum of chunk 0'):
+            self.write(upload, 0, checksum='0' * 64)
+        self.assertEqual(self.start()[1], [])
+
+    def test_file_checksum(self):
+        upload, _ = self.start(checksum='0' * 64)
+        for index in range(5):
+            self.write(upload, index)
+        with self.assertRaisesRegex(ValueError, 'Checksum of units-results.tar.xz'):
+            upload.finish()
+        self.assertFalse(os.path.exists(os.path.join(Task.get_task_dir(1), 'units-results.tar.xz')))
+
+        # the broken partial file is not resumed
+        upload, confirmed = self.start(checksum='0' * 64)
+        self.assertEqual(confirmed, [])
+
+
+class UploadStoreTestSuite(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.upload_dir = tmp_dir.name
+        settings_override = override_settings(UPLOAD_DIR=self.upload_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create(username='user')
+        self.content = b'srpm' * 10
+        self.checksum = hashlib.sha256(self.content).hexdigest()
+
+    def _upload(self):
+        target_dir = os.path.join(self.upload_dir, 'target')
+        os.mkdir(target_dir)
+        with open(os.path.join(target_dir, 'foo.src.rpm'), 'wb') as f:
+            f.write(self.content)
+        return FileUpload.objects.create(owner=self.user, name='foo.src.rpm', checksum=self.checksum,
+                                         size=len(self.content), target_dir=target_dir,
+                                         state=UPLOAD_STATES['FINISHED'])
+
+    def test_unknown_file(self):
+        self.assertIsNone(reuse_stored_file(self.user, 'foo.src.rpm', self.checksum, len(self.content)))
+
+    def test_reuse_kept_upload(self):
+        keep_upload(self._upload())
+        upload = reuse_stored_file(self.user, 'bar.src.rpm', self.checksum, len(self.content))
+        self.assertEqual(upload.state, UPLOAD_STATES['FINISHED'])
+
+        nvr, name, path = check_upload(upload.id, 'user')
+        self.assertEqual((nvr, name), ('bar', 'bar.src.rpm'))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+        # the stored file stays there once the task takes the upload
+        upload.delete()
+        self.assertIsNotNone(reuse_stored_file(self.user, 'bar.src.rpm', self.checksum, len(self.content)))
+
+    def test_chunked_upload(self):
+        upload = StoredUpload(self.user, self.checksum)
+        self.assertEqual(upload.start(len(self.content), self.checksum, 16), [])
+        for index in (2, 0, 1):
+            chunk = self.content[index * 16:(index + 1) * 16]
+            upload.write_chunk(index, hashlib.sha256(chunk).hexdigest(), xmlrpc.client.Binary(chunk))
+        path = upload.finish()
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_remove_unused_files(self):
+        keep_upload(self._upload())
+        self.assertEqual(remove_unused_files(1), 0)
+
+        path = os.path.join(self.upload_dir, 'store', str(self.user.id), self.checksum)
+        os.utime(path, (0, 0))
+        self.assertEqual(remove_unused_files(1), 1)
+        self.assertIsNone(reuse_stored_file(self.user, 'foo.src.rpm', self.checksum, len(self.content)))
+
+
+class TaskWatchTestSuite(TestCase):
+    def test_cursor(self):
+        states = {12: 2, 3: 1}
+        self.assertEqual(format_cursor(states), '3:1,12:2')
+        self.assertEqual(parse_cursor(format_cursor(states)), states)
+        self.assertEqual(parse_cursor(''), {})
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            parse_cursor('1:open')
+
+    def test_missing_tasks(self):
+        changes = get_task_changes([1, 2], '', 0)
+        self.assertEqual(changes['tasks'], [])
+        self.assertEqual(changes['missing'], [1, 2])
+        self.assertTrue(changes['finished'])
+
+    def test_waiting_slots(self):
+        slots = WaitingSlots()
+        with slots.acquire(1) as first:
+            with slots.acquire(1) as second:
+                self.assertEqual((first, second), (True, False))
+        with slots.acquire(1) as third:
+            self.assertTrue(third)
@@ -0,0 +1,268 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Chunked upload of task results from workers and of files from users
+
+A file is split into chunks of a fixed size which may be uploaded in any order
+and in parallel.  The partial file is kept outside of the task directory
+together with the list of confirmed chunks, so an interrupted upload can be
+resumed by uploading only the missing ones.  Once all the chunks are there,
+the checksum of the whole file is verified and the file is moved into the task
+directory, next to a file with the checksum in the format of sha256sum.
+
+SRPMs and models uploaded by users are kept in a store of the user named by
+their checksum.  If the same file is to be scanned again, the client only asks
+for a new upload of the stored file, which is a hard link to it.
+"""
+
+import base64
+import datetime
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import xmlrpc.client
+from contextlib import contextmanager
+from glob import glob
+
+from django.conf import settings
+from kobo.django.upload.models import UPLOAD_STATES, FileUpload
+from kobo.hub.models import Task
+from kobo.shortcuts import random_string
+
+from osh.common.constants import UPLOAD_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_SUFFIX = '.sha256'
+
+CHECKSUM_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ChunkedUpload:
+    def __init__(self, task_id, filename):
+        if os.path.basename(filename) != filename or filename.startswith('.'):
+            raise ValueError(f'Invalid upload file name: {filename}')
+
+        self.task_id = task_id
+        self.filename = filename
+        self._set_paths(os.path.join(settings.UPLOAD_DIR, 'results', str(task_id)))
+
+    def _set_paths(self, upload_dir):
+        self.upload_dir = upload_dir
+        self.part_path = os.path.join(upload_dir, self.filename + '.part')
+        self.state_path = os.path.join(upload_dir, self.filename + '.json')
+
+    @contextmanager
+    def _state(self):
+        """ load the upload state under an exclusive lock and store changes """
+        os.makedirs(self.upload_dir, exist_ok=True)
+        fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            content = f.read()
+            state = json.loads(content) if content else {}
+
+            yield state
+
+            if json.dumps(state) != content:
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+
+    def _chunk_count(self, state):
+        return max(1, -(-state['size'] // state['chunk_size']))
+
+    def start(self, size, checksum, chunk_size):
+        """
+        Start or resume an upload and return indexes of chunks which have
+        already been received.
+        """
+        if not 0 < chunk_size <= UPLOAD_CHUNK_SIZE:
+            # larger chunks would exceed DATA_UPLOAD_MAX_MEMORY_SIZE
+            raise ValueError(f'Invalid chunk size: {chunk_size}')
+
+        with self._state() as state:
+            if (state.get('size'), state.get('checksum'), state.get('chunk_size')) != \
+                    (size, checksum, chunk_size):
+                # a different file -- start over
+                if state:
+                    logger.info('Restarting upload of %s', self.part_path)
+                state.clear()
+                state.update(size=size, checksum=checksum, chunk_size=chunk_size, chunks=[])
+                with open(self.part_path, 'wb') as f:
+                    f.truncate(size)
+
+            return state['chunks']
+
+    def write_chunk(self, index, checksum, encoded_chunk):
+        if isinstance(encoded_chunk, xmlrpc.client.Binary):
+            chunk = encoded_chunk.data
+        else:
+            chunk = base64.b64decode(encoded_chunk)
+
+        if hashlib.sha256(chunk).hexdigest() != checksum:
+            raise ValueError(f'Checksum of chunk {index} does not match')
+
+        with self._state() as state:
+            if not state:
+                raise ValueError(f'Upload of {self.filename} was not started')
+            chunk_size = state['chunk_size']
+            if not 0 <= index < self._chunk_count(state):
+                raise ValueError(f'Invalid chunk index: {index}')
+            expected = min(chunk_size, state['size'] - index * chunk_size)
+            if len(chunk) != expected:
+                raise ValueError(f'Chunk {index} has {len(chunk)} bytes, {expected} expected')
+
+        # chunks of the file do not overlap, so they can be written in parallel
+        fd = os.open(self.part_path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, chunk, index * chunk_size)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        with self._state() as state:
+            if index not in state['chunks']:
+                state['chunks'].append(index)
+            return len(state['chunks']) * 100 // self._chunk_count(state)
+
+    def _store(self, checksum):
+        """ move the verified file to the task directory, return its path """
+        target = os.path.join(Task.get_task_dir(self.task_id, create=True), self.filename)
+        os.chmod(self.part_path, 0o644)
+        shutil.move(self.part_path, target)
+        # clients verify downloaded files against it
+        with open(target + CHECKSUM_SUFFIX, 'w') as f:
+            print(f"{checksum}  {self.filename}", file=f)
+        return target
+
+    def finish(self):
+        """ verify the uploaded file and move it to its destination """
+        with self._state() as state:
+            if not state:
+                raise ValueError(f'Upload of {self.filename} was not started')
+            missing = set(range(self._chunk_count(state))) - set(state['chunks'])
+            if missing:
+                raise ValueError(f'Upload of {self.filename} is not complete, missing chunks: {sorted(missing)}')
+
+            digest = hashlib.sha256()
+            with open(self.part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+
+            valid = digest.hexdigest() == state['checksum']
+            if valid:
+                target = self._store(state['checksum'])
+            else:
+                # the partial file is broken, the next attempt starts over
+                state.clear()
+
+        if not valid:
+            raise ValueError(f'Checksum of {self.filename} does not match')
+
+        os.remove(self.state_path)
+        try:
+            os.rmdir(self.upload_dir)
+        except OSError:
+            # other uploads are in progress
+            pass
+        logger.info('Upload of %s finished', target)
+        return target
+
+
+def get_store_dir(user):
+    return os.path.join(settings.UPLOAD_DIR, 'store', str(user.id))
+
+
+def get_stored_path(user, checksum):
+    if not CHECKSUM_RE.match(checksum):
+        raise ValueError(f'Invalid SHA-256 checksum: {checksum}')
+    return os.path.join(get_store_dir(user), checksum)
+
+
+class StoredUpload(ChunkedUpload):
+    """ chunked upload of a file of the user into the store """
+
+    def __init__(self, user, checksum):
+        self.user = user
+        self.target = get_stored_path(user, checksum)
+        # the partial file is named by the checksum too, so that the upload
+        # can be resumed regardless of the name of the uploaded file
+        self.filename = checksum
+        self._set_paths(os.path.join(get_store_dir(user), 'partial'))
+
+    def _store(self, checksum):
+        os.chmod(self.part_path, 0o644)
+        os.replace(self.part_path, self.target)
+        return self.target
+
+
+def keep_upload(upload):
+    """ add the file of a finished upload to the store of its owner """
+    path = os.path.join(upload.target_dir, upload.name)
+    stored = get_stored_path(upload.owner, upload.checksum.lower())
+    os.makedirs(os.path.dirname(stored), exist_ok=True)
+    try:
+        os.link(path, stored)
+    except FileExistsError:
+        # mark the stored file as recently used
+        os.utime(stored)
+    except OSError as ex:
+        # the store is an optimization, do not fail the scan
+        logger.warning("Can't store %s: %s", path, ex)
+
+
+def reuse_stored_file(user, name, checksum, size):
+    """
+    Return a new finished upload of the stored file with the checksum or None
+    if the user has not uploaded such file yet.
+    """
+    if os.path.basename(name) != name or name.startswith('.'):
+        raise ValueError(f'Invalid upload file name: {name}')
+
+    stored = get_stored_path(user, checksum.lower())
+    try:
+        if os.path.getsize(stored) != size:
+            return None
+    except FileNotFoundError:
+        return None
+
+    target_dir = os.path.join(settings.UPLOAD_DIR, random_string(32))
+    os.makedirs(target_dir)
+    try:
+        os.link(stored, os.path.join(target_dir, name))
+    except FileNotFoundError:
+        # removed by osh-retention meanwhile
+        os.rmdir(target_dir)
+        return None
+    os.utime(stored)
+
+    upload = FileUpload(owner=user, name=name, checksum=checksum.lower(), size=size,
+                        target_dir=target_dir, state=UPLOAD_STATES['FINISHED'],
+                        dt_finished=datetime.datetime.now())
+    upload.save()
+    logger.info('Reusing %s uploaded by %s as %s', stored, user, name)
+    return upload
+
+
+def remove_unused_files(days):
+    """
+    Remove stored files and abandoned partial uploads which were not used for
+    the number of days, return their count.
+    """
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).timestamp()
+    store_dir = os.path.join(settings.UPLOAD_DIR, 'store')
+    count = 0
+    for path in glob(os.path.join(store_dir, '*', '*')) + glob(os.path.join(store_dir, '*', 'partial', '*')):
+        try:
+            if os.path.isfile(path) and os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+                count += 1
+        except OSError as ex:
+            logger.warning("Can't remove %s: %s", path, ex)
+    return count
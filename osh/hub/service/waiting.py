@@ -0,0 +1,36 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Limits of long-polling requests
+
+A request waiting for a change holds a thread of the hub process for the whole
+time.  The number of requests of each kind which wait at the same time is
+limited in each process, so that waiting clients cannot take all the threads
+of the hub.  Requests over the limit are answered right away.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class WaitingSlots:
+    """ counter of requests of one kind which wait in this process """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = 0
+
+    @contextmanager
+    def acquire(self, limit):
+        """ yield True if the request may wait, i.e. there is a free slot """
+        with self._lock:
+            acquired = self._count < limit
+            if acquired:
+                self._count += 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._lock:
+                    self._count -= 1
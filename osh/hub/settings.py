@@ -92,6 +92,7 @@ AUTHENTICATION_BACKENDS = (
 AUTH_USER_MODEL = 'kobo_auth.User'
 
 MIDDLEWARE = (
+    'osh.hub.other.instrumentation.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -187,15 +188,140 @@ USERS_ACL_PERMISSION = "staff"
 
 VALID_TASK_LOG_EXTENSIONS = ['.log', '.ini', '.err', '.out', '.js', '.txt', '.cfg']
 
+# Task files with these extensions get gzip (and zstd if python3-zstandard is
+# installed) compressed siblings when results of the task are processed, see
+# osh.hub.service.artifacts.  They are sent to clients accepting the encoding.
+PRECOMPRESS_EXTENSIONS = ['.html', '.js', '.err', '.txt']
+PRECOMPRESS_MIN_SIZE = 64 * 1024
+
+# Task files of at least TASK_FILES_SENDFILE_MIN_SIZE bytes are sent by the web
+# server if this is set to 'X-Sendfile' (mod_xsendfile) or 'X-Accel-Redirect'
+# (nginx).  The latter requires an internal location TASK_FILES_ACCEL_PREFIX
+# mapped to TASK_DIR.
+TASK_FILES_SENDFILE_HEADER = None
+TASK_FILES_SENDFILE_MIN_SIZE = 1024 * 1024
+TASK_FILES_ACCEL_PREFIX = '/osh-tasks/'
+
+# Incremental reading of task logs by task/<id>/log-tail/<log>.  A request
+# waits at most LOG_TAIL_MAX_WAIT seconds for new bytes and returns at most
+# LOG_TAIL_MAX_SIZE bytes.  Each client may ask for logs of a task once per
+# LOG_TAIL_MIN_INTERVAL seconds, which is tracked in the default cache.  Only
+# requests of logged in users wait and at most LOG_TAIL_MAX_WAITERS of them
+# wait at the same time in each hub process, so that they do not take all
+# the threads of the hub.
+LOG_TAIL_MAX_WAIT = 30
+LOG_TAIL_MAX_WAITERS = 4
+LOG_TAIL_MAX_SIZE = 1024 * 1024
+LOG_TAIL_MIN_INTERVAL = 1
+
+# scan.watch_tasks waits at most TASK_WATCH_MAX_WAIT seconds for a change of
+# states of the watched tasks.  Each waiting request holds a thread of the hub,
+# so at most TASK_WATCH_MAX_WAITERS requests wait at the same time in each hub
+# process, the others are answered right away.
+TASK_WATCH_MAX_WAIT = 5
+TASK_WATCH_MAX_WAITERS = 4
+
+# scan.find_tasks returns at most this number of tasks found by a regular
+# expression or a comment at once, clients ask for the rest page by page
+FIND_TASKS_MAX_RESULTS = 1000
+
+# Files uploaded by users are kept in UPLOAD_DIR/store by their checksum, so
+# that an identical SRPM or model is not uploaded again.  Files which were not
+# reused for UPLOAD_STORE_DAYS days are removed by osh-retention.
+UPLOAD_STORE_DAYS = 14
+
+# Wall time, number of DB queries and DB time of XML-RPC methods and views are
+# recorded by osh.hub.other.instrumentation and served in the Prometheus text
+# format at metrics/ to METRICS_ALLOWED_IPS.  Calls taking at least
+# SLOW_CALL_SECONDS or SLOW_CALL_QUERIES queries are logged with their most
+# repeated SQL statements.  Long-polling calls (scan.watch_tasks and log-tail)
+# are checked only for the number of queries.
+SLOW_CALL_SECONDS = 5
+SLOW_CALL_QUERIES = 200
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# If this setting is enabled, messages for the UMB (see UMB_* in
+# settings_local.py) are queued in the database and published by
+# osh-umb-publisher, which has to be enabled then:
+#   systemctl enable --now osh-umb-publisher.service
+# Otherwise each message is sent right away over its own connection.
+#
+# osh-umb-publisher checks for due messages every UMB_PUBLISHER_INTERVAL
+# seconds, see osh.hub.scan.messaging.  Messages not accepted by the broker
+# are retried after UMB_RETRY_DELAY seconds doubled with each attempt up to
+# UMB_RETRY_MAX_DELAY, UMB_MAX_ATTEMPTS times at most.  Published messages are
+# removed by osh-retention after UMB_OUTBOX_KEEP_DAYS days.
+ENABLE_UMB_OUTBOX = False
+UMB_PUBLISHER_INTERVAL = 5
+UMB_BATCH_SIZE = 100
+UMB_RETRY_DELAY = 60
+UMB_RETRY_MAX_DELAY = 3600
+UMB_MAX_ATTEMPTS = 10
+UMB_OUTBOX_KEEP_DAYS = 7
+
 # This is kept here for backward compatibility.
 # https://github.com/openscanhub/openscanhub/pull/256#pullrequestreview-2001187953
 DEFAULT_EMAIL_DOMAIN = "redhat.com"
 
 NOTIFICATION_EMAIL_FOOTER = ""
 
+# If this setting is enabled, e-mail notifications are queued in the database
+# and sent by osh-mail-sender, which has to be enabled then:
+#   systemctl enable --now osh-mail-sender.service
+# Otherwise they are sent right away by the request which generates them.
+#
+# osh-mail-sender sends the queued messages every MAIL_SENDER_INTERVAL seconds
+# over a single SMTP connection, see osh.hub.service.mail_outbox.  A failed
+# message is retried after MAIL_RETRY_DELAY seconds doubled with each attempt
+# up to MAIL_RETRY_MAX_DELAY, MAIL_MAX_ATTEMPTS times at most.  Sent messages
+# are removed by osh-retention after MAIL_OUTBOX_KEEP_DAYS days.
+#
+# Digests are disabled by default.  Set MAIL_DIGEST_MIN to 2 or more to send
+# that many messages for the same recipients due at once as a single digest.
+ENABLE_MAIL_OUTBOX = False
+MAIL_SENDER_INTERVAL = 10
+MAIL_BATCH_SIZE = 100
+MAIL_RETRY_DELAY = 60
+MAIL_RETRY_MAX_DELAY = 3600
+MAIL_MAX_ATTEMPTS = 10
+MAIL_DIGEST_MIN = 0
+MAIL_OUTBOX_KEEP_DAYS = 7
+
 # If this setting is enabled, a worker is only used to perform a single task.
 ENABLE_SINGLE_USE_WORKERS = False
 
+# Predictive planning of single-use workers by `osh-worker-manager --workers-needed`,
+# see osh.hub.scan.autoscaling.  If disabled, a worker is requested for every
+# running or queued task.  Plans may be evaluated on past days by
+# `osh-worker-manager --simulate YYYY-MM-DD`.
+# Example:
+# AUTOSCALING_OPTIONS = {'warm_pool': 1, 'lead_time': 5, 'scale_down_delay': 15}
+ENABLE_PREDICTIVE_AUTOSCALING = False
+AUTOSCALING_OPTIONS = {}
+AUTOSCALING_STATE_FILE = '/var/lib/osh/hub/autoscaling.json'
+
+# How bases of differential scans are scanned, see BASE_SCAN_* in
+# osh.common.constants.  Concurrent scanning on the same worker needs workers
+# with max_load of at least 2 to be any faster.
+BASE_SCAN_MODE = 'sequential'
+
+# If this setting is enabled, user scans with identical inputs are scanned only
+# once and all the submitters receive the results.
+ENABLE_SCAN_COALESCING = False
+
+# Results of a finished scan with identical inputs are reused for this many
+# hours if they were produced by the currently cached analyzer versions.
+# Set to 0 to coalesce only with scans that are still queued or running.
+SCAN_COALESCING_REUSE_HOURS = 24
+
+# Policy ordering tasks offered to workers and its options, see
+# osh.hub.scan.scheduling.  The default policy keeps the behavior of kobo.
+# Example:
+# TASK_SCHEDULING_POLICY = 'osh.hub.scan.scheduling.FairSharePolicy'
+# TASK_SCHEDULING_OPTIONS = {'aging_minutes': 30, 'errata_reserve': 0.25}
+TASK_SCHEDULING_POLICY = 'osh.hub.scan.scheduling.PriorityPolicy'
+TASK_SCHEDULING_OPTIONS = {}
+
 # override default values with custom ones from local settings
 try:
     from .settings_local import *  # noqa
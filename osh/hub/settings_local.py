@@ -153,6 +153,9 @@ ENABLE_SINGLE_USE_WORKERS = False
 # being opened.
 MAX_SINGLE_USE_WORKERS = 8
 
+# Hysteresis state of the predictive planning of single-use workers.
+AUTOSCALING_STATE_FILE = os.path.join(FILES_PATH, 'autoscaling.json')
+
 # This user is used to ssh to newly created worker.
 SINGLE_USE_WORKER_SSH_USER = ""
 
@@ -2,9 +2,13 @@
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.generic.base import TemplateView
 
+from osh.hub.other.instrumentation import metrics_view
+from osh.hub.scan.views import (TaskDetail, task_log, task_log_tail,
+                                task_restore_results)
+
 admin.autodiscover()
 
 
@@ -16,6 +20,10 @@ urlpatterns = [
     # path('admin/doc/', include('django.contrib.admindocs.urls')),
 
     path("auth/", include("kobo.hub.urls.auth")),
+    path("task/<int:pk>/", TaskDetail.as_view()),
+    path("task/<int:id>/restore-results/", task_restore_results, name="task/restore-results"),
+    re_path(r"^task/(?P<id>\d+)/log/(?P<log_name>.+)$", task_log),
+    re_path(r"^task/(?P<id>\d+)/log-tail/(?P<log_name>.+)$", task_log_tail, name="task/log-tail"),
     path("task/", include("kobo.hub.urls.task")),
     path("info/arch/", include("kobo.hub.urls.arch")),
     path("info/channel/", include("kobo.hub.urls.channel")),
@@ -29,6 +37,9 @@ urlpatterns = [
 
     path('admin/', admin.site.urls),
 
+    # latency and DB queries of XML-RPC methods and views for Prometheus
+    path("metrics/", metrics_view, name="metrics"),
+
     # Include kobo hub xmlrpc module urls:
     path("xmlrpc/", include("osh.hub.osh_xmlrpc.urls")),
 ]
@@ -3,13 +3,16 @@
 
 import datetime
 import logging
+import os
 
 from django.core.exceptions import ObjectDoesNotExist
 from kobo.hub.models import Task
 
 from osh.common.constants import DEFAULT_CHECKER_GROUP
 from osh.hub.scan.models import AnalyzerVersion, AppSettings
+from osh.hub.service.artifacts import precompress_task_artifacts
 from osh.hub.service.csmock_parser import CsmockAPI, ResultsExtractor
+from osh.hub.service.disk_usage import update_disk_usage
 from osh.hub.service.path import TaskResultPaths
 from osh.hub.service.processing import (TaskDiffer, task_has_results,
                                         task_is_diffed)
@@ -44,11 +47,16 @@ class TaskResultsProcessor:
         tb_path = self.target_paths.get_tarball_path()
         if task_has_results(self.target_task):
             logger.info("Results are already unpacked for task %s", self.target_task)
+            # manifests written by older versions lack the defect counts
+            if not os.path.exists(self.target_paths.get_manifest()) \
+                    or self.target_paths.get_defect_stats() is None:
+                self.target_paths.write_manifest()
             return
 
         logger.debug('Unpacking %s', tb_path)
         rex = ResultsExtractor(tb_path, output_dir=self.target_task_dir, unpack_in_temp=False)
         rex.extract_tarball(self.exclude_dirs)
+        self.target_paths.write_manifest()
 
         try:
             with open(self.target_paths.get_txt_summary()) as f:
@@ -68,6 +76,8 @@ class TaskResultsProcessor:
                 logger.info("Task '%s' is already diffed.", self.target_task)
                 return True
             td = TaskDiffer(self.target_task, self.base_task)
+            if td.ingest_worker_diff():
+                return True
             return td.diff_results()
 
 
@@ -227,5 +237,7 @@ def process_scan(sb):
     rp = ScanResultsProcessor(sb, exclude_dirs=exclude_dirs)
     rp.unpack_results()
     rp.generate_diffs()
+    precompress_task_artifacts(sb.task.id)
+    update_disk_usage(sb.task.id)
     rl = ResultsLoader(sb)
     rl.process()
@@ -1,28 +1,78 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import codecs
 import glob
 import logging
 import os
 import re
+import select
 import shlex
 import shutil
 import subprocess
 import sys
 import tempfile
+import time
 import urllib.request
 
-from kobo.shortcuts import run
-
 logger = logging.getLogger(__name__)
 
+# output of csmock is written to the task log at most once per this number of
+# seconds unless at least OUTPUT_MAX_CHUNK bytes are pending
+OUTPUT_FLUSH_INTERVAL = 2
+OUTPUT_MAX_CHUNK = 64 * 1024
+
+
+def run_batched(command, workdir=None, flush_interval=OUTPUT_FLUSH_INTERVAL,
+                max_chunk=OUTPUT_MAX_CHUNK):
+    """
+    Run the shell command and copy its stdout and stderr to sys.stdout in
+    chunks, so that the task log is not appended by a few bytes at a time.
+    Return the exit code of the command.
+    """
+    print(f"COMMAND: {command}\n{'-' * min(len(command) + 9, 79)}")
+    sys.stdout.flush()
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='backslashreplace')
+    pending = []
+    pending_size = 0
+    last_flush = time.monotonic()
+
+    with subprocess.Popen(command, shell=True, cwd=workdir, stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT) as proc:
+        fd = proc.stdout.fileno()
+        while True:
+            timeout = max(0, last_flush + flush_interval - time.monotonic())
+            ready, _, _ = select.select([fd], [], [], timeout)
+            data = os.read(fd, max_chunk) if ready else None
+            if data == b'':
+                break
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+
+            now = time.monotonic()
+            if pending_size >= max_chunk or now - last_flush >= flush_interval:
+                if pending:
+                    sys.stdout.write(decoder.decode(b''.join(pending)))
+                    sys.stdout.flush()
+                    pending = []
+                    pending_size = 0
+                last_flush = now
+
+        sys.stdout.write(decoder.decode(b''.join(pending), final=True))
+        sys.stdout.flush()
+        return proc.wait()
+
 
 class CsmockRunner:
     """
     context manager class which executes csmock in current process
     """
 
-    def __init__(self, tmpdir=None, create_tmpdir=False):
+    def __init__(self, tmpdir=None, create_tmpdir=False, srpm_cache=None):
+        # osh.worker.srpm_cache.SrpmCache consulted before downloading SRPMs
+        self.srpm_cache = srpm_cache
         if create_tmpdir:
             self.tmpdir = tempfile.mkdtemp()
             self.our_temp_dir = True
@@ -49,6 +99,16 @@ class CsmockRunner:
         urllib.request.urlretrieve(source_url, target_path)
         return target_path
 
+    def cached_download(self, key, download):
+        """
+        obtain a file through the SRPM cache if it is enabled, see
+        SrpmCache.fetch() for the meaning of arguments
+        """
+        workdir = self.tmpdir or os.getcwd()
+        if self.srpm_cache is None:
+            return download(workdir)
+        return self.srpm_cache.fetch(key, workdir, download)
+
     def do(self, command, output_path=None, su_user=None, **kwargs):
         """ we are expecting that csmock will produce and output """
         if not command:
@@ -78,7 +138,7 @@ class CsmockRunner:
                     subprocess.check_call(['su', '-', su_user, '-c', shlex.quote(' '.join(inner_cmd2))])
             command = f'su - {shlex.quote(su_user)} --session-command {shlex.quote(command)}'
 
-        retcode, _ = run(command, stdout=True, can_fail=True, return_stdout=False, buffer_size=2, show_cmd=True, universal_newlines=True, errors="backslashreplace")
+        retcode = run_batched(command)
         if output_path:
             return output_path, retcode
 
@@ -163,7 +223,15 @@ class CsmockRunner:
                               su_user=None, additional_arguments=None, **kwargs):
         """ download srpm from remote location and analyze it"""
         logger.debug("additional args = %s, kwargs = %s", additional_arguments, kwargs)
-        srpm_path = self.download_file(srpm_url, srpm_name)
+
+        def download(workdir):
+            target_path = os.path.join(workdir, srpm_name)
+            urllib.request.urlretrieve(srpm_url, target_path)
+            return target_path
+
+        # uploads are served from the directory of the task, so they are never
+        # downloaded again from the same URL and would only fill the cache
+        srpm_path = download(self.tmpdir or os.getcwd())
         return self.analyze(analyzers, srpm_path, profile, su_user, additional_arguments, **kwargs)
 
     def dist_git_url_analyze(self, analyzers, dist_git_url, profile=None,
@@ -180,27 +248,31 @@ class CsmockRunner:
         if profile == "cspodman":
             return self.analyze(analyzers, nvr, profile, su_user, additional_arguments, result_filename=nvr, **kwargs)
 
-        download_cmd = f"koji -p {shlex.quote(koji_profile)} download-build --noprogress --arch=src {shlex.quote(nvr)}"
         try:
-            workdir = self.tmpdir or os.getcwd()
-            run(download_cmd, stdout=True, return_stdout=False, buffer_size=2,
-                show_cmd=True, universal_newlines=True, workdir=workdir,
-                errors="backslashreplace")
-            srpm_path = os.path.join(workdir, nvr + '.src.rpm')
+            srpm_path = self.cached_download(f'koji:{koji_profile}:{nvr}',
+                                             lambda workdir: self.koji_download(nvr, koji_profile, workdir))
         except RuntimeError as ex:
             print(ex, file=sys.stderr)
             return None, 2
 
+        return self.analyze(analyzers, srpm_path, profile, su_user, additional_arguments, result_filename=nvr, **kwargs)
+
+    def koji_download(self, nvr, koji_profile, workdir):
+        """ download SRPM of the build into workdir and return its path """
+        download_cmd = f"koji -p {shlex.quote(koji_profile)} download-build --noprogress --arch=src {shlex.quote(nvr)}"
+        if run_batched(download_cmd, workdir=workdir):
+            raise RuntimeError(f"Error running command: {download_cmd}")
+        srpm_path = os.path.join(workdir, nvr + '.src.rpm')
+
         if not os.path.exists(srpm_path):
             print("downloaded SRPM not found:", srpm_path, file=sys.stderr)
             # `brew win-build` creates build ID without .el8 but SRPM with .el8
-            srpm_files = glob.glob(os.path.join(self.tmpdir, '*.src.rpm'))
+            srpm_files = glob.glob(os.path.join(workdir, '*.src.rpm'))
             if len(srpm_files) == 1:
                 srpm_path = srpm_files[0]
 
         if not os.path.exists(srpm_path):
-            print("downloaded SRPM not found:", srpm_path, file=sys.stderr)
-            return None, 2
+            raise RuntimeError(f"downloaded SRPM not found: {srpm_path}")
 
         # check that we downloaded an RPM because koji/brew silently download
         # an HTML 404 page instead in case the build has been already deleted
@@ -208,10 +280,9 @@ class CsmockRunner:
         p = subprocess.Popen(check_cmd, stdout=subprocess.PIPE)
         mime_type, _ = p.communicate()
         if not re.match(b'^.*application/x-rpm$', mime_type):
-            print("unexpected MIME type:", mime_type, file=sys.stderr)
-            return None, 2
+            raise RuntimeError(f"unexpected MIME type: {mime_type}")
 
-        return self.analyze(analyzers, srpm_path, profile, su_user, additional_arguments, result_filename=nvr, **kwargs)
+        return srpm_path
 
     def no_scan(self, analyzers, profile=None, su_user=None, additional_arguments=None,
                 profile_url=None, **kwargs):
@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Chunked upload of task results to the hub
+
+Chunks are uploaded in parallel, each thread through its own connection to the
+hub.  Chunks which failed to upload are retried and, if the whole upload is
+interrupted, the next attempt uploads only the chunks the hub has not
+confirmed yet.
+"""
+
+import hashlib
+import http.client
+import logging
+import os
+import threading
+import time
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
+
+from kobo.client import HubProxy
+
+from osh.common.constants import UPLOAD_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# number of attempts to upload the chunks which have not been confirmed
+UPLOAD_ATTEMPTS = 5
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultsUploader:
+    def __init__(self, hub, conf, task_id, jobs=4, chunk_size=UPLOAD_CHUNK_SIZE):
+        """
+        hub -- HubProxy of the task
+        conf -- worker configuration used to open connections for other threads
+        """
+        self.hub = hub
+        self.conf = conf
+        self.task_id = task_id
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+
+    def _thread_hub(self):
+        if not hasattr(self._local, 'hub'):
+            self._local.hub = HubProxy(self.conf, client_type='worker')
+        return self._local.hub
+
+    def _upload_chunk(self, path, filename, index):
+        with open(path, 'rb') as f:
+            f.seek(index * self.chunk_size)
+            chunk = f.read(self.chunk_size)
+
+        checksum = hashlib.sha256(chunk).hexdigest()
+        return self._thread_hub().worker.upload_results_chunk(
+            self.task_id, filename, index, checksum, xmlrpc.client.Binary(chunk))
+
+    def upload(self, path):
+        """ upload the file at path into the task directory on the hub """
+        filename = os.path.basename(path)
+        size = os.path.getsize(path)
+        checksum = _sha256_file(path)
+        chunk_count = max(1, -(-size // self.chunk_size))
+        last_reported = -1
+
+        for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+            confirmed = self.hub.worker.start_results_upload(
+                self.task_id, filename, str(size), checksum, str(self.chunk_size))
+            missing = sorted(set(range(chunk_count)) - set(confirmed))
+            if confirmed:
+                print(f"Resuming upload of {filename}: {len(confirmed)}/{chunk_count} chunks already uploaded")
+
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [executor.submit(self._upload_chunk, path, filename, index)
+                           for index in missing]
+                for future in futures:
+                    try:
+                        percent = future.result()
+                    except (OSError, http.client.HTTPException, xmlrpc.client.Error) as ex:
+                        logger.warning('Chunk upload of %s failed: %s', filename, ex)
+                        continue
+
+                    # report progress to the task log on the hub
+                    if percent // 10 > last_reported // 10:
+                        print(f"Uploaded {percent}% of {filename}")
+                        last_reported = percent
+
+            try:
+                self.hub.worker.finish_results_upload(self.task_id, filename)
+                return
+            except xmlrpc.client.Fault as ex:
+                if attempt == UPLOAD_ATTEMPTS:
+                    raise
+                logger.warning('Upload of %s is not finished (attempt %d): %s',
+                               filename, attempt, ex.faultString)
+                time.sleep(attempt * 5)
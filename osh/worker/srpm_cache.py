@@ -0,0 +1,239 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
+
+"""
+Worker-local cache of downloaded SRPMs
+
+Layout of the cache directory:
+
+    objects/<sha256 of content>      cached files
+    keys/<sha256 of key>             "<sha256 of content> <file name>"
+    locks/<sha256 of key>            serializes downloads of the same key
+    tmp/                             downloads in progress
+    stats                            "<hits> <misses>"
+
+Files are moved into objects/ and keys/ by rename(), so other processes never
+see a partially written file.  Modification time of an object is updated on
+each hit and the least recently used objects are evicted once the total size
+exceeds the limit.  Keys of evicted objects are removed together with their
+locks.  A lock file is only removed by its holder, others re-open it if it
+was replaced meanwhile.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SHA256_RE = re.compile(r'[0-9a-f]{64}')
+
+# locks which are not bound to a key
+GLOBAL_LOCKS = ('stats', 'evict')
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class SrpmCache:
+    def __init__(self, path, max_size):
+        """
+        path -- cache directory
+        max_size -- maximum total size of cached files in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+        for subdir in ('objects', 'keys', 'locks', 'tmp'):
+            os.makedirs(os.path.join(path, subdir), exist_ok=True)
+
+    @classmethod
+    def from_conf(cls, conf):
+        """ return cache configured in worker.conf or None if it is disabled """
+        path = conf.get('SRPM_CACHE_DIR')
+        if not path:
+            return None
+        return cls(path, conf.get('SRPM_CACHE_SIZE', 10240) * 1024 * 1024)
+
+    def _acquire(self, name, blocking=True):
+        """ return the locked file or None if it is locked by another process """
+        path = os.path.join(self.path, 'locks', name)
+        while True:
+            f = open(path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return None
+
+            try:
+                if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            # removed by its previous holder
+            f.close()
+
+    @contextmanager
+    def _lock(self, name):
+        f = self._acquire(name)
+        try:
+            yield
+        finally:
+            f.close()
+
+    def _write_atomically(self, path, content):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.path, 'tmp'))
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _lookup(self, key_name):
+        """ return (object path, file name) of a cached key or None """
+        try:
+            with open(os.path.join(self.path, 'keys', key_name)) as f:
+                digest, filename = f.read().split(' ', 1)
+        except (OSError, ValueError):
+            return None
+        if not SHA256_RE.fullmatch(digest) or not filename or '/' in filename:
+            logger.warning('Ignoring corrupt SRPM cache entry %s', key_name)
+            return None
+
+        object_path = os.path.join(self.path, 'objects', digest)
+        try:
+            # mark as recently used
+            os.utime(object_path)
+        except OSError:
+            # evicted meanwhile
+            return None
+        return object_path, filename
+
+    def _record(self, hit):
+        """ update and log the hit rate """
+        stats_path = os.path.join(self.path, 'stats')
+        with self._lock('stats'):
+            try:
+                with open(stats_path) as f:
+                    hits, misses = map(int, f.read().split())
+            except (OSError, ValueError):
+                hits, misses = 0, 0
+
+            if hit:
+                hits += 1
+            else:
+                misses += 1
+            self._write_atomically(stats_path, f'{hits} {misses}')
+
+        logger.info('SRPM cache %s (hits: %d, misses: %d, hit rate: %.1f%%)',
+                    'hit' if hit else 'miss', hits, misses, 100 * hits / (hits + misses))
+
+    def _evict(self):
+        objects_dir = os.path.join(self.path, 'objects')
+        objects = []
+        for entry in os.scandir(objects_dir):
+            stat = entry.stat()
+            objects.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in objects)
+        for _, size, path in sorted(objects):
+            if total <= self.max_size:
+                break
+            logger.info('Evicting %s from SRPM cache', path)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        self._remove_dangling_keys()
+
+    def _remove_dangling_keys(self):
+        """ remove keys of evicted objects and locks without keys """
+        for entry in os.scandir(os.path.join(self.path, 'locks')):
+            key_name = entry.name
+            if key_name in GLOBAL_LOCKS or self._is_cached(key_name):
+                continue
+
+            # skip keys being fetched right now
+            f = self._acquire(key_name, blocking=False)
+            if f is None:
+                continue
+            try:
+                if self._is_cached(key_name):
+                    # cached meanwhile
+                    continue
+                for subdir in ('keys', 'locks'):
+                    try:
+                        os.unlink(os.path.join(self.path, subdir, key_name))
+                    except FileNotFoundError:
+                        pass
+            finally:
+                f.close()
+
+    def _is_cached(self, key_name):
+        """ return True if the key refers to a cached object """
+        try:
+            with open(os.path.join(self.path, 'keys', key_name)) as f:
+                digest = f.read().split(' ', 1)[0]
+        except OSError:
+            return False
+        return bool(SHA256_RE.fullmatch(digest)) \
+            and os.path.exists(os.path.join(self.path, 'objects', digest))
+
+    def fetch(self, key, target_dir, download):
+        """
+        Place a file identified by key into target_dir and return its path.
+
+        download -- function downloading the file into the directory given as
+                    its argument and returning path of the downloaded file.  It
+                    is only called on a cache miss and may raise RuntimeError.
+        """
+        key_name = hashlib.sha256(key.encode()).hexdigest()
+        with self._lock(key_name):
+            cached = self._lookup(key_name)
+            if cached is not None:
+                object_path, filename = cached
+                target_path = os.path.join(target_dir, filename)
+                try:
+                    _link_or_copy(object_path, target_path)
+                    self._record(hit=True)
+                    return target_path
+                except FileNotFoundError:
+                    # evicted by another task meanwhile
+                    pass
+
+            self._record(hit=False)
+            download_dir = tempfile.mkdtemp(dir=os.path.join(self.path, 'tmp'))
+            try:
+                downloaded = download(download_dir)
+                filename = os.path.basename(downloaded)
+                digest = _sha256_file(downloaded)
+                os.replace(downloaded, os.path.join(self.path, 'objects', digest))
+            finally:
+                shutil.rmtree(download_dir, ignore_errors=True)
+
+            self._write_atomically(os.path.join(self.path, 'keys', key_name),
+                                   f'{digest} {filename}')
+
+            target_path = os.path.join(target_dir, filename)
+            _link_or_copy(os.path.join(self.path, 'objects', digest), target_path)
+
+        with self._lock('evict'):
+            self._evict()
+        return target_path
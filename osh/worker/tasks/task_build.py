@@ -1,14 +1,26 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-FileCopyrightText: Copyright contributors to the OpenScanHub project.
 
+import glob
 import os
 import platform
+import subprocess
 import sys
+import tempfile
+import urllib.request
+import xmlrpc.client
+from contextlib import contextmanager
 from urllib.parse import urljoin
 
 from kobo.worker import TaskBase
 
+from osh.common.constants import (BASE_SCAN_SEPARATE_WORKERS,
+                                  BASE_SCAN_SEQUENTIAL, SCAN_RESULTS_FILENAME,
+                                  WORKER_DIFF_DIR)
+from osh.common.diff import DIFF_FILES, generate_diff_files, write_diff_stats
 from osh.worker.csmock_runner import CsmockRunner
+from osh.worker.results_upload import ResultsUploader
+from osh.worker.srpm_cache import SrpmCache
 
 
 class OSHTaskBase(TaskBase):
@@ -35,6 +47,30 @@ class OSHTaskBase(TaskBase):
     # determines how many resources is used when processing the task
     weight = 1.0
 
+    def spawn_base_subtask(self, base_task_args):
+        """
+        Spawn scan of the base.  Return ID of the subtask and whether the hub
+        lets it run concurrently with the scan of the target.
+        """
+        mode = self.hub.worker.get_base_scan_mode()
+        inherit_worker = mode != BASE_SCAN_SEPARATE_WORKERS
+        subtask_id = self.spawn_subtask(*base_task_args, inherit_worker=inherit_worker)
+        return subtask_id, mode != BASE_SCAN_SEQUENTIAL
+
+    @contextmanager
+    def concurrent_base_scan(self, concurrent):
+        """
+        Cancel the base scan running concurrently if the task does not get to
+        waiting for it, so that the base scan is not left behind.
+        """
+        try:
+            yield
+        except BaseException:
+            if concurrent:
+                print("Cancelling scan of the base", file=sys.stderr)
+                self.hub.worker.cancel_subtasks(self.task_id)
+            raise
+
 
 class Build(OSHTaskBase):
     def run(self):
@@ -52,21 +88,24 @@ class Build(OSHTaskBase):
         result_filename = self.args.pop("result_filename", None)
 
         # scan base
+        base_task_id, concurrent = None, False
         if base_task_args:
-            self.spawn_subtask(*base_task_args, inherit_worker=True)
-            self.wait()
-
-        # download custom mock config from the hub
-        mock_config_url = None
-        if mock_config == 'auto':
-            self.hub.worker.create_mock_configs(self.task_id)
-            arch = platform.uname().machine
-            mock_config_url = urljoin(task_url, f'log/mock/mock-{arch}.cfg?format=raw')
-
-        if upload_id:
-            self.hub.worker.move_upload(self.task_id, upload_id)
+            base_task_id, concurrent = self.spawn_base_subtask(base_task_args)
+            if not concurrent:
+                self.wait()
+
+        with self.concurrent_base_scan(concurrent), \
+                CsmockRunner(srpm_cache=SrpmCache.from_conf(self.conf)) as runner:
+            # download custom mock config from the hub
+            mock_config_url = None
+            if mock_config == 'auto':
+                self.hub.worker.create_mock_configs(self.task_id)
+                arch = platform.uname().machine
+                mock_config_url = urljoin(task_url, f'log/mock/mock-{arch}.cfg?format=raw')
+
+            if upload_id:
+                self.hub.worker.move_upload(self.task_id, upload_id)
 
-        with CsmockRunner() as runner:
             if custom_model_name:
                 model_url = urljoin(task_url, f'log/{custom_model_name}?format=raw')
                 model_path = runner.download_file(model_url, custom_model_name)
@@ -109,13 +148,20 @@ class Build(OSHTaskBase):
                 self.fail()
 
             try:
-                base_results = os.path.basename(results)
-                with open(results, "rb") as f:
-                    self.hub.upload_task_log(f, self.task_id, base_results)
-            except OSError as e:
-                print("Reading task logs failed:", e, file=sys.stderr)
+                uploader = ResultsUploader(self.hub, self.conf, self.task_id,
+                                           jobs=self.conf.get('RESULTS_UPLOAD_JOBS', 4))
+                uploader.upload(results)
+            except (OSError, xmlrpc.client.Error) as e:
+                print("Uploading task results failed:", e, file=sys.stderr)
                 self.fail()
 
+            if concurrent:
+                # the base is scanned concurrently, wait for it before finishing
+                self.wait()
+
+            if base_task_id is not None and self.conf.get('DIFF_ON_WORKER'):
+                self.upload_diff(runner, results, base_task_id)
+
         # first finish task, then fail if needed, so tarball gets unpacked
         self.hub.worker.finish_task(self.task_id)
         if retcode > 0:
@@ -123,6 +169,35 @@ class Build(OSHTaskBase):
                   file=sys.stderr)
             self.fail()
 
+    def upload_diff(self, runner, results, base_task_id):
+        """
+        Diff results against the base scan and upload the diff, so that the
+        hub only validates it.  If anything goes wrong, the hub diffs the
+        results itself.
+        """
+        workdir = tempfile.mkdtemp(dir=runner.tmpdir)
+        try:
+            subprocess.check_call(['tar', '-xf', results, '-C', workdir, '--wildcards',
+                                   '--no-anchored', SCAN_RESULTS_FILENAME])
+            target_json = glob.glob(os.path.join(workdir, '*', SCAN_RESULTS_FILENAME))[0]
+
+            base_path = self.hub.worker.get_json_results_path(base_task_id)
+            base_url = urljoin(self.hub.client.task_url(base_task_id), f'log/{base_path}?format=raw')
+            base_json = os.path.join(workdir, 'base-' + SCAN_RESULTS_FILENAME)
+            urllib.request.urlretrieve(base_url, base_json)
+
+            if not generate_diff_files(base_json, target_json, workdir):
+                raise RuntimeError('csdiff failed')
+            write_diff_stats(base_json, target_json, workdir)
+
+            for name in DIFF_FILES:
+                with open(os.path.join(workdir, name), 'rb') as f:
+                    self.hub.upload_task_log(f, self.task_id, os.path.join(WORKER_DIFF_DIR, name),
+                                             append=False)
+        except (IndexError, OSError, RuntimeError, ValueError, subprocess.CalledProcessError,
+                xmlrpc.client.Error) as e:
+            print("Diffing results on worker failed, the hub will diff them:", e, file=sys.stderr)
+
     @classmethod
     def notification(cls, hub, conf, task_info):
         hub.worker.email_task_notification(task_info["id"])
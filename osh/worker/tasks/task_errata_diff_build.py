@@ -4,9 +4,12 @@
 import os
 import platform
 import sys
+import xmlrpc.client
 from urllib.parse import urljoin
 
 from osh.worker.csmock_runner import CsmockRunner
+from osh.worker.results_upload import ResultsUploader
+from osh.worker.srpm_cache import SrpmCache
 from osh.worker.tasks.task_build import OSHTaskBase
 
 
@@ -40,43 +43,52 @@ class ErrataDiffBuild(OSHTaskBase):
                 self.spawn_subtask(*cache_task_args, inherit_worker=True)
                 self.wait()
 
+        scanning_args = self.hub.worker.get_scanning_args(profile)
+        add_args = scanning_args.get('csmock_args', '')
+        koji_profile = scanning_args.get('koji_profile', 'koji')
+
         # (re)scan base if needed
         base_task_args = self.hub.worker.ensure_base_is_scanned_properly(scan_id, self.task_id)
         if base_task_args is not None:
             self.hub.worker.set_scan_to_basescanning(scan_id)
 
-            subtask_id = self.spawn_subtask(*base_task_args, inherit_worker=True)
-            self.hub.worker.create_sb(subtask_id)
-
-            self.wait()
+            base_task_id, concurrent = self.spawn_base_subtask(base_task_args)
+            self.hub.worker.create_sb(base_task_id)
+            if not concurrent:
+                self.wait()
+            # the target is scanned from now on, even if the base is still scanned
             self.hub.worker.set_scan_to_scanning(scan_id)
-
-        scanning_args = self.hub.worker.get_scanning_args(profile)
-        add_args = scanning_args.get('csmock_args', '')
-        koji_profile = scanning_args.get('koji_profile', 'koji')
-
-        with CsmockRunner() as runner:
-            results, retcode = runner.koji_analyze(scanning_args['analyzers'],
-                                                   build,
-                                                   profile=mock_config,
-                                                   profile_url=mock_config_url,
-                                                   additional_arguments=add_args,
-                                                   koji_profile=koji_profile,
-                                                   su_user=su_user)
-            print('Retcode:', retcode)
-            if results is None:
-                print("Task did not produce any results", file=sys.stderr)
-                self.hub.worker.fail_scan(scan_id, 'Empty task results')
-                self.fail()
-
-            try:
-                base_results = os.path.basename(results)
-                with open(results, 'rb') as f:
-                    self.hub.upload_task_log(f, self.task_id, base_results)
-            except OSError as e:
-                print("Reading task logs failed:", e, file=sys.stderr)
-                self.hub.worker.fail_scan(scan_id, f'Reading tak logs failed: {e}')
-                self.fail()
+        else:
+            concurrent = False
+
+        with self.concurrent_base_scan(concurrent):
+            with CsmockRunner(srpm_cache=SrpmCache.from_conf(self.conf)) as runner:
+                results, retcode = runner.koji_analyze(scanning_args['analyzers'],
+                                                       build,
+                                                       profile=mock_config,
+                                                       profile_url=mock_config_url,
+                                                       additional_arguments=add_args,
+                                                       koji_profile=koji_profile,
+                                                       su_user=su_user)
+                print('Retcode:', retcode)
+                if results is None:
+                    print("Task did not produce any results", file=sys.stderr)
+                    self.hub.worker.fail_scan(scan_id, 'Empty task results')
+                    self.fail()
+
+                try:
+                    base_results = os.path.basename(results)
+                    uploader = ResultsUploader(self.hub, self.conf, self.task_id,
+                                               jobs=self.conf.get('RESULTS_UPLOAD_JOBS', 4))
+                    uploader.upload(results)
+                except (OSError, xmlrpc.client.Error) as e:
+                    print("Uploading task results failed:", e, file=sys.stderr)
+                    self.hub.worker.fail_scan(scan_id, f'Uploading task results failed: {e}')
+                    self.fail()
+
+            if concurrent:
+                # the base is scanned concurrently, wait for it before finishing
+                self.wait()
 
         if retcode > 0:
             print(f"Scanning has not completed successfully ({retcode})",
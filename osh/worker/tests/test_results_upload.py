@@ -0,0 +1,46 @@
+import http.client
+import os
+import tempfile
+import unittest
+import xmlrpc.client
+from unittest.mock import MagicMock, patch
+
+from osh.worker.results_upload import ResultsUploader
+
+
+class TestResultsUploader(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'units-results.tar.xz')
+        with open(self.path, 'wb') as f:
+            f.write(b'results' * 10)
+
+        self.hub = MagicMock()
+        self.confirmed = set()
+        self.failures = [http.client.IncompleteRead(b'')]
+        self.hub.worker.start_results_upload.side_effect = lambda *args: sorted(self.confirmed)
+        self.hub.worker.upload_results_chunk.side_effect = self.upload_chunk
+        self.hub.worker.finish_results_upload.side_effect = self.finish
+
+        self.uploader = ResultsUploader(self.hub, {}, 1, jobs=1, chunk_size=16)
+        self.uploader._thread_hub = lambda: self.hub
+
+    def upload_chunk(self, task_id, filename, index, checksum, chunk):
+        if self.failures:
+            raise self.failures.pop()
+        self.confirmed.add(index)
+        return len(self.confirmed) * 100 // 5
+
+    def finish(self, task_id, filename):
+        if len(self.confirmed) < 5:
+            raise xmlrpc.client.Fault(1, 'missing chunks')
+        return True
+
+    @patch('time.sleep')
+    def test_failed_chunk_is_retried(self, sleep):
+        self.uploader.upload(self.path)
+        self.assertEqual(self.confirmed, {0, 1, 2, 3, 4})
+        self.assertEqual(self.hub.worker.start_results_upload.call_count, 2)
+        # only the failed chunk is uploaded again
+        self.assertEqual(self.hub.worker.upload_results_chunk.call_count, 6)
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from osh.worker.srpm_cache import SrpmCache
+
+
+class TestSrpmCache(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.cache = SrpmCache(os.path.join(tmp_dir.name, 'cache'), 350)
+        self.downloads = []
+
+    def downloader(self, name, content, delay=0):
+        def download(download_dir):
+            self.downloads.append(name)
+            time.sleep(delay)
+            path = os.path.join(download_dir, name)
+            with open(path, 'wb') as f:
+                f.write(content)
+            return path
+        return download
+
+    def fetch(self, name, content=None, delay=0):
+        content = content or name.encode() * 10
+        # each task has a working directory of its own
+        workdir = tempfile.mkdtemp(dir=self.tmp_dir)
+        return self.cache.fetch(f'koji:koji:{name}', workdir,
+                                self.downloader(name, content, delay))
+
+    def object_path(self, name):
+        digest = hashlib.sha256(name.encode() * 10).hexdigest()
+        return os.path.join(self.cache.path, 'objects', digest)
+
+    def test_hit(self):
+        self.fetch('units-2.22-5.el9.src.rpm')
+        path = self.fetch('units-2.22-5.el9.src.rpm')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'units-2.22-5.el9.src.rpm' * 10)
+        self.assertEqual(self.downloads, ['units-2.22-5.el9.src.rpm'])
+
+    def test_lru_eviction(self):
+        # each file has 150 bytes, only two of them fit into the cache
+        self.fetch('a-1.0-1.src.rpm')
+        self.fetch('b-1.0-1.src.rpm')
+        os.utime(self.object_path('a-1.0-1.src.rpm'), (100, 100))
+        os.utime(self.object_path('b-1.0-1.src.rpm'), (200, 200))
+
+        # the hit makes 'a' the most recently used one
+        self.fetch('a-1.0-1.src.rpm')
+        self.fetch('c-1.0-1.src.rpm')
+        self.assertFalse(os.path.exists(self.object_path('b-1.0-1.src.rpm')))
+        self.assertEqual(len(os.listdir(os.path.join(self.cache.path, 'keys'))), 2)
+        # the key of 'b' is removed together with its lock
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cache.path, 'locks'))),
+                         sorted(os.listdir(os.path.join(self.cache.path, 'keys')) + ['evict', 'stats']))
+
+        self.fetch('a-1.0-1.src.rpm')
+        self.fetch('b-1.0-1.src.rpm')
+        self.assertEqual(self.downloads, ['a-1.0-1.src.rpm', 'b-1.0-1.src.rpm',
+                                          'c-1.0-1.src.rpm', 'b-1.0-1.src.rpm'])
+
+    def test_concurrent_fetch(self):
+        paths = []
+
+        def fetch():
+            paths.append(self.fetch('units-2.22-5.el9.src.rpm', delay=0.2))
+
+        threads = [threading.Thread(target=fetch) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.downloads, ['units-2.22-5.el9.src.rpm'])
+        self.assertEqual(len(paths), 3)
+        for path in paths:
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'units-2.22-5.el9.src.rpm' * 10)
+
+    def test_corrupt_entry(self):
+        self.fetch('units-2.22-5.el9.src.rpm')
+        for name in os.listdir(os.path.join(self.cache.path, 'keys')):
+            with open(os.path.join(self.cache.path, 'keys', name), 'w') as f:
+                f.write('../../etc/passwd passwd')
+
+        path = self.fetch('units-2.22-5.el9.src.rpm')
+        self.assertEqual(os.path.basename(path), 'units-2.22-5.el9.src.rpm')
+        self.assertEqual(len(self.downloads), 2)
+
+    def test_failed_download(self):
+        def download(download_dir):
+            raise RuntimeError('no such build')
+
+        with self.assertRaises(RuntimeError):
+            self.cache.fetch('koji:koji:foo-1.0-1', self.tmp_dir, download)
+        self.assertEqual(os.listdir(os.path.join(self.cache.path, 'objects')), [])
+        self.assertEqual(os.listdir(os.path.join(self.cache.path, 'tmp')), [])
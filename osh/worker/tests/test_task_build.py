@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from kobo.worker.task import FailTaskException
+
+from osh.common.constants import (BASE_SCAN_SAME_WORKER,
+                                  BASE_SCAN_SEPARATE_WORKERS,
+                                  BASE_SCAN_SEQUENTIAL)
+from osh.worker.tasks.task_build import VersionDiffBuild
+from osh.worker.tasks.task_errata_diff_build import ErrataDiffBuild
+
+BASE_TASK_ARGS = ['VersionDiffBuild', {'build': {'nvr': 'units-2.21-5.el9'}}]
+
+
+class TaskTestBase:
+    def create_task(self, cls, args, mode=BASE_SCAN_SAME_WORKER):
+        self.hub = MagicMock()
+        self.hub.worker.get_base_scan_mode.return_value = mode
+        self.hub.worker.create_subtask.return_value = 2
+        task = cls(self.hub, {}, 1, args)
+        task.wait = MagicMock()
+        return task
+
+
+@patch('osh.worker.tasks.task_build.CsmockRunner')
+class TestBuild(TaskTestBase, unittest.TestCase):
+    ARGS = {
+        'mock_config': 'fedora-rawhide-x86_64',
+        'build': {'nvr': 'units-2.22-5.el9', 'koji_profile': 'koji'},
+        'analyzers': 'gcc',
+        'base_task_args': BASE_TASK_ARGS,
+    }
+
+    def run_task(self, mode):
+        self.task = self.create_task(VersionDiffBuild, dict(self.ARGS), mode)
+        with patch('osh.worker.tasks.task_build.ResultsUploader'):
+            self.task.run()
+
+    def test_spawn_base_subtask(self, runner):
+        for mode, inherit_worker, concurrent in (
+                (BASE_SCAN_SEQUENTIAL, True, False),
+                (BASE_SCAN_SAME_WORKER, True, True),
+                (BASE_SCAN_SEPARATE_WORKERS, False, True)):
+            task = self.create_task(VersionDiffBuild, {}, mode)
+            self.assertEqual(task.spawn_base_subtask(BASE_TASK_ARGS), (2, concurrent))
+            self.assertEqual(self.hub.worker.create_subtask.call_args[0][-1], inherit_worker)
+
+    def test_sequential(self, runner):
+        analyze = runner.return_value.__enter__.return_value.koji_analyze
+        analyze.side_effect = lambda *args, **kwargs: self.task.wait.assert_called_once() or ('r.tar.xz', 0)
+        self.run_task(BASE_SCAN_SEQUENTIAL)
+        self.hub.worker.finish_task.assert_called_once_with(1)
+
+    def test_concurrent(self, runner):
+        analyze = runner.return_value.__enter__.return_value.koji_analyze
+        analyze.side_effect = lambda *args, **kwargs: self.task.wait.assert_not_called() or ('r.tar.xz', 0)
+        self.run_task(BASE_SCAN_SAME_WORKER)
+        self.task.wait.assert_called_once()
+        self.hub.worker.cancel_subtasks.assert_not_called()
+
+    def test_failed_target_cancels_base(self, runner):
+        runner.return_value.__enter__.return_value.koji_analyze.return_value = (None, 2)
+        with self.assertRaises(FailTaskException):
+            self.run_task(BASE_SCAN_SAME_WORKER)
+        self.task.wait.assert_not_called()
+        self.hub.worker.cancel_subtasks.assert_called_once_with(1)
+        self.hub.worker.finish_task.assert_not_called()
+
+
+@patch('osh.worker.tasks.task_errata_diff_build.CsmockRunner')
+class TestErrataDiffBuild(TaskTestBase, unittest.TestCase):
+    ARGS = {
+        'scan_id': 10,
+        'mock_config': 'fedora-rawhide-x86_64',
+        'profile': 'default',
+        'build': 'units-2.22-5.el9',
+    }
+
+    def create_errata_task(self):
+        task = self.create_task(ErrataDiffBuild, dict(self.ARGS))
+        self.hub.worker.ensure_cache.return_value = None
+        self.hub.worker.ensure_base_is_scanned_properly.return_value = BASE_TASK_ARGS
+        self.hub.worker.get_scanning_args.return_value = {'analyzers': 'gcc'}
+        return task
+
+    def test_concurrent(self, runner):
+        task = self.create_errata_task()
+
+        def analyze(*args, **kwargs):
+            # the target is scanned while the base is still scanned
+            self.hub.worker.set_scan_to_scanning.assert_called_with(10)
+            task.wait.assert_not_called()
+            return 'r.tar.xz', 0
+
+        runner.return_value.__enter__.return_value.koji_analyze.side_effect = analyze
+        with patch('osh.worker.tasks.task_errata_diff_build.ResultsUploader'):
+            task.run()
+        task.wait.assert_called_once()
+        self.hub.worker.finish_scan.assert_called_once_with(10, 'r.tar.xz')
+
+    def test_failed_upload_cancels_base(self, runner):
+        task = self.create_errata_task()
+        runner.return_value.__enter__.return_value.koji_analyze.return_value = ('r.tar.xz', 0)
+        with patch('osh.worker.tasks.task_errata_diff_build.ResultsUploader') as uploader:
+            uploader.return_value.upload.side_effect = OSError('Connection refused')
+            with self.assertRaises(FailTaskException):
+                task.run()
+        self.hub.worker.cancel_subtasks.assert_called_once_with(1)
+        self.hub.worker.fail_scan.assert_called_once()
@@ -19,10 +19,14 @@ data_files = {
         "osh/worker/worker.conf",
     ],
     "/usr/lib/systemd/system": [
+        "osh/hub/osh-mail-sender.service",
+        "osh/hub/osh-refresh-analyzer-versions.service",
+        "osh/hub/osh-refresh-analyzer-versions.timer",
         "osh/hub/osh-retention.service",
         "osh/hub/osh-retention.timer",
         "osh/hub/osh-stats.service",
         "osh/hub/osh-stats.timer",
+        "osh/hub/osh-umb-publisher.service",
         "osh/worker/osh-worker.service",
     ],
     "/usr/share/bash-completion/completions": [
@@ -36,8 +40,11 @@ data_files = {
         "osh/hub/scripts/osh-worker-manager",
     ],
     "/usr/sbin": [
+        "osh/hub/scripts/osh-mail-sender",
+        "osh/hub/scripts/osh-refresh-analyzer-versions",
         "osh/hub/scripts/osh-retention",
         "osh/hub/scripts/osh-stats",
+        "osh/hub/scripts/osh-umb-publisher",
         "osh/worker/osh-worker",
     ],
 }